@@ -0,0 +1,369 @@
+"""
+Asset Optimizer for LiquidBooks
+
+Optional post-build stage that shrinks a built site (`_build/html`) in place:
+
+- Minifies HTML (comments and indentation; <pre>, <script>, <style> and
+  <textarea> are left untouched), CSS (rcssmin) and JavaScript (rjsmin).
+  Files that are already minified (*.min.css, *.min.js) are kept as they are.
+- Gives every `_static` asset a content-hashed copy (`theme.<hash>.css`) and
+  points the pages' and stylesheets' references at it, so those URLs can be
+  cached forever. The original files stay in place for anything that loads
+  them by name at runtime.
+- Writes `.gz` and `.br` siblings of text files for servers that serve
+  precompressed files (nginx gzip_static/brotli_static, Caddy precompressed).
+
+rcssmin, rjsmin and brotli are optional: without them CSS/JS are not minified
+and no `.br` files are written. Files are processed in parallel worker
+processes. The stage is idempotent - running it again over its own output,
+or over an incremental rebuild, gives the same result - and it reuses
+compressed siblings whose content did not change.
+"""
+
+import gzip
+import hashlib
+import importlib.util
+import json
+import os
+import posixpath
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from book_builder import resolve_jobs
+from zip_stream import list_files
+
+
+# Worker processes ("auto" = one per CPU)
+OPTIMIZE_JOBS = os.getenv("OPTIMIZE_JOBS", "auto")
+
+# Brotli quality for .br siblings (0-11; 11 is ~8% smaller but over 10x slower)
+BROTLI_QUALITY = int(os.getenv("OPTIMIZE_BROTLI_QUALITY", "9"))
+
+# Written next to the site: generated files and content hashes of the last run
+OPTIMIZE_MANIFEST = ".liquidbooks-optimized.json"
+
+STATIC_DIR = "_static"
+
+HASH_LENGTH = 10
+
+# Files worth precompressing, and the smallest size worth it
+COMPRESSIBLE_SUFFIXES = {
+    ".html", ".htm", ".css", ".js", ".mjs", ".json", ".map", ".svg",
+    ".xml", ".txt", ".ipynb", ".md", ".ttf", ".eot", ".otf", ".ico",
+}
+PRECOMPRESS_MIN_BYTES = 1024
+
+# Names of content-hashed copies, e.g. theme.0123456789.css (and their .gz/.br)
+HASHED_NAME = re.compile(r"\.[0-9a-f]{%d}\.[A-Za-z0-9]+(\.(gz|br))?$" % HASH_LENGTH)
+
+_HTML_PRESERVE = re.compile(r"<(pre|textarea|script|style)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_HTML_COMMENT = re.compile(r"<!--(?!\s*\[if|\s*<!\[endif).*?-->", re.DOTALL)
+_HTML_LINE_BREAK = re.compile(r"[ \t\r\f]*\n\s*")
+_HTML_REFERENCE = re.compile(r"""((?:href|src)\s*=\s*)(["'])([^"']+)\2""", re.IGNORECASE)
+_CSS_REFERENCE = re.compile(r"""(url\(\s*|@import\s+)(["']?)([^"')\s]+)\2""", re.IGNORECASE)
+_URL_SCHEME = re.compile(r"[A-Za-z][A-Za-z0-9+.-]*:|//")
+_URL_PARTS = re.compile(r"([^?#]*)(.*)", re.DOTALL)
+
+
+def available_minifiers() -> Dict[str, bool]:
+    """Which optional minifiers/compressors are installed"""
+    return {name: importlib.util.find_spec(name) is not None for name in ("rcssmin", "rjsmin", "brotli")}
+
+
+def is_hashed_name(relpath: str) -> bool:
+    """Whether a path is a content-hashed copy written by this stage"""
+    return bool(HASHED_NAME.search(relpath))
+
+
+def hashed_name(relpath: str, data: bytes) -> str:
+    """Content-hashed name of an asset: dir/name.<hash>.ext"""
+    root, ext = posixpath.splitext(relpath)
+    return f"{root}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext}"
+
+
+def minify_html(text: str) -> str:
+    """Drop comments and collapse line breaks and indentation outside <pre>, <script>, <style>, <textarea>"""
+    parts = []
+    position = 0
+    for match in _HTML_PRESERVE.finditer(text):
+        parts.append(_minify_html_text(text[position:match.start()]))
+        parts.append(match.group(0))
+        position = match.end()
+    parts.append(_minify_html_text(text[position:]))
+    return "".join(parts).strip() + "\n"
+
+
+def _minify_html_text(text: str) -> str:
+    # A line break is kept (not a space) so inline whitespace keeps its meaning
+    return _HTML_LINE_BREAK.sub("\n", _HTML_COMMENT.sub("", text))
+
+
+def _minify(relpath: str, data: bytes) -> bytes:
+    name = posixpath.basename(relpath)
+    suffix = posixpath.splitext(name)[1].lower()
+    if name.endswith((".min.css", ".min.js")):
+        return data
+    if suffix in (".html", ".htm"):
+        return minify_html(data.decode("utf-8")).encode("utf-8")
+    if suffix == ".css" and importlib.util.find_spec("rcssmin") is not None:
+        import rcssmin
+        return rcssmin.cssmin(data.decode("utf-8"), keep_bang_comments=True).encode("utf-8")
+    if suffix in (".js", ".mjs") and importlib.util.find_spec("rjsmin") is not None:
+        import rjsmin
+        return rjsmin.jsmin(data.decode("utf-8"), keep_bang_comments=True).encode("utf-8")
+    return data
+
+
+def _rewrite_reference(url: str, base_dir: str, hashes: Dict[str, str], aliases: Dict[str, str]) -> str:
+    """A reference to a hashed asset, or the reference unchanged"""
+    if url.startswith(("#", "/")) or _URL_SCHEME.match(url):
+        return url
+    path, tail = _URL_PARTS.match(url).groups()
+    target = posixpath.normpath(posixpath.join(base_dir, path))
+    # Pages left alone by an incremental rebuild still name last run's copies
+    target = aliases.get(target, target)
+    if target not in hashes:
+        return url
+    # The hashed copy sits next to the original, so only the file name changes;
+    # the name carries the version, so cache-busting queries are dropped
+    new_path = posixpath.join(posixpath.dirname(path), posixpath.basename(hashes[target]))
+    return new_path + (tail[tail.index("#"):] if "#" in tail else "")
+
+
+def _rewrite_references(relpath: str, text: str, hashes: Dict[str, str], aliases: Dict[str, str]) -> str:
+    base_dir = posixpath.dirname(relpath)
+    pattern = _CSS_REFERENCE if relpath.lower().endswith(".css") else _HTML_REFERENCE
+
+    def replace(match: "re.Match") -> str:
+        prefix, quote, url = match.groups()
+        return f"{prefix}{quote}{_rewrite_reference(url, base_dir, hashes, aliases)}{quote}"
+
+    return pattern.sub(replace, text)
+
+
+def _write_if_changed(path: Path, data: bytes) -> bool:
+    try:
+        if path.stat().st_size == len(data) and path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+    temp_path = path.with_name(path.name + ".tmp")
+    temp_path.write_bytes(data)
+    os.replace(temp_path, path)
+    return True
+
+
+def _link(source: Path, target: Path):
+    """Make target a hard link to source (a copy where links are not supported)"""
+    if target.exists() and os.path.samefile(source, target):
+        return
+    temp_path = target.with_name(target.name + ".tmp")
+    temp_path.unlink(missing_ok=True)
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        temp_path.write_bytes(source.read_bytes())
+    os.replace(temp_path, target)
+
+
+def _precompress(path: Path, data: bytes, reuse: bool) -> Dict[str, Optional[int]]:
+    """Write .gz/.br siblings smaller than the file; sizes by encoding"""
+    sizes: Dict[str, Optional[int]] = {"gzip": None, "brotli": None}
+    if path.suffix.lower() not in COMPRESSIBLE_SUFFIXES or len(data) < PRECOMPRESS_MIN_BYTES:
+        return sizes
+
+    encoders = [("gzip", ".gz", lambda raw: gzip.compress(raw, compresslevel=9, mtime=0))]
+    if importlib.util.find_spec("brotli") is not None:
+        import brotli
+        encoders.append(("brotli", ".br", lambda raw: brotli.compress(raw, quality=BROTLI_QUALITY)))
+
+    for encoding, suffix, compress in encoders:
+        sibling = path.with_name(path.name + suffix)
+        if reuse and sibling.exists():
+            sizes[encoding] = sibling.stat().st_size
+            continue
+        compressed = compress(data)
+        if len(compressed) < len(data):
+            _write_if_changed(sibling, compressed)
+            sizes[encoding] = len(compressed)
+        else:
+            sibling.unlink(missing_ok=True)
+    return sizes
+
+
+def _optimize_file(task: Tuple[str, str, bool, Dict[str, str], Dict[str, str], Dict[str, str]]) -> Dict[str, Any]:
+    """Optimize one file; runs in a worker process"""
+    site_dir, relpath, fingerprint, hashes, aliases, previous = task
+    path = Path(site_dir) / relpath
+    original = path.read_bytes()
+
+    data = original
+    if relpath.lower().endswith((".html", ".htm", ".css")):
+        try:
+            data = _rewrite_references(relpath, data.decode("utf-8"), hashes, aliases).encode("utf-8")
+        except UnicodeDecodeError:
+            pass
+    # Content this stage wrote last time is left alone (minifiers are not all idempotent)
+    if hashlib.sha256(data).hexdigest() != previous.get(relpath):
+        try:
+            data = _minify(relpath, data)
+        except (UnicodeDecodeError, ValueError):
+            pass
+    _write_if_changed(path, data)
+
+    digest = hashlib.sha256(data).hexdigest()
+    # Siblings written for exactly this content last time are still valid
+    reuse = previous.get(relpath) == digest
+    generated = []
+    sizes = _precompress(path, data, reuse)
+    generated += [relpath + suffix for encoding, suffix in (("gzip", ".gz"), ("brotli", ".br")) if sizes[encoding]]
+
+    hashed = None
+    if fingerprint:
+        hashed = hashed_name(relpath, data)
+        hashed_path = Path(site_dir) / hashed
+        _link(path, hashed_path)
+        generated.append(hashed)
+        for suffix in (".gz", ".br"):
+            if relpath + suffix in generated:
+                _link(path.with_name(path.name + suffix), hashed_path.with_name(hashed_path.name + suffix))
+                generated.append(hashed + suffix)
+
+    return {
+        "relpath": relpath,
+        "sha256": digest,
+        "hashed": hashed,
+        "generated": generated,
+        "bytes_before": len(original),
+        "bytes_after": len(data),
+        "gzip_bytes": sizes["gzip"],
+        "brotli_bytes": sizes["brotli"],
+    }
+
+
+def _css_dependencies(site_dir: Path, relpath: str, stylesheets: set) -> set:
+    """Stylesheets a stylesheet imports or references"""
+    try:
+        text = (site_dir / relpath).read_text(encoding="utf-8")
+    except (OSError, UnicodeDecodeError):
+        return set()
+    base_dir = posixpath.dirname(relpath)
+    return {
+        target for target in (
+            posixpath.normpath(posixpath.join(base_dir, re.split(r"[?#]", url, maxsplit=1)[0]))
+            for _, _, url in _CSS_REFERENCE.findall(text)
+        )
+        if target in stylesheets and target != relpath
+    }
+
+
+def _load_manifest(site_dir: Path) -> Dict[str, Any]:
+    try:
+        return json.loads((site_dir / OPTIMIZE_MANIFEST).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def optimize_site(site_dir: Path, jobs: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Minify, fingerprint and precompress a built site in place
+
+    Args:
+        site_dir: Built site directory (e.g. _build/html)
+        jobs: Worker processes (default: OPTIMIZE_JOBS)
+
+    Returns:
+        Dict with 'files', 'minified_bytes_saved', 'bytes_before', 'bytes_after',
+        'gzip_bytes'/'brotli_bytes' (precompressed size of the files that got
+        siblings, next to 'precompressed_bytes', their plain size), 'hashed'
+        (assets given hashed names), 'minifiers' and 'seconds'
+    """
+    started = time.monotonic()
+    site_dir = Path(site_dir)
+    jobs = jobs or resolve_jobs(OPTIMIZE_JOBS)
+    manifest = _load_manifest(site_dir)
+    previous_generated = set(manifest.get("generated", []))
+    previous_hashes: Dict[str, str] = manifest.get("sha256", {})
+    aliases = {hashed: relpath for relpath, hashed in manifest.get("hashes", {}).items()}
+
+    inputs = [
+        relpath for _, relpath in list_files(site_dir)
+        if relpath not in previous_generated
+        and relpath != OPTIMIZE_MANIFEST
+        and not relpath.endswith((".gz", ".br", ".tmp"))
+    ]
+    assets = [relpath for relpath in inputs if relpath.startswith(STATIC_DIR + "/")]
+    stylesheets = {relpath for relpath in assets if relpath.lower().endswith(".css")}
+    pages = [relpath for relpath in inputs if relpath not in assets]
+
+    # Stylesheets point at the hashed names of what they reference, so
+    # referenced files are hashed first: other assets, then stylesheets in
+    # dependency order (a cycle is broken by leaving its references as they are)
+    rounds: List[List[str]] = [[relpath for relpath in assets if relpath not in stylesheets]]
+    dependencies = {relpath: _css_dependencies(site_dir, relpath, stylesheets) for relpath in stylesheets}
+    remaining = set(stylesheets)
+    while remaining:
+        ready = sorted(relpath for relpath in remaining if not (dependencies[relpath] & remaining)) or sorted(remaining)
+        rounds.append(ready)
+        remaining -= set(ready)
+    rounds.append(pages)
+
+    results: List[Dict[str, Any]] = []
+    hashes: Dict[str, str] = {}
+    executor = None
+    if jobs > 1 and len(inputs) > 1:
+        executor = ProcessPoolExecutor(max_workers=jobs, mp_context=get_context("spawn"))
+    try:
+        for batch in rounds:
+            tasks = [
+                (str(site_dir), relpath, relpath in assets, dict(hashes), aliases, previous_hashes)
+                for relpath in batch
+            ]
+            if executor is not None:
+                batch_results = list(executor.map(_optimize_file, tasks, chunksize=max(1, len(tasks) // (jobs * 4))))
+            else:
+                batch_results = [_optimize_file(task) for task in tasks]
+            for result in batch_results:
+                if result["hashed"]:
+                    hashes[result["relpath"]] = result["hashed"]
+            results += batch_results
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    # Drop hashed copies and siblings of a previous run that are no longer current
+    generated = {relpath for result in results for relpath in result["generated"]}
+    for relpath in previous_generated - generated:
+        (site_dir / relpath).unlink(missing_ok=True)
+
+    (site_dir / OPTIMIZE_MANIFEST).write_text(json.dumps({
+        "generated": sorted(generated),
+        "hashes": hashes,
+        "sha256": {result["relpath"]: result["sha256"] for result in results},
+    }, sort_keys=True))
+
+    compressed = [result for result in results if result["gzip_bytes"]]
+    report = {
+        "files": len(results),
+        "bytes_before": sum(result["bytes_before"] for result in results),
+        "bytes_after": sum(result["bytes_after"] for result in results),
+        "precompressed_files": len(compressed),
+        "precompressed_bytes": sum(result["bytes_after"] for result in compressed),
+        "gzip_bytes": sum(result["gzip_bytes"] for result in compressed),
+        "brotli_bytes": sum(result["brotli_bytes"] or 0 for result in compressed),
+        "hashed": len(hashes),
+        "minifiers": available_minifiers(),
+        "jobs": jobs,
+        "seconds": round(time.monotonic() - started, 2),
+    }
+    report["minified_bytes_saved"] = report["bytes_before"] - report["bytes_after"]
+    print(
+        f"[Asset Optimizer] {report['files']} files: minified {report['bytes_before']} -> {report['bytes_after']} bytes, "
+        f"gzip {report['precompressed_bytes']} -> {report['gzip_bytes']}, "
+        f"brotli -> {report['brotli_bytes']}, {report['hashed']} hashed assets in {report['seconds']}s"
+    )
+    return report
@@ -0,0 +1,232 @@
+"""
+Asset Store for LiquidBooks
+
+Content-addressed store of the static files in built sites. Every build
+writes the same theme assets (sphinx_book_theme's `_static` tree, fonts,
+sphinx-design files) and every build cache entry used to hold another copy.
+With the store, each distinct file is kept once under
+`<data dir>/asset-store/<sha256[:2]>/<sha256>` and the copies in build
+workspaces and build cache entries are hard links to it.
+
+Sphinx and its extensions overwrite existing output files in place, which
+would change every linked copy at once, so a workspace's links are replaced
+with private copies (`unshare`) before it is built again and shared again
+afterwards. Build cache entries are never written after they are stored.
+Store files no longer linked from anywhere are removed by `collect`.
+
+Where hard links are not possible (e.g. the store is on another filesystem)
+files are copied as before.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Dict
+
+from workspace_store import get_data_dir
+
+
+# Site directories whose files are shared (theme/extension assets and images)
+SHARED_DIRS = ("_static", "_sphinx_design_static", "_images")
+
+# Smaller files are not worth a link
+ASSET_STORE_MIN_BYTES = int(os.getenv("ASSET_STORE_MIN_BYTES", "1024"))
+
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def private_size(path: Path) -> int:
+    """
+    Bytes only a directory tree holds: files with other hard links (store
+    assets) are left out, as removing the tree does not free them
+
+    Workspace and build cache caps both measure this; the linked assets are
+    counted once, by the store.
+    """
+    total = 0
+    for f in Path(path).rglob("*"):
+        try:
+            stat = f.lstat()
+        except FileNotFoundError:
+            continue
+        if f.is_file() and not f.is_symlink() and stat.st_nlink == 1:
+            total += stat.st_size
+    return total
+
+
+def _shared_files(site_dir: Path):
+    for name in SHARED_DIRS:
+        shared_dir = site_dir / name
+        if shared_dir.is_dir():
+            yield from (path for path in shared_dir.rglob("*") if path.is_file() and not path.is_symlink())
+
+
+class AssetStore:
+    """Content-addressed store of hard-linked site assets"""
+
+    def __init__(self, root: Path, enabled: bool = True, min_bytes: int = ASSET_STORE_MIN_BYTES):
+        self.root = Path(root)
+        self.enabled = enabled
+        self.min_bytes = min_bytes
+        self._lock = threading.Lock()
+        if self.enabled:
+            self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def _shareable(self, path: Path) -> bool:
+        return self.enabled and path.stat().st_size >= self.min_bytes
+
+    def _replace_with_link(self, stored: Path, path: Path):
+        temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+        os.link(stored, temp_path)
+        os.replace(temp_path, path)
+
+    def add(self, path: Path) -> bool:
+        """
+        Share one file: link it to the store's copy of its content, or make
+        it the store's copy
+
+        Returns:
+            True if the file's bytes were already stored (disk saved)
+        """
+        path = Path(path)
+        digest = _file_digest(path)
+        stored = self._path(digest)
+        with self._lock:
+            try:
+                if stored.exists():
+                    if os.path.samestat(stored.stat(), path.stat()):
+                        return False
+                    self._replace_with_link(stored, path)
+                    return True
+                stored.parent.mkdir(exist_ok=True)
+                os.link(path, stored)
+            except OSError as e:
+                # e.g. EXDEV or EMLINK: keep the plain file
+                print(f"[Asset Store] Not sharing {path.name}: {str(e)}")
+            return False
+
+    def copy(self, source: str, destination: str) -> str:
+        """copytree copy_function: link shareable files from the store instead of copying"""
+        source_path, destination_path = Path(source), Path(destination)
+        if not self._shareable(source_path) or not any(part in SHARED_DIRS for part in source_path.parts):
+            return shutil.copy2(source, destination)
+        stored = self._path(_file_digest(source_path))
+        with self._lock:
+            try:
+                if not stored.exists():
+                    stored.parent.mkdir(exist_ok=True)
+                    shutil.copy2(source, stored.with_name(stored.name + ".tmp"))
+                    os.replace(stored.with_name(stored.name + ".tmp"), stored)
+                os.link(stored, destination)
+                return destination
+            except OSError as e:
+                print(f"[Asset Store] Copying {source_path.name} instead of linking: {str(e)}")
+        return shutil.copy2(source, destination)
+
+    def share(self, site_dir: Path) -> Dict[str, int]:
+        """
+        Replace a built site's assets with links into the store
+
+        Args:
+            site_dir: Built site directory (e.g. _build/html)
+
+        Returns:
+            Dict with 'files' (shareable files seen), 'linked' (files whose
+            bytes were already stored) and 'bytes_saved'
+        """
+        report = {"files": 0, "linked": 0, "bytes_saved": 0}
+        if not self.enabled:
+            return report
+        for path in _shared_files(Path(site_dir)):
+            if not self._shareable(path):
+                continue
+            report["files"] += 1
+            if self.add(path):
+                report["linked"] += 1
+                report["bytes_saved"] += path.stat().st_size
+        return report
+
+    def unshare(self, site_dir: Path) -> int:
+        """
+        Give a site private copies of its linked files, so writes into them
+        (the next build) do not reach the store or other sites
+
+        Args:
+            site_dir: Built site directory (e.g. _build/html)
+
+        Returns:
+            Number of files copied
+        """
+        copied = 0
+        for path in _shared_files(Path(site_dir)):
+            if path.stat().st_nlink < 2:
+                continue
+            temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+            # copy2 keeps mtimes, so Sphinx still sees unchanged files as unchanged
+            shutil.copy2(path, temp_path)
+            os.replace(temp_path, path)
+            copied += 1
+        return copied
+
+    def collect(self) -> int:
+        """Remove store files no site links to any more; returns the number removed"""
+        removed = 0
+        if not self.enabled:
+            return removed
+        with self._lock:
+            for stored in self.root.glob("*/*"):
+                try:
+                    if stored.name.endswith(".tmp") or stored.stat().st_nlink < 2:
+                        stored.unlink()
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        if removed:
+            print(f"[Asset Store] Removed {removed} unreferenced assets")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        files = 0
+        stored_bytes = 0
+        linked_bytes = 0
+        if self.enabled:
+            for stored in self.root.glob("*/*"):
+                stat = stored.stat()
+                files += 1
+                stored_bytes += stat.st_size
+                # Bytes the links would take as separate copies
+                linked_bytes += stat.st_size * max(stat.st_nlink - 1, 0)
+        return {
+            "enabled": self.enabled,
+            "files": files,
+            "stored_bytes": stored_bytes,
+            "linked_bytes": linked_bytes,
+            "bytes_saved": max(linked_bytes - stored_bytes, 0),
+        }
+
+
+# Global instance (lazy initialization)
+_asset_store_instance = None
+
+
+def get_asset_store() -> AssetStore:
+    """Get the global asset store (ASSET_STORE=0 disables sharing)"""
+    global _asset_store_instance
+    if _asset_store_instance is None:
+        _asset_store_instance = AssetStore(
+            get_data_dir() / "asset-store",
+            enabled=os.getenv("ASSET_STORE", "1") != "0",
+        )
+    return _asset_store_instance
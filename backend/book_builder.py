@@ -0,0 +1,326 @@
+"""
+Book Builder for LiquidBooks
+
+Runs a jupyter-book build through jupyter-book's Python API instead of its
+CLI. The CLI has no option for Sphinx parallel jobs, while
+jupyter_book.sphinx.build_sphinx does. The build pool runs this module as a
+script:
+
+    python book_builder.py BOOK_DIR [--all] [--jobs N|auto] [--builder html]
+                           [--reexecute CHAPTER.md ...]
+
+This module must stay free of imports from the API server (main.py): Sphinx
+inspects every loaded module, and some API dependencies break it.
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+
+# Output directory under _build for each supported builder
+BUILDER_OUTPUT_DIRS = {
+    "html": "html",
+    "dirhtml": "dirhtml",
+    "singlehtml": "singlehtml",
+    "latex": "latex",
+    "epub": "epub",
+}
+
+# Extensions known to break or serialize parallel builds (comma-separated env override)
+KNOWN_PARALLEL_UNSAFE = {
+    name.strip() for name in os.getenv("PARALLEL_UNSAFE_EXTENSIONS", "").split(",") if name.strip()
+}
+
+# Sphinx's warning when it falls back to a serial read or write
+SERIAL_FALLBACK_PATTERN = re.compile(
+    r"the (\S+) extension (?:does not declare if it is|is not) safe for parallel (reading|writing)"
+)
+
+# Remembers extensions that forced a serial write for the current config
+PARALLEL_MEMO = Path("_build") / ".liquidbooks-parallel.json"
+
+# Executed notebook outputs (jupyter-cache), kept with the book workspace.
+# `jupyter-book clean` also leaves this directory in place.
+EXECUTION_CACHE_DIR = Path("_build") / ".jupyter_cache"
+
+
+def resolve_jobs(jobs) -> int:
+    """Worker count from an int or 'auto' (one per CPU)"""
+    if str(jobs).lower() == "auto":
+        return os.cpu_count() or 1
+    return max(1, int(jobs))
+
+
+def _config_hash(book_dir: Path) -> str:
+    config_path = book_dir / "_config.yml"
+    data = config_path.read_bytes() if config_path.exists() else b""
+    return hashlib.sha256(data).hexdigest()
+
+
+def config_extensions(book_dir: Path) -> List[str]:
+    """Sphinx extensions enabled in a book's _config.yml"""
+    try:
+        config = yaml.safe_load((book_dir / "_config.yml").read_text()) or {}
+    except (OSError, yaml.YAMLError):
+        return []
+    return list((config.get("sphinx") or {}).get("extra_extensions") or [])
+
+
+def choose_jobs(book_dir: Path, requested: int) -> Tuple[int, Optional[str]]:
+    """
+    Decide how many Sphinx workers to use for a book
+
+    Falls back to a serial build when a configured extension is known to be
+    parallel-unsafe, or when an earlier build with the same config could not
+    write in parallel. A serial read alone does not count: jupyter-book always
+    loads sphinx_multitoc_numbering (via sphinx_external_toc), which is not
+    declared read-safe, so reads are serial anyway while writes still run in
+    parallel.
+
+    Returns:
+        (jobs, reason for running serially or None)
+    """
+    if requested <= 1:
+        return 1, None
+
+    unsafe = sorted(KNOWN_PARALLEL_UNSAFE.intersection(config_extensions(book_dir)))
+    if unsafe:
+        return 1, f"extensions not parallel-safe: {', '.join(unsafe)}"
+
+    try:
+        memo = json.loads((book_dir / PARALLEL_MEMO).read_text())
+    except (OSError, ValueError):
+        memo = {}
+    if memo.get("config_hash") == _config_hash(book_dir) and memo.get("write"):
+        return 1, f"previous build could not write in parallel: {', '.join(memo['write'])}"
+
+    return requested, None
+
+
+def record_serial_fallback(book_dir: Path, output: str) -> Dict[str, List[str]]:
+    """
+    Find Sphinx's serial fallback warnings in build output
+
+    Extensions that forced a serial write are remembered for the current
+    config so the next build skips the parallel setup straight away.
+
+    Returns:
+        Dict of 'read' and 'write' to the extensions that made that phase serial
+    """
+    fallback: Dict[str, List[str]] = {"read": [], "write": []}
+    for match in SERIAL_FALLBACK_PATTERN.finditer(output):
+        phase = "read" if match.group(2) == "reading" else "write"
+        if match.group(1) not in fallback[phase]:
+            fallback[phase].append(match.group(1))
+
+    if fallback["write"]:
+        memo_path = book_dir / PARALLEL_MEMO
+        memo_path.parent.mkdir(parents=True, exist_ok=True)
+        memo_path.write_text(json.dumps({"config_hash": _config_hash(book_dir), "write": fallback["write"]}))
+    return fallback
+
+
+def execution_mode(requested: str) -> str:
+    """
+    Notebook execution mode for _config.yml
+
+    'cache' needs the optional jupyter-cache package; without it builds fall
+    back to 'auto' (execute notebooks that have no stored outputs).
+    """
+    if requested == "cache" and importlib.util.find_spec("jupyter_cache") is None:
+        print("[Book Builder] jupyter-cache not installed, executing notebooks without a cache")
+        return "auto"
+    return requested
+
+
+def _open_execution_cache(book_dir: Path):
+    cache_dir = book_dir / EXECUTION_CACHE_DIR
+    if not cache_dir.exists():
+        return None
+    try:
+        from jupyter_cache import get_cache
+    except ImportError:
+        return None
+    return get_cache(str(cache_dir))
+
+
+def invalidate_executions(book_dir: Path, sources: List[str]) -> int:
+    """
+    Drop cached outputs of some chapters so their code cells run again
+
+    The sources are also touched so Sphinx re-reads them in an incremental
+    build.
+
+    Args:
+        book_dir: Book directory
+        sources: Chapter files relative to the book directory
+
+    Returns:
+        Number of cache records removed
+    """
+    paths = {str((book_dir / source).absolute()) for source in sources}
+    for path in paths:
+        if os.path.exists(path):
+            os.utime(path)
+
+    cache = _open_execution_cache(book_dir)
+    if cache is None:
+        return 0
+    removed = 0
+    for record in cache.list_cache_records():
+        if record.uri in paths:
+            cache.remove_cache(record.pk)
+            removed += 1
+    for record in cache.list_project_records():
+        if record.uri in paths:
+            cache.remove_nb_from_project(record.pk)
+    return removed
+
+
+def prune_execution_cache(book_dir: Path) -> Dict[str, int]:
+    """
+    Remove cached outputs no chapter can use anymore
+
+    Outputs are cached per chapter and keyed by a hash of its code cells, so a
+    chapter whose code did not change is never re-executed. Editing a chapter's
+    code leaves its old record behind, and deleted chapters leave theirs: only
+    the newest record of each existing chapter is kept.
+
+    Returns:
+        Dict with the number of 'kept' and 'removed' records
+    """
+    cache = _open_execution_cache(book_dir)
+    if cache is None:
+        return {"kept": 0, "removed": 0}
+
+    newest: Dict[str, object] = {}
+    stale = []
+    for record in sorted(cache.list_cache_records(), key=lambda r: r.created, reverse=True):
+        if record.uri in newest or not os.path.exists(record.uri):
+            stale.append(record)
+        else:
+            newest[record.uri] = record
+    for record in stale:
+        cache.remove_cache(record.pk)
+    for record in cache.list_project_records():
+        if not os.path.exists(record.uri):
+            cache.remove_nb_from_project(record.pk)
+    return {"kept": len(newest), "removed": len(stale)}
+
+
+def epub_overrides(book_dir: Path) -> Dict[str, str]:
+    """
+    EPUB settings jupyter-book leaves unset (the file would be
+    Projectnamenotset.epub with no title or author)
+
+    None of them make Sphinx re-read the sources.
+    """
+    try:
+        config = yaml.safe_load((Path(book_dir) / "_config.yml").read_text()) or {}
+    except (OSError, yaml.YAMLError):
+        config = {}
+    return {
+        "epub_basename": "book",
+        "epub_title": str(config.get("title") or "Book"),
+        "epub_author": str(config.get("author") or ""),
+    }
+
+
+def run_build(
+    book_dir: Path,
+    builder: str = "html",
+    full_rebuild: bool = False,
+    jobs: int = 1,
+    reexecute: Optional[List[str]] = None,
+    doctree_dir: Optional[Path] = None,
+) -> int:
+    """
+    Build a book the way `jupyter-book build` does, with Sphinx parallel jobs
+
+    Args:
+        book_dir: Book directory with _config.yml and _toc.yml
+        builder: Sphinx builder name
+        full_rebuild: Re-read every source file
+        jobs: Sphinx worker processes
+        reexecute: Chapter files whose cached notebook outputs are discarded first
+        doctree_dir: Doctree/environment directory (default: _build/.doctrees)
+
+    Returns:
+        Process exit code (0 on success)
+    """
+    from jupyter_book import __version__ as jupyter_book_version
+    from jupyter_book.sphinx import build_sphinx
+
+    book_dir = Path(book_dir).absolute()
+    output_dir = book_dir / "_build" / BUILDER_OUTPUT_DIRS.get(builder, builder)
+    print(f"Running Jupyter-Book v{jupyter_book_version} ({builder}, {jobs} job{'s' if jobs != 1 else ''})", flush=True)
+
+    if reexecute:
+        removed = invalidate_executions(book_dir, reexecute)
+        print(f"Execution cache: re-executing {len(reexecute)} chapter(s), removed {removed} cached output(s)", flush=True)
+
+    confoverrides = {
+        "external_toc_path": (book_dir / "_toc.yml").as_posix(),
+        "latex_individualpages": False,
+        "nb_execution_cache_path": str(book_dir / EXECUTION_CACHE_DIR),
+    }
+    if builder == "epub":
+        confoverrides.update(epub_overrides(book_dir))
+
+    result = build_sphinx(
+        book_dir,
+        output_dir,
+        doctreedir=doctree_dir,
+        noconfig=True,
+        path_config=str(book_dir / "_config.yml"),
+        confoverrides=confoverrides,
+        builder=builder,
+        force_all=full_rebuild,
+        jobs=jobs if jobs > 1 else None,
+    )
+
+    if isinstance(result, Exception):
+        print(f"Build failed: {result}", file=sys.stderr, flush=True)
+        return 1
+
+    # Builds on a doctree copy (the extra output formats) run side by side
+    # and execute nothing; the main build keeps the execution cache tidy
+    if doctree_dir is None:
+        pruned = prune_execution_cache(book_dir)
+        if pruned["removed"]:
+            print(f"Execution cache: kept {pruned['kept']} notebook(s), removed {pruned['removed']} stale", flush=True)
+    return int(result or 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a LiquidBooks book with jupyter-book")
+    parser.add_argument("book_dir", type=Path)
+    parser.add_argument("--builder", default="html", choices=sorted(BUILDER_OUTPUT_DIRS))
+    parser.add_argument("--all", dest="full_rebuild", action="store_true", help="Re-read every source file")
+    parser.add_argument("--jobs", "-j", default="1", help="Sphinx worker processes, or 'auto'")
+    parser.add_argument("--reexecute", action="append", default=[], metavar="CHAPTER",
+                        help="Chapter file whose code cells must run again (repeatable)")
+    parser.add_argument("--doctrees", type=Path, help="Doctree directory (default: _build/.doctrees)")
+    args = parser.parse_args()
+
+    sys.exit(run_build(
+        args.book_dir,
+        builder=args.builder,
+        full_rebuild=args.full_rebuild,
+        jobs=resolve_jobs(args.jobs),
+        reexecute=args.reexecute,
+        doctree_dir=args.doctrees,
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Book File Emitter for LiquidBooks
+
+Writes the generated Jupyter Book sources (_config.yml, _toc.yml, chapters,
+front/back matter) into a persistent build workspace. Files are only written
+when their content changed, so unchanged sources keep their mtime and Sphinx's
+incremental build skips them. The resulting ChangeSet tells the build step
+whether a rebuild is needed at all.
+"""
+
+import hashlib
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+
+# Records the source digest (and build options) of the last successful build
+BUILD_STAMP = Path("_build") / ".liquidbooks-sources"
+
+
+@dataclass
+class ChangeSet:
+    """Files touched by one emission pass (paths relative to the book dir)"""
+    written: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.written or self.removed)
+
+    def to_dict(self) -> Dict[str, List[str]]:
+        return {"written": self.written, "unchanged": self.unchanged, "removed": self.removed}
+
+
+class BookEmitter:
+    """Write-if-changed file emission into a book directory"""
+
+    def __init__(self, book_dir: Path):
+        self.book_dir = Path(book_dir)
+        self.changes = ChangeSet()
+        self._hashes: Dict[str, str] = {}
+
+    def write(self, relpath: str, content: str) -> bool:
+        """
+        Write a file if its content differs from what is on disk
+
+        Args:
+            relpath: Path relative to the book directory
+            content: File content
+
+        Returns:
+            True if the file was written
+        """
+        data = content.encode("utf-8")
+        self._hashes[relpath] = hashlib.sha256(data).hexdigest()
+        path = self.book_dir / relpath
+
+        try:
+            if path.read_bytes() == data:
+                self.changes.unchanged.append(relpath)
+                return False
+        except FileNotFoundError:
+            pass
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        self.changes.written.append(relpath)
+        return True
+
+    def remove_orphans(self, patterns: Iterable[str] = ("*.md",)) -> List[str]:
+        """
+        Delete top-level source files that were not emitted in this pass
+
+        Chapters that were renamed or deleted would otherwise linger in the
+        workspace and still be picked up by Sphinx.
+        """
+        removed = []
+        for pattern in patterns:
+            for path in self.book_dir.glob(pattern):
+                relpath = path.relative_to(self.book_dir).as_posix()
+                if path.is_file() and relpath not in self._hashes:
+                    path.unlink()
+                    removed.append(relpath)
+        self.changes.removed.extend(removed)
+        return removed
+
+    def digest(self) -> str:
+        """Hash over every emitted file, identifying this exact set of sources"""
+        combined = hashlib.sha256()
+        for relpath in sorted(self._hashes):
+            combined.update(f"{relpath}\0{self._hashes[relpath]}\n".encode("utf-8"))
+        return combined.hexdigest()
+
+    def _stamp(self, options: str) -> str:
+        return f"{self.digest()}\n{options}" if options else self.digest()
+
+    def up_to_date(self, options: str = "", output_file: str = "_build/html/index.html") -> bool:
+        """
+        True if nothing changed and the last successful build used these exact sources
+
+        Args:
+            options: Build options that change the output (as passed to mark_built)
+            output_file: File the build must have produced
+        """
+        stamp = self.book_dir / BUILD_STAMP
+        return (
+            not self.changes.has_changes
+            and (self.book_dir / output_file).exists()
+            and stamp.exists()
+            and stamp.read_text() == self._stamp(options)
+        )
+
+    def mark_built(self, options: str = ""):
+        """Record that the current sources were built successfully with these options"""
+        stamp = self.book_dir / BUILD_STAMP
+        stamp.parent.mkdir(parents=True, exist_ok=True)
+        stamp.write_text(self._stamp(options))
+
+    def mark_failed(self):
+        """Forget the last successful build so the next one is not skipped"""
+        (self.book_dir / BUILD_STAMP).unlink(missing_ok=True)
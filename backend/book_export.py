@@ -0,0 +1,214 @@
+"""
+Book Export for LiquidBooks
+
+Export profiles choose which part of a build workspace goes into a download:
+
+- html-only: the built site (`_build/html`), with index.html at the top
+- sources-only: the generated Jupyter Book sources, without `_build`
+- full: the whole workspace, including doctrees and the notebook execution
+  cache
+
+LiquidBooks' own bookkeeping files and temporary files are never exported.
+
+Finished archives are kept in an archive cache under the data directory,
+keyed by a hash of the profile and the exported files (names, sizes and
+modification times), so downloading the same build again is served straight
+from disk - with Range support for resumed downloads - instead of compressing
+it again. The cache is evicted least-recently-used first once it exceeds its
+size cap.
+"""
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from workspace_store import get_data_dir
+from zip_stream import list_files, stream_zip
+
+
+# Bump when archive contents change for the same files
+ARCHIVE_VERSION = 2
+
+EXPORT_PROFILES = {
+    "html-only": "Built HTML site",
+    "sources-only": "Jupyter Book sources without build output",
+    "full": "Whole build workspace",
+}
+
+DEFAULT_EXPORT_PROFILE = "full"
+
+BUILD_OUTPUT_DIR = "_build"
+HTML_OUTPUT_DIR = Path(BUILD_OUTPUT_DIR) / "html"
+
+
+def _is_temporary(arcname: str) -> bool:
+    # Files being replaced by the emitter (written, then renamed into place)
+    name = arcname.rsplit("/", 1)[-1]
+    return name.startswith(".") and name.endswith(".tmp")
+
+
+# Bookkeeping files LiquidBooks writes into build output, e.g. the asset
+# optimizer's manifest (.liquidbooks-optimized.json)
+INTERNAL_FILE_PREFIX = ".liquidbooks-"
+
+
+def is_internal_file(arcname: str) -> bool:
+    """Whether a file of a built site is LiquidBooks bookkeeping or a temporary file"""
+    return _is_temporary(arcname) or arcname.rsplit("/", 1)[-1].startswith(INTERNAL_FILE_PREFIX)
+
+
+def site_files(site_dir: Path) -> List[Tuple[Path, str]]:
+    """
+    Files of a site or build directory to hand out (published or exported):
+    list_files without internal files
+
+    Returns:
+        (path, relative name) pairs in a stable order
+    """
+    return [(path, arcname) for path, arcname in list_files(site_dir) if not is_internal_file(arcname)]
+
+
+def export_files(build_dir: Path, profile: str) -> List[Tuple[Path, str]]:
+    """
+    Files of a build workspace that belong in an export profile
+
+    Args:
+        build_dir: Book build directory (workspace or build cache entry)
+        profile: One of EXPORT_PROFILES
+
+    Returns:
+        (path, archive name) pairs in a stable order
+    """
+    if profile not in EXPORT_PROFILES:
+        raise ValueError(f"Unknown export profile: {profile}")
+
+    build_dir = Path(build_dir)
+    if profile == "html-only":
+        return site_files(build_dir / HTML_OUTPUT_DIR)
+    files = site_files(build_dir)
+    if profile == "sources-only":
+        files = [(path, arcname) for path, arcname in files if not arcname.startswith(BUILD_OUTPUT_DIR + "/")]
+    return files
+
+
+def archive_key(files: List[Tuple[Path, str]], profile: str) -> str:
+    """
+    Hash identifying the archive of a set of build files
+
+    Uses each file's name, size and modification time rather than its
+    content, so it costs one stat per file; any rebuild that rewrites a file
+    changes the key.
+    """
+    digest = hashlib.sha256(f"{ARCHIVE_VERSION}\0{profile}\n".encode("utf-8"))
+    for path, arcname in files:
+        stat = path.stat()
+        digest.update(f"{arcname}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ArchiveCache:
+    """LRU-capped directory of finished archives"""
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def path(self, key: str) -> Path:
+        """Where the archive for a key is (or will be) stored"""
+        return self.root / f"{key}.zip"
+
+    def get(self, key: str) -> Optional[Path]:
+        """
+        Look up a finished archive
+
+        Returns:
+            Archive path, or None on a miss
+        """
+        path = self.path(key)
+        if not self.enabled or not path.exists():
+            self.misses += 1
+            return None
+        # atime is the LRU timestamp; mtime stays, as it is part of the ETag
+        # clients use to resume downloads
+        os.utime(path, (time.time(), path.stat().st_mtime))
+        self.hits += 1
+        return path
+
+    def _entries(self) -> List[Tuple[Path, os.stat_result]]:
+        entries = []
+        for path in self.root.glob("*.zip"):
+            try:
+                entries.append((path, path.stat()))
+            except FileNotFoundError:
+                pass
+        return entries
+
+    def evict(self) -> List[str]:
+        """Remove least-recently-used archives until the cache fits max_bytes"""
+        evicted = []
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[1].st_atime)
+            total = sum(stat.st_size for _, stat in entries)
+            for path, stat in entries:
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= stat.st_size
+                evicted.append(path.stem)
+        if evicted:
+            print(f"[Archive Cache] Evicted {len(evicted)} archives")
+        return evicted
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "size_bytes": sum(stat.st_size for _, stat in entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Global instance (lazy initialization)
+_archive_cache_instance = None
+
+
+def get_archive_cache() -> ArchiveCache:
+    """Get the global archive cache (size cap from ARCHIVE_CACHE_MAX_MB, 0 disables it)"""
+    global _archive_cache_instance
+    if _archive_cache_instance is None:
+        max_mb = int(os.getenv("ARCHIVE_CACHE_MAX_MB", "1024"))
+        _archive_cache_instance = ArchiveCache(get_data_dir() / "archives", max_mb * 1024 * 1024)
+    return _archive_cache_instance
+
+
+async def stream_archive(files: List[Tuple[Path, str]], key: str) -> AsyncIterator[bytes]:
+    """
+    Stream a new archive, storing it in the archive cache as it is sent
+
+    Args:
+        files: (path, archive name) pairs from export_files
+        key: Archive key from archive_key
+
+    Yields:
+        Chunks of the zip archive
+    """
+    cache = get_archive_cache()
+    save_to = cache.path(key) if cache.enabled else None
+    async for chunk in stream_zip(files, save_to=save_to):
+        yield chunk
+    if save_to is not None:
+        await asyncio.to_thread(cache.evict)
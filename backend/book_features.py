@@ -0,0 +1,215 @@
+"""
+Book Features for LiquidBooks
+
+Maps the feature ids users pick for a book (admonitions, tabs, math, ...) to
+the Sphinx and MyST extensions that implement them. Used for the generated
+_config.yml, by the chapter preview renderer and by the MyST linter, so all
+three agree on which extensions (and therefore which directives and roles)
+a book has.
+"""
+
+from typing import Iterable, List
+
+
+# Map features to required Sphinx extensions
+# Features with empty lists are built into MyST/Sphinx/Jupyter Book
+FEATURE_EXTENSIONS = {
+    # Basic Content Features
+    'admonitions': [],  # Built into MyST
+    'dropdowns': ['sphinx_togglebutton'],
+    'admonition_dropdowns': ['sphinx_togglebutton'],
+    'definition_lists': [],  # MyST extension: deflist
+    'blockquotes': [],  # Built into MyST
+    'epigraphs': [],  # Built into Sphinx
+    'glossary': [],  # Built into Sphinx
+    'footnotes': [],  # Built into MyST
+    'sidebar': [],  # Built into Sphinx
+    'margin_notes': [],  # Built into Sphinx
+
+    # Code Features
+    'code_blocks': ['sphinx_copybutton'],
+    'code_execution': [],  # Built into Jupyter Book
+    'code_cell_tags': [],  # Built into MyST-NB
+    'output_gluing': [],  # Built into MyST-NB
+    'thebe': ['sphinx_thebe'],
+    'binder_buttons': [],  # Config-based
+    'scroll_output': [],  # CSS-based
+    'line_numbers': [],  # Built into Sphinx
+
+    # Math Features
+    'math_equations': [],  # MyST extension: dollarmath
+    'amsmath': [],  # MyST extension: amsmath
+    'math_labels': [],  # Built into MyST
+    'theorems': ['sphinx_proof'],
+    'proofs': ['sphinx_proof'],
+    'algorithms': ['sphinx_proof'],
+    'lemmas': ['sphinx_proof'],
+    'corollaries': ['sphinx_proof'],
+    'definitions': ['sphinx_proof'],
+
+    # Sphinx Design Components
+    'grids': ['sphinx_design'],
+    'cards': ['sphinx_design'],
+    'tabs': ['sphinx_design'],
+    'badges': ['sphinx_design'],
+    'buttons': ['sphinx_design'],
+    'icons': ['sphinx_design'],
+    'grid_cards': ['sphinx_design'],
+    'custom_divs': [],  # Built into MyST
+
+    # Visual & Diagrams
+    'figures': [],  # Built into MyST
+    'images': [],  # Built into MyST
+    'html_images': [],  # MyST extension: html_image
+    'mermaid_diagrams': ['sphinxcontrib.mermaid'],
+    'tables': [],  # Built into MyST
+
+    # Interactive Features
+    'quizzes': ['jupyterquiz'],
+    'exercise': ['sphinx_exercise'],
+    'interactive_plots': [],  # Via code execution
+    'widgets': [],  # Via Jupyter
+
+    # MyST Extensions (handled separately in myst_enable_extensions)
+    'colon_fence': [],  # MyST extension
+    'substitutions': [],  # MyST extension: substitution
+    'smartquotes': [],  # MyST extension
+    'linkify': [],  # MyST extension
+    'replacements': [],  # MyST extension
+    'tasklists': [],  # MyST extension: tasklist
+    'html_admonition': [],  # MyST extension
+    'attrs_inline': [],  # MyST extension
+    'attrs_block': [],  # MyST extension
+
+    # References & Citations
+    'cross_references': [],  # Built into Sphinx
+    'target_headers': [],  # Built into MyST
+    'citations': ['sphinxcontrib.bibtex'],
+    'numbered_references': [],  # Built into Sphinx
+
+    # Advanced Features
+    'line_comments': [],  # Built into MyST
+    'block_breaks': [],  # Built into MyST
+    'html_blocks': [],  # Built into MyST
+    'reference_style_links': [],  # Built into MyST
+    'thematic_breaks': [],  # Built into MyST
+}
+
+# Map MyST feature IDs to MyST extension names
+MYST_FEATURE_EXTENSIONS = {
+    'math_equations': 'dollarmath',
+    'amsmath': 'amsmath',
+    'colon_fence': 'colon_fence',
+    'definition_lists': 'deflist',
+    'html_images': 'html_image',
+    'linkify': 'linkify',
+    'replacements': 'replacements',
+    'smartquotes': 'smartquotes',
+    'substitutions': 'substitution',
+    'tasklists': 'tasklist',
+    'html_admonition': 'html_admonition',
+    'attrs_inline': 'attrs_inline',
+    'attrs_block': 'attrs_block',
+}
+
+# Always included in every book
+CORE_EXTENSIONS = [
+    'sphinx_copybutton',  # Copy button for code blocks
+    'sphinx_togglebutton',  # Toggle buttons for content
+]
+
+# Loaded by jupyter-book itself for every book (jupyter_book.config)
+JUPYTER_BOOK_EXTENSIONS = [
+    'sphinx_togglebutton',
+    'sphinx_copybutton',
+    'myst_nb',
+    'jupyter_book',
+    'sphinx_thebe',
+    'sphinx_comments',
+    'sphinx_external_toc',
+    'sphinx.ext.intersphinx',
+    'sphinx_design',
+    'sphinx_book_theme',
+]
+
+# Directives Sphinx itself adds on top of docutils
+SPHINX_DIRECTIVES = [
+    'toctree', 'code-block', 'sourcecode', 'literalinclude', 'highlight', 'glossary', 'index',
+    'only', 'seealso', 'versionadded', 'versionchanged', 'deprecated', 'centered', 'hlist',
+    'tabularcolumns', 'productionlist', 'sectionauthor', 'moduleauthor', 'codeauthor', 'acks',
+    'rst-class',
+]
+
+# Roles Sphinx itself adds on top of docutils
+SPHINX_ROLES = [
+    'ref', 'doc', 'numref', 'eq', 'term', 'download', 'any', 'keyword', 'option', 'envvar',
+    'kbd', 'guilabel', 'menuselection', 'file', 'samp', 'abbr', 'command', 'program', 'dfn',
+    'mailheader', 'makevar', 'manpage', 'mimetype', 'newsgroup', 'regexp', 'token',
+]
+
+# Sphinx domains whose directives/roles ('py:function', 'math:numref', ...) are always available
+SPHINX_DOMAINS = ['py', 'c', 'cpp', 'js', 'rst', 'std', 'math']
+
+_BADGE_ROLES = [
+    f'bdg-{variant}{suffix}'
+    for variant in ('primary', 'secondary', 'success', 'info', 'warning', 'danger', 'light', 'muted', 'dark', 'white', 'black')
+    for suffix in ('', '-line')
+]
+
+# Directives provided by Sphinx extensions
+EXTENSION_DIRECTIVES = {
+    'sphinx_design': [
+        'grid', 'grid-item', 'grid-item-card', 'card', 'card-carousel', 'dropdown',
+        'tab-set', 'tab-item', 'tab-set-code', 'button-link', 'button-ref', 'article-info', 'div',
+    ],
+    'sphinx_togglebutton': ['toggle'],
+    'sphinx_book_theme': ['margin'],
+    'sphinx_external_toc': ['tableofcontents'],
+    'myst_nb': ['code-cell', 'raw-cell', 'glue', 'glue:any', 'glue:figure', 'glue:math', 'glue:md'],
+    'sphinx_proof': [
+        'prf:algorithm', 'prf:axiom', 'prf:conjecture', 'prf:corollary', 'prf:criterion',
+        'prf:definition', 'prf:example', 'prf:lemma', 'prf:observation', 'prf:proof',
+        'prf:property', 'prf:proposition', 'prf:remark', 'prf:theorem', 'prf:assumption',
+    ],
+    'sphinx_exercise': ['exercise', 'solution', 'exercise-start', 'exercise-end', 'solution-start', 'solution-end'],
+    'sphinxcontrib.bibtex': ['bibliography', 'footbibliography'],
+    'sphinxcontrib.mermaid': ['mermaid'],
+}
+
+# Roles provided by Sphinx extensions
+EXTENSION_ROLES = {
+    'sphinx_design': ['octicon', 'fas', 'fab', 'far', 'bdg', 'bdg-link', 'bdg-ref'] + _BADGE_ROLES,
+    'myst_nb': ['glue', 'glue:any', 'glue:text', 'glue:md'],
+    'sphinx_proof': ['prf:ref'],
+    'sphinxcontrib.bibtex': [
+        'cite', 'cite:p', 'cite:t', 'cite:ps', 'cite:ts', 'cite:ct', 'cite:cp', 'cite:cts', 'cite:cps',
+        'cite:label', 'cite:year', 'cite:author', 'footcite', 'footcite:p', 'footcite:t',
+    ],
+}
+
+
+def sphinx_extensions(features: Iterable[str]) -> List[str]:
+    """Sorted Sphinx extensions needed for the enabled features"""
+    extensions = set(CORE_EXTENSIONS)
+    for feature in features:
+        if feature in FEATURE_EXTENSIONS:
+            extensions.update(FEATURE_EXTENSIONS[feature])
+
+    # Remove empty strings (from features with no Sphinx extension)
+    extensions.discard('')
+    return sorted(extensions)
+
+
+def myst_extensions(features: Iterable[str]) -> List[str]:
+    """Sorted MyST syntax extensions (myst_enable_extensions) for the enabled features"""
+    return sorted({MYST_FEATURE_EXTENSIONS[feature] for feature in features if feature in MYST_FEATURE_EXTENSIONS})
+
+
+def book_extensions(features: Iterable[str]) -> List[str]:
+    """Every Sphinx extension a book build loads: jupyter-book's own plus the features'"""
+    return sorted(set(JUPYTER_BOOK_EXTENSIONS) | set(sphinx_extensions(features)))
+
+
+def features_providing(extension: str) -> List[str]:
+    """Feature ids that enable a Sphinx extension"""
+    return sorted(feature for feature, extensions in FEATURE_EXTENSIONS.items() if extension in extensions)
@@ -0,0 +1,224 @@
+"""
+Build Cache for LiquidBooks
+
+Content-addressed cache of built books. The key is a canonical hash of
+everything that determines the output (chapters, publishing info, features
+and the generated _config.yml), so rebuilding an unchanged book - even under
+a different id or after its build workspace was reused for another version -
+returns the stored `_build/html` immediately.
+
+Each entry is a directory `<key>/` holding the book sources and
+`_build/html`. Entries are evicted least-recently-used first once the cache
+exceeds its size cap. Like workspaces, an entry's size counts only the bytes
+it holds itself (asset_store.private_size); assets hard-linked from the asset
+store are shared and not freed by evicting it.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from asset_store import get_asset_store, private_size
+from workspace_store import get_data_dir
+
+
+# Bump when the generated book layout changes so old entries are not reused
+BUILD_CACHE_VERSION = 1
+
+# Top-level source files copied into an entry next to the HTML
+SOURCE_PATTERNS = ("*.md", "*.yml", "*.bib")
+
+# Bytes only the entry holds (the old .size files counted linked assets too)
+SIZE_FILE = ".liquidbooks-size"
+
+# Build keys are sha256 hex digests; anything else (e.g. a path) is never an entry
+BUILD_KEY_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+def compute_build_key(
+    chapters: List[Dict[str, Any]],
+    publishing_info: Optional[Dict[str, Any]],
+    features: Optional[List[str]],
+    config_text: str,
+    options: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Canonical hash of the inputs that determine a book's HTML output
+
+    Args:
+        chapters: Chapter dicts with 'title', 'content' and 'order'
+        publishing_info: Publishing metadata (copyright, front/back matter)
+        features: Enabled feature ids (order does not matter)
+        config_text: Generated _config.yml content
+        options: Post-build options that change the output (e.g. asset optimization)
+
+    Returns:
+        Hex digest identifying the build
+    """
+    canonical = {
+        "version": BUILD_CACHE_VERSION,
+        "chapters": [
+            {"title": c.get('title', ''), "content": c.get('content', ''), "order": c.get('order', 0)}
+            for c in sorted(chapters, key=lambda c: c.get('order', 0))
+        ],
+        "publishing_info": publishing_info or {},
+        "features": sorted(set(features or [])),
+        "config": config_text,
+    }
+    # Only set options are hashed, so keys of plain builds stay the same
+    if options:
+        canonical["options"] = options
+    data = json.dumps(canonical, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class BuildCache:
+    """LRU-capped directory cache of built books"""
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: str) -> Optional[Path]:
+        """
+        Look up a built book
+
+        Returns:
+            Entry directory (containing `_build/html`), or None on a miss
+        """
+        entry = self.root / key
+        if not self.enabled or not BUILD_KEY_PATTERN.fullmatch(key) or not (entry / "_build" / "html" / "index.html").exists():
+            self.misses += 1
+            return None
+        # mtime of the entry directory is its LRU timestamp
+        os.utime(entry)
+        self.hits += 1
+        return entry
+
+    def touch(self, path: Path) -> bool:
+        """Mark the entry containing path as recently used; False if path is not in the cache"""
+        try:
+            relative = Path(path).resolve().relative_to(self.root.resolve())
+        except ValueError:
+            return False
+        entry = self.root / relative.parts[0] if relative.parts else None
+        if entry is None or not entry.is_dir():
+            return False
+        os.utime(entry)
+        return True
+
+    def put(self, key: str, book_dir: Path, in_use: Optional[Callable[[Path], bool]] = None) -> Optional[Path]:
+        """
+        Store a successful build, then evict down to max_bytes
+
+        Args:
+            key: Build key from compute_build_key
+            book_dir: Book directory containing sources and `_build/html`
+            in_use: Returns True for entries eviction must keep
+
+        Returns:
+            Entry directory, or None if the cache is disabled
+        """
+        if not self.enabled:
+            return None
+
+        entry = self.root / key
+        if entry.exists():
+            os.utime(entry)
+            return entry
+
+        # Assemble in a scratch directory, then rename into place atomically
+        staging = self.root / f".tmp-{uuid.uuid4().hex}"
+        try:
+            # Assets are linked from the shared asset store rather than copied
+            shutil.copytree(
+                book_dir / "_build" / "html",
+                staging / "_build" / "html",
+                copy_function=get_asset_store().copy,
+            )
+            for pattern in SOURCE_PATTERNS:
+                for source in book_dir.glob(pattern):
+                    shutil.copy2(source, staging / source.name)
+            (staging / SIZE_FILE).write_text(str(private_size(staging)))
+            os.replace(staging, entry)
+        except OSError as e:
+            print(f"[Build Cache] Failed to store {key[:12]}: {str(e)}")
+            shutil.rmtree(staging, ignore_errors=True)
+            return entry if entry.exists() else None
+
+        # The new entry is kept even if entries in use leave the cache over its cap
+        self.evict(lambda path: path == entry or (in_use is not None and in_use(path)))
+        return entry
+
+    def _entries(self) -> List[Dict[str, Any]]:
+        entries = []
+        for entry in self.root.iterdir():
+            if not entry.is_dir() or entry.name.startswith("."):
+                continue
+            try:
+                size = int((entry / SIZE_FILE).read_text())
+            except (OSError, ValueError):
+                size = private_size(entry)
+            entries.append({"key": entry.name, "path": entry, "size": size, "atime": entry.stat().st_mtime})
+        return entries
+
+    def evict(self, in_use: Optional[Callable[[Path], bool]] = None) -> List[str]:
+        """
+        Remove least-recently-used entries until the cache fits max_bytes
+
+        Args:
+            in_use: Returns True for entries that must be kept (e.g. being deployed)
+        """
+        evicted = []
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda e: e["atime"])
+            total = sum(e["size"] for e in entries)
+            for entry in entries:
+                if total <= self.max_bytes:
+                    break
+                if in_use and in_use(entry["path"]):
+                    continue
+                shutil.rmtree(entry["path"], ignore_errors=True)
+                total -= entry["size"]
+                evicted.append(entry["key"])
+        if evicted:
+            print(f"[Build Cache] Evicted {len(evicted)} entries")
+            get_asset_store().collect()
+        return evicted
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "size_bytes": sum(e["size"] for e in entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Global instance (lazy initialization)
+_build_cache_instance = None
+
+
+def get_build_cache() -> BuildCache:
+    """Get the global build cache (size cap from BUILD_CACHE_MAX_MB, 0 disables it)"""
+    global _build_cache_instance
+    if _build_cache_instance is None:
+        max_mb = int(os.getenv("BUILD_CACHE_MAX_MB", "2048"))
+        _build_cache_instance = BuildCache(get_data_dir() / "build-cache", max_mb * 1024 * 1024)
+    return _build_cache_instance
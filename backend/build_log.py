@@ -0,0 +1,203 @@
+"""
+Build Log for LiquidBooks
+
+Collects a build's output line by line and fans it out to Server-Sent Events
+subscribers while the build runs. Lines from jupyter-book/Sphinx are matched
+against known progress messages to mark phases (config, queued, reading,
+executing, writing, optimize, formats), and the time spent in each phase is reported
+when the build finishes.
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+
+# First match wins; checked against each output line with ANSI codes removed
+PHASE_PATTERNS = [
+    (re.compile(r"^Execut(ing|ed) ", re.IGNORECASE), "executing"),
+    (re.compile(r"^(updating environment:|reading sources\.\.\.)"), "reading"),
+    (re.compile(r"^(preparing documents|copying assets|writing output\.\.\. \[)"), "writing"),
+]
+
+# Finished logs kept around for late subscribers
+MAX_FINISHED_LOGS = 50
+
+# Logs opened by subscribers before their build starts: seconds to wait for
+# the build, and how many may wait at once
+BUILD_EVENTS_WAIT = float(os.getenv("BUILD_EVENTS_WAIT", "120"))
+MAX_PENDING_LOGS = 100
+
+
+def format_sse(event: Dict[str, Any], index: int) -> str:
+    """Render an event as a Server-Sent Events message (the id lets clients resume)"""
+    return f"id: {index}\ndata: {json.dumps(event)}\n\n"
+
+
+class BuildLog:
+    """Event log of one build, readable while the build is still running"""
+
+    def __init__(self, build_id: str):
+        self.build_id = build_id
+        self.events: List[Dict[str, Any]] = []
+        self.phase: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self.finished = False
+        self.build_started = False  # False while only subscribers have asked for it
+
+        self._created = time.monotonic()
+        self._started = self._created
+        self._phase_started = self._started
+        self._changed = asyncio.Event()
+
+    def _emit(self, event: Dict[str, Any]):
+        event["t"] = round(time.monotonic() - self._started, 3)
+        self.events.append(event)
+        # Wake current subscribers; later ones wait on a fresh event
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _end_phase(self):
+        if self.phase is None:
+            return
+        seconds = time.monotonic() - self._phase_started
+        self.timings[self.phase] = round(self.timings.get(self.phase, 0.0) + seconds, 3)
+        self._emit({"type": "phase_end", "phase": self.phase, "seconds": round(seconds, 3)})
+
+    def start_phase(self, phase: str):
+        """Mark the start of a phase (ending the current one)"""
+        if phase == self.phase:
+            return
+        self._end_phase()
+        self.phase = phase
+        self._phase_started = time.monotonic()
+        self._emit({"type": "phase", "phase": phase})
+
+    def line(self, text: str, stream: str = "stdout", builder: Optional[str] = None):
+        """
+        Record one line of build output, switching phase if it marks one
+
+        Lines of the extra format builders (builder set) run concurrently in
+        the 'formats' phase and are tagged with their builder instead.
+        """
+        text = ANSI_ESCAPE.sub("", text).rstrip()
+        if not text:
+            return
+        if builder:
+            self._emit({"type": "log", "stream": stream, "line": text, "builder": builder})
+            return
+        for pattern, phase in PHASE_PATTERNS:
+            if pattern.search(text):
+                self.start_phase(phase)
+                break
+        self._emit({"type": "log", "stream": stream, "line": text})
+
+    def info(self, message: str, **fields: Any):
+        """Record a status message from the API itself"""
+        print(f"[Build {self.build_id[:8]}] {message}")
+        self._emit({"type": "info", "message": message, **fields})
+
+    def finish(self, success: bool, message: str = ""):
+        """End the log; subscribers receive a final 'done' event with phase timings"""
+        if self.finished:
+            return
+        self._end_phase()
+        self.phase = None
+        self.finished = True
+        self._emit({
+            "type": "done",
+            "success": success,
+            "message": message,
+            "timings": self.timings,
+            "total_seconds": round(time.monotonic() - self._started, 3),
+        })
+        _retire(self.build_id)
+
+    async def follow(self, start: int = 0) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Yield (index, event) from index start, waiting for new events until the build finishes
+
+        If no build starts within BUILD_EVENTS_WAIT seconds of the log being
+        opened, a final unsuccessful 'done' event is yielded (not stored) and
+        the log is discarded.
+        """
+        index = start
+        while True:
+            changed = self._changed
+            while index < len(self.events):
+                yield index, self.events[index]
+                index += 1
+            if self.finished:
+                return
+            if self.build_started:
+                await changed.wait()
+                continue
+            try:
+                await asyncio.wait_for(changed.wait(), max(self._created + BUILD_EVENTS_WAIT - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                if not self.build_started:
+                    _discard_pending(self.build_id)
+                    yield index, {"type": "done", "success": False, "message": "No build started", "timings": {}}
+                    return
+
+
+_build_logs: Dict[str, BuildLog] = {}
+_finished_logs: "OrderedDict[str, None]" = OrderedDict()
+
+
+def _retire(build_id: str):
+    _finished_logs[build_id] = None
+    while len(_finished_logs) > MAX_FINISHED_LOGS:
+        old_id, _ = _finished_logs.popitem(last=False)
+        _build_logs.pop(old_id, None)
+
+
+def _discard_pending(build_id: str):
+    build_log = _build_logs.get(build_id)
+    if build_log is not None and not build_log.build_started:
+        del _build_logs[build_id]
+
+
+def _prune_pending():
+    # Drop logs whose build never started, then the oldest beyond MAX_PENDING_LOGS
+    now = time.monotonic()
+    pending = sorted(
+        (build_log for build_log in _build_logs.values() if not build_log.build_started),
+        key=lambda build_log: build_log._created,
+    )
+    for i, build_log in enumerate(pending):
+        if now - build_log._created >= BUILD_EVENTS_WAIT or len(pending) - i >= MAX_PENDING_LOGS:
+            _discard_pending(build_log.build_id)
+
+
+def get_build_log(build_id: str, create: bool = True) -> Optional[BuildLog]:
+    """
+    Get the log for a build
+
+    With create, a subscriber may connect before the build request arrives
+    (clients choose their build_id) and will see events once it starts, if
+    it starts within BUILD_EVENTS_WAIT seconds.
+    """
+    if build_id not in _build_logs and create:
+        _prune_pending()
+        _build_logs[build_id] = BuildLog(build_id)
+    return _build_logs.get(build_id)
+
+
+def start_build_log(build_id: str) -> BuildLog:
+    """Log for a build that is starting: the one subscribers are waiting on, or a fresh one"""
+    build_log = get_build_log(build_id)
+    if not build_log.events:
+        # Created by an early subscriber; time the build from now
+        build_log._started = build_log._phase_started = time.monotonic()
+    elif build_log.finished:
+        _finished_logs.pop(build_id, None)
+        build_log = _build_logs[build_id] = BuildLog(build_id)
+    build_log.build_started = True
+    return build_log
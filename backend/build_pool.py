@@ -0,0 +1,240 @@
+"""
+Build Pool for LiquidBooks
+
+Runs jupyter-book builds as asyncio subprocesses so a build never blocks the
+event loop. At most MAX_CONCURRENT_BUILDS run at once; further builds wait in
+a FIFO queue whose positions can be polled, and once BUILD_QUEUE_SIZE builds
+are waiting new ones are rejected with an estimated retry delay. Builds
+waiting for another build of the same book to finish are queued too.
+"""
+
+import asyncio
+import math
+import os
+import signal
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+
+# Used for Retry-After estimates until real build durations are known
+DEFAULT_BUILD_SECONDS = 60
+
+# Longest single output line read from a build (Sphinx can print very long lines)
+STREAM_LIMIT = 1024 * 1024
+
+
+class BuildQueueFull(Exception):
+    """Raised when the build queue cannot take another build"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Build queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class BuildPool:
+    """Bounded pool of concurrent build subprocesses with a waiting queue"""
+
+    def __init__(self, max_concurrent: int = 2, max_queued: int = 8, timeout: int = 300):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queued = max(0, max_queued)
+        self.timeout = timeout
+
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._queued: List[str] = []
+        self._running: Dict[str, float] = {}
+        self._durations = deque(maxlen=20)
+        self._history = deque(maxlen=50)
+        self._book_locks: Dict[str, asyncio.Lock] = {}
+        self._book_users: Dict[str, int] = {}  # Builds holding or waiting for each book lock
+
+    def _average_duration(self) -> float:
+        return sum(self._durations) / len(self._durations) if self._durations else DEFAULT_BUILD_SECONDS
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to free up for a new build"""
+        waves = math.ceil((len(self._queued) + 1) / self.max_concurrent)
+        return max(1, int(waves * self._average_duration()))
+
+    def position(self, build_id: str) -> Optional[int]:
+        """0 if the build is running, 1.. if queued, None if unknown or finished"""
+        if build_id in self._running:
+            return 0
+        if build_id in self._queued:
+            return self._queued.index(build_id) + 1
+        return None
+
+    def is_building(self, key: str) -> bool:
+        """True while a build holds the lock of a book workspace"""
+        lock = self._book_locks.get(key)
+        return lock is not None and lock.locked()
+
+    async def acquire_book(self, key: str, build_id: str):
+        """
+        Wait for the lock serializing builds that share one book workspace
+
+        While another build of the book holds or waits for the lock, this
+        build is queued like one waiting for a slot.
+
+        Raises:
+            BuildQueueFull: If the build would have to wait and the queue is full
+        """
+        waiting = self._book_users.get(key, 0) > 0
+        if waiting and len(self._queued) >= self.max_queued:
+            raise BuildQueueFull(self.retry_after())
+
+        lock = self._book_locks.setdefault(key, asyncio.Lock())
+        self._book_users[key] = self._book_users.get(key, 0) + 1
+        if waiting:
+            self._queued.append(build_id)
+        try:
+            await lock.acquire()
+        except BaseException:
+            self._leave_book(key)
+            raise
+        finally:
+            if waiting:
+                self._queued.remove(build_id)
+
+    def release_book(self, key: str):
+        """Release a book lock taken with acquire_book"""
+        self._book_locks[key].release()
+        self._leave_book(key)
+
+    def _leave_book(self, key: str):
+        # Drop the lock once no build holds or waits for it
+        self._book_users[key] -= 1
+        if not self._book_users[key]:
+            del self._book_users[key]
+            del self._book_locks[key]
+
+    @asynccontextmanager
+    async def slot(self, build_id: str):
+        """
+        Wait for a build slot
+
+        Raises:
+            BuildQueueFull: If every slot is busy and the queue is full
+        """
+        if len(self._running) >= self.max_concurrent and len(self._queued) >= self.max_queued:
+            raise BuildQueueFull(self.retry_after())
+
+        self._queued.append(build_id)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._queued.remove(build_id)
+
+        started = time.monotonic()
+        self._running[build_id] = started
+        try:
+            yield
+        finally:
+            self._running.pop(build_id, None)
+            self._durations.append(time.monotonic() - started)
+            self._semaphore.release()
+
+    async def run(
+        self,
+        command: List[str],
+        timeout: Optional[int] = None,
+        on_line: Optional[Callable[[str, str], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Run a command without blocking the event loop
+
+        The command runs in its own process group so a timeout also kills
+        any kernels or helpers it started.
+
+        Args:
+            command: Command and arguments
+            timeout: Seconds before the process group is killed
+            on_line: Called with (stream, line) for each output line as it arrives
+
+        Returns:
+            Dict with 'success', 'returncode', 'stdout', 'stderr' (or 'error')
+        """
+        timeout = timeout or self.timeout
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+            limit=STREAM_LIMIT,
+        )
+        output: Dict[str, List[str]] = {"stdout": [], "stderr": []}
+
+        async def pump(stream: asyncio.StreamReader, name: str):
+            while True:
+                raw = await stream.readline()
+                if not raw:
+                    return
+                line = raw.decode("utf-8", errors="replace")
+                output[name].append(line)
+                if on_line is not None:
+                    on_line(name, line)
+
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(pump(process.stdout, "stdout"), pump(process.stderr, "stderr"), process.wait()),
+                timeout=timeout,
+            )
+        except asyncio.TimeoutError:
+            self._kill(process)
+            await process.wait()
+            return {"success": False, "error": f"Build timeout after {timeout} seconds"}
+        except asyncio.CancelledError:
+            self._kill(process)
+            raise
+
+        return {
+            "success": process.returncode == 0,
+            "returncode": process.returncode,
+            "stdout": "".join(output["stdout"]),
+            "stderr": "".join(output["stderr"]),
+        }
+
+    @staticmethod
+    def _kill(process: asyncio.subprocess.Process):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def record_stats(self, stats: Dict[str, Any]):
+        """Keep per-build statistics (chapters, jobs, seconds) for the status report"""
+        self._history.append(stats)
+
+    def status(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "running": [
+                {"build_id": build_id, "elapsed_seconds": round(now - started, 1)}
+                for build_id, started in self._running.items()
+            ],
+            "queued": [
+                {"build_id": build_id, "position": i + 1}
+                for i, build_id in enumerate(self._queued)
+            ],
+            "average_build_seconds": round(self._average_duration(), 1),
+            "recent_builds": list(self._history),
+        }
+
+
+# Global instance (lazy initialization)
+_build_pool_instance = None
+
+
+def get_build_pool() -> BuildPool:
+    """Get the global build pool (sized by MAX_CONCURRENT_BUILDS / BUILD_QUEUE_SIZE)"""
+    global _build_pool_instance
+    if _build_pool_instance is None:
+        _build_pool_instance = BuildPool(
+            max_concurrent=int(os.getenv("MAX_CONCURRENT_BUILDS", "2")),
+            max_queued=int(os.getenv("BUILD_QUEUE_SIZE", "8")),
+            timeout=int(os.getenv("BUILD_TIMEOUT", "300")),
+        )
+    return _build_pool_instance
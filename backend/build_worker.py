@@ -0,0 +1,359 @@
+"""
+Build Worker for LiquidBooks
+
+A long-lived process that imports Sphinx, jupyter-book and their extensions
+once, then forks a child for every build. Children start with everything
+already imported, so a build skips the seconds of import and setup a fresh
+`jupyter-book` process pays. Each child runs in its own session (process
+group): builds cannot leak state into each other or into the worker, and a
+build is cancelled by killing its group.
+
+The API server talks to the worker over a Unix socket:
+
+    client -> worker   one JSON line: {"book_dir", "builder", "full_rebuild", "jobs", "reexecute", "doctrees"}
+    child  -> client   {"pid": N} line, then the build's output lines
+    worker -> client   RECORD_SEPARATOR + {"returncode": N} line once the child exits
+
+Like book_builder.py, this module must not import the API server (main.py).
+"""
+
+import asyncio
+import importlib
+import json
+import os
+import selectors
+import signal
+import socket
+import sys
+import tempfile
+import time
+import traceback
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from build_pool import STREAM_LIMIT
+
+
+# Imported in the worker before it accepts builds
+PREWARM_MODULES = [
+    "sphinx.application",
+    "sphinx.builders.html",
+    "docutils.parsers.rst",
+    "jupyter_book.sphinx",
+    "jupyter_book.config",
+    "myst_parser",
+    "myst_nb",
+    "nbclient",
+    "jupyter_cache",
+    "sphinx_book_theme",
+    "sphinx_design",
+    "sphinx_togglebutton",
+    "sphinx_copybutton",
+    "sphinx_comments",
+    "sphinx_external_toc",
+    "sphinx_multitoc_numbering",
+    "sphinx_thebe",
+    "sphinx_proof",
+    "sphinx_exercise",
+    "sphinxcontrib.bibtex",
+    "sphinx_jupyterbook_latex",
+    "book_builder",
+]
+
+# Marks the worker's final status line in a build's output stream
+RECORD_SEPARATOR = b"\x1e"
+
+WORKER_SCRIPT = Path(__file__).parent / "build_worker.py"
+
+
+def prewarm() -> int:
+    """Import the build modules, returning how many were available"""
+    loaded = 0
+    for name in PREWARM_MODULES:
+        try:
+            importlib.import_module(name)
+            loaded += 1
+        except Exception:
+            pass
+    return loaded
+
+
+def _run_child(conn: socket.socket, request: Dict[str, Any]):
+    """Body of a forked build process; never returns"""
+    code = 1
+    try:
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        os.setsid()
+
+        conn.settimeout(None)
+        conn.sendall(json.dumps({"pid": os.getpid()}).encode("utf-8") + b"\n")
+        os.dup2(conn.fileno(), 1)
+        os.dup2(conn.fileno(), 2)
+        sys.stdout.reconfigure(line_buffering=True)
+        sys.stderr.reconfigure(line_buffering=True)
+
+        from book_builder import run_build
+
+        code = run_build(
+            Path(request["book_dir"]),
+            builder=request.get("builder", "html"),
+            full_rebuild=bool(request.get("full_rebuild")),
+            jobs=int(request.get("jobs", 1)),
+            reexecute=request.get("reexecute") or [],
+            doctree_dir=Path(request["doctrees"]) if request.get("doctrees") else None,
+        )
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 1
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def serve(socket_path: str):
+    """Accept build requests on socket_path until the API server goes away"""
+    started = time.monotonic()
+    loaded = prewarm()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    os.chmod(socket_path, 0o600)
+    server.listen(16)
+
+    # SIGCHLD wakes the select loop so finished builds are reported at once
+    wakeup_r, wakeup_w = os.pipe()
+    os.set_blocking(wakeup_r, False)
+    os.set_blocking(wakeup_w, False)
+    signal.set_wakeup_fd(wakeup_w)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    # Exit through the cleanup below, which also kills running builds
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    selector = selectors.DefaultSelector()
+    selector.register(server, selectors.EVENT_READ)
+    selector.register(wakeup_r, selectors.EVENT_READ)
+
+    parent_pid = os.getppid()
+    children: Dict[int, socket.socket] = {}
+    print(f"[Build Worker] Ready in {time.monotonic() - started:.1f}s ({loaded} modules imported)", flush=True)
+
+    try:
+        while os.getppid() == parent_pid:
+            for key, _ in selector.select(timeout=1.0):
+                if key.fileobj is server:
+                    conn, _ = server.accept()
+                    _start_build(conn, children)
+                else:
+                    try:
+                        os.read(wakeup_r, 512)
+                    except BlockingIOError:
+                        pass
+            _reap(children)
+    finally:
+        for pid in children:
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        server.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def _start_build(conn: socket.socket, children: Dict[int, socket.socket]):
+    try:
+        conn.settimeout(5)
+        request = json.loads(conn.makefile("rb").readline())
+    except (OSError, ValueError) as e:
+        _send_status(conn, {"returncode": 1, "error": f"Invalid build request: {str(e)}"})
+        conn.close()
+        return
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    try:
+        pid = os.fork()
+    except OSError as e:
+        _send_status(conn, {"returncode": 1, "error": f"Could not start build: {str(e)}"})
+        conn.close()
+        return
+
+    if pid == 0:
+        _run_child(conn, request)
+    children[pid] = conn
+
+
+def _reap(children: Dict[int, socket.socket]):
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        conn = children.pop(pid, None)
+        if conn is not None:
+            _send_status(conn, {"returncode": os.waitstatus_to_exitcode(status)})
+            conn.close()
+
+
+def _send_status(conn: socket.socket, status: Dict[str, Any]):
+    try:
+        conn.sendall(RECORD_SEPARATOR + json.dumps(status).encode("utf-8") + b"\n")
+    except OSError:
+        # The client went away (cancelled build)
+        pass
+
+
+class BuildWorker:
+    """Client side of the warm build worker, used by the API server"""
+
+    def __init__(self, start_timeout: int = 60):
+        self.start_timeout = start_timeout
+        self.socket_path = os.path.join(tempfile.gettempdir(), f"liquidbooks-build-{os.getpid()}.sock")
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._start_lock = asyncio.Lock()
+        self.failed = False
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.returncode is None
+
+    async def ensure_started(self) -> bool:
+        """
+        Start the worker process if it is not running
+
+        Returns:
+            True once the worker accepts builds, False if it could not start
+        """
+        async with self._start_lock:
+            if self.running:
+                return True
+            if self.failed:
+                return False
+
+            self._process = await asyncio.create_subprocess_exec(
+                sys.executable, str(WORKER_SCRIPT), self.socket_path,
+            )
+            deadline = time.monotonic() + self.start_timeout
+            while time.monotonic() < deadline and self.running:
+                try:
+                    _, writer = await asyncio.open_unix_connection(self.socket_path)
+                except OSError:
+                    await asyncio.sleep(0.1)
+                    continue
+                # An empty request is answered with an error and closed
+                writer.close()
+                return True
+
+            print("[Build Worker] Failed to start, builds run as separate processes")
+            self.failed = True
+            self.stop()
+            return False
+
+    def stop(self):
+        if self.running:
+            self._process.terminate()
+
+    async def run(
+        self,
+        request: Dict[str, Any],
+        timeout: int,
+        on_line: Optional[Callable[[str, str], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Run one build in a child forked from the worker
+
+        Args:
+            request: book_dir, builder, full_rebuild, jobs, reexecute and doctrees
+            timeout: Seconds before the build's process group is killed
+            on_line: Called with (stream, line) for each output line as it arrives
+
+        Returns:
+            Dict with 'success', 'returncode', 'stdout', 'stderr' (or 'error'),
+            like BuildPool.run. The build's stderr is merged into stdout.
+        """
+        reader, writer = await asyncio.open_unix_connection(self.socket_path, limit=STREAM_LIMIT)
+        writer.write(json.dumps(request).encode("utf-8") + b"\n")
+        await writer.drain()
+
+        pid = None
+        output = []
+        status: Dict[str, Any] = {}
+
+        async def pump():
+            nonlocal pid, status
+            while True:
+                raw = await reader.readline()
+                if not raw:
+                    return
+                if raw.startswith(RECORD_SEPARATOR):
+                    status = json.loads(raw[1:])
+                    return
+                if pid is None:
+                    pid = json.loads(raw)["pid"]
+                    continue
+                line = raw.decode("utf-8", errors="replace")
+                output.append(line)
+                if on_line is not None:
+                    on_line("stdout", line)
+
+        try:
+            await asyncio.wait_for(pump(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._kill(pid)
+            return {"success": False, "error": f"Build timeout after {timeout} seconds"}
+        except asyncio.CancelledError:
+            self._kill(pid)
+            raise
+        finally:
+            writer.close()
+
+        if "returncode" not in status:
+            return {"success": False, "error": "Build worker exited during the build"}
+        if status.get("error"):
+            return {"success": False, "error": status["error"]}
+        return {
+            "success": status["returncode"] == 0,
+            "returncode": status["returncode"],
+            "stdout": "".join(output),
+            "stderr": "",
+        }
+
+    @staticmethod
+    def _kill(pid: Optional[int]):
+        if pid is None:
+            return
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+# Global instance (lazy initialization)
+_build_worker_instance = None
+
+
+def get_build_worker() -> Optional[BuildWorker]:
+    """Get the global build worker, or None if disabled (BUILD_WORKER=0) or unsupported"""
+    global _build_worker_instance
+    if os.getenv("BUILD_WORKER", "1") == "0" or not hasattr(os, "fork"):
+        return None
+    if _build_worker_instance is None:
+        _build_worker_instance = BuildWorker(start_timeout=int(os.getenv("BUILD_WORKER_START_TIMEOUT", "60")))
+    return _build_worker_instance
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: python build_worker.py SOCKET_PATH", file=sys.stderr)
+        sys.exit(2)
+    serve(sys.argv[1])
@@ -0,0 +1,176 @@
+"""
+Build Workspace Manager for LiquidBooks
+
+Every book gets a persistent build workspace (`<data dir>/builds/<book>`)
+that is reused so rebuilds are incremental. Nothing used to remove them, so
+the disk filled up with workspaces of books nobody builds or downloads any
+more. The manager tracks each workspace's last access (the directory's
+mtime: builds, downloads and deploys touch it) and its size, and a sweep
+
+- removes workspaces not accessed for WORKSPACE_TTL_HOURS, then
+- removes least-recently-used workspaces until all of them fit in
+  WORKSPACE_MAX_MB.
+
+Workspaces being built, or accessed in the last WORKSPACE_MIN_IDLE seconds
+(a download may still be streaming from it), are never removed. A removed
+workspace only costs a full rather than incremental rebuild; finished builds
+stay available from the build cache by build key.
+
+Sizes count the bytes only the workspace holds (asset_store.private_size,
+like the build cache): assets hard-linked from the asset store are shared
+with other builds and not freed by removing it.
+"""
+
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from asset_store import get_asset_store, private_size
+from workspace_store import get_data_dir
+
+
+# Size measured after the last build (next to the emitter's build stamp)
+SIZE_FILE = Path("_build") / ".liquidbooks-size"
+
+
+class BuildWorkspaceManager:
+    """Last-access tracking, TTL expiry and an LRU disk quota for build workspaces"""
+
+    def __init__(self, root: Path, max_bytes: int = 0, ttl_seconds: float = 0, min_idle_seconds: float = 600):
+        self.root = Path(root)
+        self.max_bytes = max_bytes  # 0 = no quota
+        self.ttl_seconds = ttl_seconds  # 0 = never expire
+        self.min_idle_seconds = min_idle_seconds
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.removed = 0
+        self.freed_bytes = 0
+
+    def workspace_of(self, path: Path) -> Optional[Path]:
+        """The workspace a path lies in, or None"""
+        try:
+            relative = Path(path).resolve().relative_to(self.root.resolve())
+        except ValueError:
+            return None
+        return self.root / relative.parts[0] if relative.parts else None
+
+    def touch(self, path: Path) -> bool:
+        """Record an access to the workspace containing path; False if it is not a workspace"""
+        workspace = self.workspace_of(path)
+        if workspace is None or not workspace.is_dir():
+            return False
+        os.utime(workspace)
+        return True
+
+    def record(self, workspace: Path) -> int:
+        """Measure a workspace after a build and mark it accessed; returns its size"""
+        size = private_size(workspace)
+        (workspace / SIZE_FILE).parent.mkdir(exist_ok=True)
+        (workspace / SIZE_FILE).write_text(str(size))
+        os.utime(workspace)
+        return size
+
+    def _workspaces(self) -> List[Dict[str, Any]]:
+        workspaces = []
+        for workspace in self.root.iterdir():
+            if not workspace.is_dir():
+                continue
+            try:
+                size = int((workspace / SIZE_FILE).read_text())
+            except (OSError, ValueError):
+                size = private_size(workspace)
+            workspaces.append({
+                "name": workspace.name,
+                "path": workspace,
+                "size": size,
+                "last_access": workspace.stat().st_mtime,
+            })
+        return sorted(workspaces, key=lambda w: w["last_access"])
+
+    def sweep(self, in_use: Optional[Callable[[Path], bool]] = None) -> Dict[str, Any]:
+        """
+        Remove expired workspaces, then least-recently-used ones over the quota
+
+        Args:
+            in_use: Returns True for workspaces that must be kept (e.g. being built)
+
+        Returns:
+            Dict with 'expired' and 'evicted' (workspace names) and 'freed_bytes'
+        """
+        result = {"expired": [], "evicted": [], "freed_bytes": 0}
+        now = time.time()
+        with self._lock:
+            workspaces = self._workspaces()
+            total = sum(w["size"] for w in workspaces)
+
+            def removable(workspace: Dict[str, Any]) -> bool:
+                try:
+                    # Re-read: a build or download may have started since the listing
+                    last_access = workspace["path"].stat().st_mtime
+                except FileNotFoundError:
+                    return False
+                return now - last_access >= self.min_idle_seconds and not (in_use and in_use(workspace["path"]))
+
+            def remove(workspace: Dict[str, Any], reason: str):
+                nonlocal total
+                shutil.rmtree(workspace["path"], ignore_errors=True)
+                total -= workspace["size"]
+                result[reason].append(workspace["name"])
+                result["freed_bytes"] += workspace["size"]
+
+            for workspace in list(workspaces):
+                if self.ttl_seconds and now - workspace["last_access"] > self.ttl_seconds and removable(workspace):
+                    remove(workspace, "expired")
+                    workspaces.remove(workspace)
+
+            for workspace in workspaces:
+                if not self.max_bytes or total <= self.max_bytes:
+                    break
+                if removable(workspace):
+                    remove(workspace, "evicted")
+
+        if result["expired"] or result["evicted"]:
+            self.removed += len(result["expired"]) + len(result["evicted"])
+            self.freed_bytes += result["freed_bytes"]
+            print(
+                f"[Build Workspaces] Removed {len(result['expired'])} expired and {len(result['evicted'])} "
+                f"least-recently-used workspaces ({result['freed_bytes']} bytes)"
+            )
+            get_asset_store().collect()
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        workspaces = self._workspaces()
+        now = time.time()
+        return {
+            "workspaces": len(workspaces),
+            "size_bytes": sum(w["size"] for w in workspaces),
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "removed": self.removed,
+            "freed_bytes": self.freed_bytes,
+            "items": [
+                {"name": w["name"], "size_bytes": w["size"], "idle_seconds": round(now - w["last_access"])}
+                for w in reversed(workspaces)
+            ],
+        }
+
+
+# Global instance (lazy initialization)
+_workspace_manager_instance = None
+
+
+def get_workspace_manager() -> BuildWorkspaceManager:
+    """Get the global workspace manager (WORKSPACE_MAX_MB, WORKSPACE_TTL_HOURS, WORKSPACE_MIN_IDLE)"""
+    global _workspace_manager_instance
+    if _workspace_manager_instance is None:
+        _workspace_manager_instance = BuildWorkspaceManager(
+            get_data_dir() / "builds",
+            max_bytes=int(os.getenv("WORKSPACE_MAX_MB", "5120")) * 1024 * 1024,
+            ttl_seconds=float(os.getenv("WORKSPACE_TTL_HOURS", "168")) * 3600,
+            min_idle_seconds=float(os.getenv("WORKSPACE_MIN_IDLE", "600")),
+        )
+    return _workspace_manager_instance
@@ -0,0 +1,185 @@
+"""
+Chapter Preview for LiquidBooks
+
+Renders a single chapter's MyST markdown to an HTML fragment with
+myst-parser's docutils renderer, without a Sphinx build. The MyST syntax
+extensions match what generate_config_yml enables for the same features.
+
+Directives and roles that only exist in Sphinx extensions (tabs, grids,
+cards, dropdowns, proofs, exercises, cross-references, citations, ...) are
+rendered by generic fallbacks: a <div> carrying the directive name as a class
+with its content parsed as MyST, or the role's text in a <span>. The preview
+is therefore close to, but not identical with, the built book.
+"""
+
+import copy
+import io
+import re
+import time
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional
+
+from docutils import nodes
+from docutils.core import publish_parts
+from docutils.frontend import get_default_settings
+from docutils.parsers.rst import Directive, directives, roles
+from docutils.writers.html5_polyglot import Writer
+from myst_parser.parsers.docutils_ import Parser
+
+from book_features import EXTENSION_DIRECTIVES, EXTENSION_ROLES, SPHINX_DIRECTIVES, SPHINX_ROLES, myst_extensions
+
+
+# Same MathJax as the built book; math is emitted as \( \) / \[ \] for it
+MATHJAX_URL = "https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js"
+
+# Sphinx-only directives whose content is code, rendered as literal blocks
+FALLBACK_CODE_DIRECTIVES = ["code-cell", "raw-cell", "mermaid", "literalinclude", "highlight"]
+
+# Other Sphinx-only directives, rendered as containers of parsed content
+FALLBACK_CONTAINER_DIRECTIVES = [
+    name
+    for name in SPHINX_DIRECTIVES + [name for names in EXTENSION_DIRECTIVES.values() for name in names]
+    if name not in FALLBACK_CODE_DIRECTIVES and name not in ("code-block", "sourcecode")  # handled by MyST
+]
+
+# Sphinx-only roles, rendered as their text
+FALLBACK_ROLES = SPHINX_ROLES + [name for names in EXTENSION_ROLES.values() for name in names]
+
+# "Link text <target>" -> "Link text"
+EXPLICIT_TARGET = re.compile(r"^(.+?)\s*<[^<>]+>$", re.DOTALL)
+
+
+class _AnyOption(dict):
+    """Option spec accepting every option as a plain string"""
+
+    def __bool__(self):
+        # MyST only parses a directive's option block if it has an option spec
+        return True
+
+    def __contains__(self, key):
+        return True
+
+    def __getitem__(self, key):
+        return directives.unchanged
+
+    def get(self, key, default=None):
+        return directives.unchanged
+
+
+def _record_fallback(document: nodes.document, name: str):
+    fallbacks = getattr(document.settings, "preview_fallbacks", None)
+    if fallbacks is not None and name not in fallbacks:
+        fallbacks.append(name)
+
+
+class FallbackContainer(Directive):
+    """Sphinx-only directive rendered as a <div> with its content parsed"""
+
+    optional_arguments = 1
+    final_argument_whitespace = True
+    has_content = True
+    option_spec = _AnyOption()
+
+    def run(self):
+        _record_fallback(self.state.document, self.name)
+        container = nodes.container(classes=["preview-fallback", self.name.replace(":", "-")])
+        if self.arguments:
+            title = nodes.paragraph(classes=["preview-fallback-title"])
+            text_nodes, messages = self.state.inline_text(self.arguments[0], self.lineno)
+            title.extend(text_nodes)
+            container += title
+            container.extend(messages)
+        if self.content:
+            self.state.nested_parse(self.content, self.content_offset, container)
+        return [container]
+
+
+class FallbackCode(Directive):
+    """Sphinx-only code directive rendered as a literal block"""
+
+    optional_arguments = 1
+    final_argument_whitespace = True
+    has_content = True
+    option_spec = _AnyOption()
+
+    def run(self):
+        _record_fallback(self.state.document, self.name)
+        language = self.arguments[0] if self.arguments else ""
+        code = "\n".join(self.content)
+        block = nodes.literal_block(code, code, classes=["code", language, self.name] if language else ["code", self.name])
+        return [block]
+
+
+def fallback_role(name, rawtext, text, lineno, inliner, options=None, content=None):
+    """Sphinx-only role rendered as its (link) text"""
+    _record_fallback(inliner.document, f"{{{name}}}")
+    match = EXPLICIT_TARGET.match(text)
+    label = match.group(1) if match else text
+    return [nodes.inline(rawtext, label, classes=["preview-fallback", name.replace(":", "-")])], []
+
+
+def _register_fallbacks():
+    for name in FALLBACK_CONTAINER_DIRECTIVES:
+        directives.register_directive(name, FallbackContainer)
+    for name in FALLBACK_CODE_DIRECTIVES:
+        directives.register_directive(name, FallbackCode)
+    for name in FALLBACK_ROLES:
+        roles.register_local_role(name, fallback_role)
+
+
+_register_fallbacks()
+
+
+@lru_cache(maxsize=64)
+def _preview_settings(extensions: FrozenSet[str]):
+    """docutils settings for one set of MyST extensions (built once per set)"""
+    settings = get_default_settings(Parser, Writer)
+    settings.myst_enable_extensions = set(extensions)
+    settings.myst_heading_anchors = 3
+    settings.doctitle_xform = False
+    settings.initial_header_level = 1
+    settings.math_output = f"MathJax {MATHJAX_URL}"
+    settings.report_level = 2  # warnings and up
+    settings.halt_level = 5  # never abort
+    settings.syntax_highlight = "short"
+    settings.embed_stylesheet = False
+    # Chapters come from API callers: no include/raw/csv-table :file: reads of server files
+    settings.file_insertion_enabled = False
+    settings.raw_enabled = False
+    return settings
+
+
+def render_preview(content: str, features: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Render one chapter's MyST markdown to HTML
+
+    Args:
+        content: Chapter markdown
+        features: Enabled feature ids (as for the book build)
+
+    Returns:
+        Dict with 'html' (body fragment), 'warnings', 'fallbacks' (Sphinx-only
+        directives/roles rendered approximately), 'myst_extensions' and
+        'render_ms'
+    """
+    started = time.perf_counter()
+    extensions = myst_extensions(features or [])
+
+    settings = copy.copy(_preview_settings(frozenset(extensions)))
+    settings.warning_stream = io.StringIO()
+    settings.preview_fallbacks = []
+
+    parts = publish_parts(content, parser=Parser(), writer=Writer(), settings=settings)
+
+    warnings = [
+        line for line in settings.warning_stream.getvalue().splitlines()
+        if line.strip()
+    ]
+    return {
+        "html": parts["body"],
+        "warnings": warnings,
+        "fallbacks": settings.preview_fallbacks,
+        "myst_extensions": extensions,
+        "mathjax_url": MATHJAX_URL,
+        "render_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
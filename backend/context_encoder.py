@@ -0,0 +1,204 @@
+"""
+Context Encoder for LiquidBooks
+
+Renders structured prompt context (avatars, brand identity, diary entries,
+offer details) compactly. Pretty-printed JSON spends a large share of its
+tokens on indentation, quotes and escaped newlines; this encoder emits either
+minified JSON or a terse YAML-like form, can prune fields, and replaces
+sub-objects already sent earlier in the same prompt with a short reference.
+"""
+
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+from prompt_builder import estimate_tokens
+
+
+ENCODING_STYLES = ("yaml", "json")
+
+# Sub-objects/strings at least this long (in characters) are deduplicated
+DEDUPE_MIN_CHARS = 200
+
+# Lists of short scalars up to this length are written inline
+INLINE_LIST_CHARS = 100
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+
+def _scalar(value: Any) -> str:
+    """Render a scalar for the terse form (quotes only where needed)"""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    text = str(value)
+    if text != text.strip() or text[:1] in "-[{#&*!|>'\"%@`" or ": " in text:
+        return json.dumps(text, ensure_ascii=False)
+    return text
+
+
+class ContextEncoder:
+    """
+    Encodes one prompt's worth of structured context blocks
+
+    Create one encoder per prompt and call encode() for each block, so that
+    repeated sections across blocks are only sent once. stats() reports the
+    tokens saved relative to json.dumps(..., indent=2).
+    """
+
+    def __init__(
+        self,
+        style: Optional[str] = None,
+        prune_fields: Optional[Iterable[str]] = None,
+        drop_empty: bool = True,
+        dedupe: bool = True,
+    ):
+        """
+        Args:
+            style: 'yaml' (terse YAML-like) or 'json' (minified). Defaults to
+                the CONTEXT_ENCODING environment variable, then 'yaml'
+            prune_fields: Keys to drop. Bare keys ('day_in_the_life') match at
+                any depth; dotted paths ('who_are_they.gender') match exactly
+            drop_empty: Omit null/empty values
+            dedupe: Replace repeated sub-objects with a reference
+        """
+        self.style = (style or os.getenv("CONTEXT_ENCODING", "yaml")).lower()
+        if self.style not in ENCODING_STYLES:
+            raise ValueError(f"Unsupported context encoding: {self.style}")
+        self.prune_fields = set(prune_fields or [])
+        self.drop_empty = drop_empty
+        self.dedupe = dedupe
+
+        self._seen: Dict[str, str] = {}
+        self._original_tokens = 0
+        self._encoded_tokens = 0
+        self._blocks = 0
+
+    def encode(self, label: str, data: Any) -> str:
+        """
+        Encode one context block
+
+        Args:
+            label: Name of the block, used in dedupe references (e.g. 'AVATAR')
+            data: JSON-compatible data
+
+        Returns:
+            Compact text rendering of data
+        """
+        cleaned = self._clean(data, [])
+        if self.dedupe:
+            cleaned = self._dedupe(cleaned, label, [])
+        if isinstance(cleaned, str):
+            text = cleaned
+        elif self.style == "json":
+            text = json.dumps(cleaned, ensure_ascii=False, separators=(",", ":"))
+        else:
+            text = "\n".join(self._terse_lines(cleaned, 0))
+
+        self._original_tokens += estimate_tokens(json.dumps(data, indent=2))
+        self._encoded_tokens += estimate_tokens(text)
+        self._blocks += 1
+        return text
+
+    def stats(self) -> Dict[str, Any]:
+        """Token usage of the encoded blocks versus indented JSON"""
+        saved = self._original_tokens - self._encoded_tokens
+        return {
+            "style": self.style,
+            "blocks": self._blocks,
+            "original_tokens": self._original_tokens,
+            "encoded_tokens": self._encoded_tokens,
+            "saved_tokens": saved,
+            "saved_percent": round(100 * saved / self._original_tokens, 1) if self._original_tokens else 0.0,
+        }
+
+    def log_stats(self, call_name: str):
+        """Print the savings for a call in the server log"""
+        stats = self.stats()
+        print(
+            f"[Context Encoder] {call_name}: {stats['original_tokens']} -> {stats['encoded_tokens']} tokens "
+            f"({stats['saved_percent']}% saved, {stats['style']})"
+        )
+
+    def _pruned(self, key: str, path: List[str]) -> bool:
+        return key in self.prune_fields or ".".join(path + [key]) in self.prune_fields
+
+    def _clean(self, value: Any, path: List[str]) -> Any:
+        """Prune fields and drop empty values recursively"""
+        if isinstance(value, dict):
+            return {
+                key: self._clean(item, path + [str(key)])
+                for key, item in value.items()
+                if not self._pruned(str(key), path) and not (self.drop_empty and _is_empty(item))
+            }
+        if isinstance(value, list):
+            return [self._clean(item, path) for item in value if not (self.drop_empty and _is_empty(item))]
+        return value
+
+    def _dedupe(self, value: Any, label: str, path: List[str]) -> Any:
+        """Replace sub-objects seen earlier with a reference, outermost first"""
+        if not isinstance(value, (dict, list, str)):
+            return value
+
+        canonical = value if isinstance(value, str) else json.dumps(value, sort_keys=True, ensure_ascii=False)
+        if len(canonical) >= DEDUPE_MIN_CHARS:
+            digest = hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+            if digest in self._seen:
+                return f"(same as {self._seen[digest]})"
+            self._seen[digest] = ".".join([label] + path)
+
+        if isinstance(value, dict):
+            return {key: self._dedupe(item, label, path + [str(key)]) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._dedupe(item, label, path + [str(i)]) for i, item in enumerate(value)]
+        return value
+
+    def _terse_lines(self, value: Any, depth: int) -> List[str]:
+        """Render a value as indented YAML-like lines"""
+        pad = " " * depth
+        lines = []
+
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if isinstance(item, (dict, list)) and item:
+                    inline = self._inline_list(item)
+                    if inline is not None:
+                        lines.append(f"{pad}{key}: {inline}")
+                    else:
+                        lines.append(f"{pad}{key}:")
+                        lines.extend(self._terse_lines(item, depth + 1))
+                elif isinstance(item, str) and "\n" in item:
+                    lines.append(f"{pad}{key}: |")
+                    lines.extend(f"{pad} {line}" for line in item.splitlines())
+                else:
+                    lines.append(f"{pad}{key}: {_scalar(item)}")
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, (dict, list)) and item:
+                    nested = self._terse_lines(item, depth + 2)
+                    lines.append(f"{pad}- {nested[0].lstrip()}")
+                    lines.extend(nested[1:])
+                elif isinstance(item, str) and "\n" in item:
+                    lines.append(f"{pad}- |")
+                    lines.extend(f"{pad}  {line}" for line in item.splitlines())
+                else:
+                    lines.append(f"{pad}- {_scalar(item)}")
+        else:
+            lines.append(f"{pad}{_scalar(value)}")
+
+        return lines
+
+    def _inline_list(self, value: Any) -> Optional[str]:
+        """Short lists of plain scalars are written as [a, b, c]"""
+        if not isinstance(value, list):
+            return None
+        if any(isinstance(item, (dict, list)) or (isinstance(item, str) and ("\n" in item or "," in item)) for item in value):
+            return None
+        inline = "[" + ", ".join(_scalar(item) for item in value) + "]"
+        return inline if len(inline) <= INLINE_LIST_CHARS else None
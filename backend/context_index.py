@@ -0,0 +1,327 @@
+"""
+Chapter Retrieval Index for LiquidBooks
+
+Offline BM25 index over chunked chapter content. Prompt builders use it to pull
+the few passages from other chapters that are relevant to the chapter being
+written or reviewed, instead of pasting truncated raw chapter text.
+No external embedding service is needed.
+"""
+
+import hashlib
+import math
+import os
+import re
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from prompt_builder import estimate_tokens
+from context_packing import split_myst_blocks
+
+
+# Words that carry no retrieval signal in book prose
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "do", "for",
+    "from", "has", "have", "how", "if", "in", "into", "is", "it", "its", "not",
+    "of", "on", "or", "our", "so", "such", "that", "the", "their", "then",
+    "there", "these", "they", "this", "to", "was", "we", "what", "when",
+    "which", "will", "with", "you", "your",
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9_'-]*")
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*)$")
+
+
+@dataclass
+class Passage:
+    """A chunk of chapter content returned by the index"""
+    chapter_number: int
+    chapter_title: str
+    heading: str
+    text: str
+    tokens: int
+    score: float = 0.0
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stopwords removed"""
+    return [
+        token for token in TOKEN_PATTERN.findall(text.lower())
+        if token not in STOPWORDS and len(token) > 1
+    ]
+
+
+def chunk_chapter(content: str, chunk_tokens: int = 300) -> List[Tuple[str, str]]:
+    """
+    Group a chapter's blocks into chunks of roughly chunk_tokens tokens
+
+    Chunks never cross a heading, so every passage keeps its section title.
+
+    Returns:
+        List of (heading, text) pairs
+    """
+    chunks = []
+    heading = ""
+    current_heading = None
+    current: List[str] = []
+    current_tokens = 0
+
+    for block in split_myst_blocks(content):
+        heading_match = HEADING_PATTERN.match(block)
+        if heading_match:
+            heading = heading_match.group(2).strip()
+            continue
+        block_tokens = estimate_tokens(block)
+        if current and (heading != current_heading or current_tokens + block_tokens > chunk_tokens):
+            chunks.append((current_heading or "", "\n\n".join(current)))
+            current = []
+            current_tokens = 0
+        current_heading = heading
+        current.append(block)
+        current_tokens += block_tokens
+
+    if current:
+        chunks.append((current_heading or "", "\n\n".join(current)))
+
+    return chunks
+
+
+class ChapterIndex:
+    """
+    Incremental BM25 index over the chunked chapters of one book
+
+    Chapters can be added (or replaced) one at a time as they are generated;
+    only the affected chapter is re-chunked.
+    """
+
+    def __init__(self, chunk_tokens: int = 300, k1: float = 1.5, b: float = 0.75):
+        self.chunk_tokens = chunk_tokens
+        self.k1 = k1
+        self.b = b
+
+        self._passages: Dict[int, Passage] = {}
+        self._lengths: Dict[int, int] = {}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._chapter_chunks: Dict[int, List[int]] = {}
+        self._chapter_hashes: Dict[int, str] = {}
+        self._total_length = 0
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self._passages)
+
+    @property
+    def chapter_numbers(self) -> List[int]:
+        return sorted(self._chapter_chunks)
+
+    def add_chapter(self, chapter_number: int, title: str, content: str) -> int:
+        """
+        Index a chapter, replacing any previous version of it
+
+        Args:
+            chapter_number: Chapter number (unique within the book)
+            title: Chapter title
+            content: Chapter content in MyST Markdown
+
+        Returns:
+            Number of chunks indexed for the chapter
+        """
+        content_hash = hashlib.sha256(f"{title}\n{content}".encode("utf-8")).hexdigest()
+        if self._chapter_hashes.get(chapter_number) == content_hash:
+            return len(self._chapter_chunks[chapter_number])
+
+        self.remove_chapter(chapter_number)
+
+        chunk_ids = []
+        for heading, text in chunk_chapter(content, self.chunk_tokens):
+            terms = Counter(tokenize(f"{heading} {text}"))
+            if not terms:
+                continue
+
+            chunk_id = self._next_id
+            self._next_id += 1
+
+            self._passages[chunk_id] = Passage(
+                chapter_number=chapter_number,
+                chapter_title=title,
+                heading=heading,
+                text=text,
+                tokens=estimate_tokens(text),
+            )
+            length = sum(terms.values())
+            self._lengths[chunk_id] = length
+            self._total_length += length
+            for term, count in terms.items():
+                self._postings.setdefault(term, {})[chunk_id] = count
+            chunk_ids.append(chunk_id)
+
+        self._chapter_chunks[chapter_number] = chunk_ids
+        self._chapter_hashes[chapter_number] = content_hash
+        return len(chunk_ids)
+
+    def remove_chapter(self, chapter_number: int):
+        """Drop a chapter and all of its chunks from the index"""
+        for chunk_id in self._chapter_chunks.pop(chapter_number, []):
+            passage = self._passages.pop(chunk_id)
+            self._total_length -= self._lengths.pop(chunk_id)
+            for term in set(tokenize(f"{passage.heading} {passage.text}")):
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._chapter_hashes.pop(chapter_number, None)
+
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        exclude_chapters: Optional[Iterable[int]] = None,
+        only_chapters: Optional[Iterable[int]] = None,
+    ) -> List[Passage]:
+        """
+        Rank chunks against a query with BM25
+
+        Args:
+            query: Free-text query
+            k: Maximum number of passages to return
+            exclude_chapters: Chapter numbers to leave out
+            only_chapters: If given, restrict results to these chapter numbers
+
+        Returns:
+            Passages ordered by descending score
+        """
+        if not self._passages:
+            return []
+
+        excluded: Set[int] = set(exclude_chapters or [])
+        allowed: Optional[Set[int]] = set(only_chapters) if only_chapters is not None else None
+
+        num_chunks = len(self._passages)
+        avg_length = self._total_length / num_chunks if num_chunks else 0
+        scores: Dict[int, float] = {}
+
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (num_chunks - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, tf in postings.items():
+                chapter_number = self._passages[chunk_id].chapter_number
+                if chapter_number in excluded or (allowed is not None and chapter_number not in allowed):
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[chunk_id] / avg_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        results = []
+        for chunk_id, score in ranked:
+            passage = self._passages[chunk_id]
+            results.append(Passage(
+                chapter_number=passage.chapter_number,
+                chapter_title=passage.chapter_title,
+                heading=passage.heading,
+                text=passage.text,
+                tokens=passage.tokens,
+                score=score,
+            ))
+        return results
+
+    def retrieve(
+        self,
+        query: str,
+        token_budget: int,
+        k: int = 5,
+        exclude_chapters: Optional[Iterable[int]] = None,
+        only_chapters: Optional[Iterable[int]] = None,
+    ) -> List[Passage]:
+        """
+        Top-k passages for a query that together fit in token_budget
+
+        Passages that would overflow the budget are skipped in favour of
+        smaller, lower-ranked ones. The result is in book order.
+        """
+        selected = []
+        used = 0
+        for passage in self.search(query, k=k * 3, exclude_chapters=exclude_chapters, only_chapters=only_chapters):
+            if len(selected) >= k:
+                break
+            if used + passage.tokens > token_budget:
+                continue
+            selected.append(passage)
+            used += passage.tokens
+
+        return sorted(selected, key=lambda p: p.chapter_number)
+
+
+def build_chapter_index(chapters: List[Dict[str, Any]], chunk_tokens: int = 300) -> ChapterIndex:
+    """
+    Build an index from request-style chapter dicts
+
+    Args:
+        chapters: Dicts with 'chapter_number', 'title' and 'content'
+        chunk_tokens: Target chunk size in tokens
+
+    Returns:
+        Populated ChapterIndex
+    """
+    index = ChapterIndex(chunk_tokens=chunk_tokens)
+    for i, chapter in enumerate(chapters):
+        index.add_chapter(
+            chapter.get('chapter_number', i + 1),
+            chapter.get('title', ''),
+            chapter.get('content', '') or '',
+        )
+    return index
+
+
+def query_for_chapter(title: str, content: str = "", extra: str = "", max_terms: int = 30) -> str:
+    """
+    Build a retrieval query describing a chapter
+
+    Uses the title, section headings and the most frequent content terms,
+    so the query stays short however long the chapter is.
+    """
+    headings = [match.group(2) for match in map(HEADING_PATTERN.match, content.splitlines()) if match]
+    frequent = [term for term, _ in Counter(tokenize(content)).most_common(max_terms)]
+    return " ".join([title, extra, " ".join(headings), " ".join(frequent)])
+
+
+def format_passages(passages: List[Passage]) -> str:
+    """Render retrieved passages as a prompt section"""
+    sections = []
+    for passage in passages:
+        location = f"Chapter {passage.chapter_number}: {passage.chapter_title}"
+        if passage.heading and passage.heading != passage.chapter_title:
+            location += f" > {passage.heading}"
+        sections.append(f"[{location}]\n{passage.text}")
+    return "\n\n".join(sections)
+
+
+# Per-book indexes that grow as chapters are generated (lazy, in-memory),
+# least recently used first; the oldest are dropped beyond MAX_BOOK_INDEXES
+MAX_BOOK_INDEXES = int(os.getenv("MAX_BOOK_INDEXES", "64"))
+_book_indexes: "OrderedDict[str, ChapterIndex]" = OrderedDict()
+
+
+def get_book_index(book_key: Optional[str]) -> Optional[ChapterIndex]:
+    """
+    Get (or create) the incremental index for a book
+
+    Args:
+        book_key: Unique book or workspace id. Titles are not unique across
+            users, so without an id the book gets no index.
+
+    Returns:
+        The book's index, or None if book_key is empty
+    """
+    if not book_key:
+        return None
+    if book_key in _book_indexes:
+        _book_indexes.move_to_end(book_key)
+    else:
+        _book_indexes[book_key] = ChapterIndex()
+        while len(_book_indexes) > MAX_BOOK_INDEXES:
+            _book_indexes.popitem(last=False)
+    return _book_indexes[book_key]
@@ -0,0 +1,276 @@
+"""
+Context Packing for LiquidBooks
+
+Fits prompt context into a per-call token budget. Text is cut at MyST block
+boundaries (never mid-word or inside a code fence) and whatever does not fit is
+replaced by an extractive summary. Several sections can be packed together by
+priority so that the most important context always survives.
+"""
+
+import json
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from prompt_builder import estimate_tokens
+
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*)$")
+FENCE_PATTERN = re.compile(r"^\s*(`{3,}|:{3,})")
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(*_])")
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+
+SUMMARY_MARKER = "*Summary of the remaining content:*"
+
+# Sections left with less room than this are dropped instead of squeezed
+MIN_SECTION_TOKENS = 20
+
+
+@dataclass
+class ContextSection:
+    """One named piece of prompt context"""
+    name: str
+    text: str
+    priority: int = 0  # Higher priority sections are packed first
+    max_tokens: Optional[int] = None  # Optional cap for this section
+    summarize: bool = True  # Summarize overflow instead of dropping it
+
+
+def split_myst_blocks(content: str) -> List[str]:
+    """
+    Split MyST Markdown into top-level blocks
+
+    Blocks are separated by blank lines. Headings are blocks of their own, and
+    fenced code blocks and ``:::`` directives are kept whole even when they
+    contain blank lines.
+    """
+    blocks = []
+    current: List[str] = []
+    fence: Optional[str] = None
+
+    def flush():
+        if current and any(line.strip() for line in current):
+            blocks.append("\n".join(current).strip("\n"))
+        current.clear()
+
+    for line in content.splitlines():
+        fence_match = FENCE_PATTERN.match(line)
+        if fence is not None:
+            current.append(line)
+            if fence_match and fence_match.group(1)[0] == fence[0] and len(fence_match.group(1)) >= len(fence):
+                if line.strip() == fence_match.group(1):
+                    fence = None
+                    flush()
+            continue
+
+        if fence_match:
+            flush()
+            fence = fence_match.group(1)
+            current.append(line)
+            continue
+
+        if HEADING_PATTERN.match(line):
+            flush()
+            blocks.append(line.strip())
+            continue
+
+        if not line.strip():
+            flush()
+        else:
+            current.append(line)
+
+    flush()
+    return blocks
+
+
+def _is_prose(block: str) -> bool:
+    """True for paragraph-like blocks that can feed a summary"""
+    first = block.lstrip()
+    return not (
+        FENCE_PATTERN.match(first)
+        or HEADING_PATTERN.match(first)
+        or first.startswith(("|", "<", "$$", "(", "---"))
+    )
+
+
+def summarize_blocks(blocks: List[str], token_budget: int) -> str:
+    """
+    Extractive summary of blocks within token_budget
+
+    Sentences are scored by how many of the passage's frequent terms they
+    contain, the best ones are kept, and they are returned in original order.
+    """
+    if token_budget <= 0:
+        return ""
+
+    sentences = []
+    for block in blocks:
+        if not _is_prose(block):
+            continue
+        text = " ".join(line.strip().lstrip("-*>0123456789. ") for line in block.splitlines())
+        for position, sentence in enumerate(SENTENCE_SPLIT.split(text)):
+            sentence = sentence.strip()
+            if sentence:
+                sentences.append((sentence, position))
+
+    if not sentences:
+        return ""
+
+    frequencies = Counter(
+        word for sentence, _ in sentences
+        for word in WORD_PATTERN.findall(sentence.lower()) if len(word) > 3
+    )
+
+    def score(item):
+        sentence, position = item
+        words = [w for w in WORD_PATTERN.findall(sentence.lower()) if len(w) > 3]
+        if not words:
+            return 0.0
+        lead_bonus = 1.5 if position == 0 else 1.0
+        return lead_bonus * sum(frequencies[w] for w in words) / len(words) ** 0.5
+
+    ranked = sorted(range(len(sentences)), key=lambda i: score(sentences[i]), reverse=True)
+    chosen = set()
+    used = 0
+    for i in ranked:
+        tokens = estimate_tokens(sentences[i][0]) + 1
+        if used + tokens > token_budget:
+            continue
+        chosen.add(i)
+        used += tokens
+
+    return " ".join(sentences[i][0] for i in sorted(chosen))
+
+
+def _is_json(text: str) -> bool:
+    """Whether text is a JSON object or array (e.g. an encoded context block)"""
+    stripped = text.strip()
+    if not stripped or stripped[0] not in "[{":
+        return False
+    try:
+        json.loads(stripped)
+    except ValueError:
+        return False
+    return True
+
+
+def _truncate_block(block: str, token_budget: int) -> str:
+    """
+    Cut a single oversized block at a line (or word) boundary
+
+    Truncated code fences and directives are closed again so the result is
+    still valid MyST; if not even one line of their body fits with the
+    closing fence, the block is dropped (empty string).
+    """
+    max_chars = token_budget * 4
+    fence_match = FENCE_PATTERN.match(block)
+    closing = ""
+    if fence_match:
+        closing = "\n" + fence_match.group(1).strip()
+        max_chars -= len(closing)
+
+    kept: List[str] = []
+    length = 0
+    for line in block.splitlines():
+        if length + len(line) + 1 > max_chars:
+            break
+        kept.append(line)
+        length += len(line) + 1
+
+    if closing:
+        # The opening fence line alone would leave an unclosed directive
+        return "\n".join(kept) + closing if len(kept) > 1 else ""
+
+    if kept:
+        text = "\n".join(kept)
+    else:
+        cut = block[:max(max_chars, 0)]
+        text = cut.rsplit(None, 1)[0] if " " in cut else cut
+    return text + " …"
+
+
+def fit_text(text: str, token_budget: int, summarize: bool = True) -> str:
+    """
+    Fit text into token_budget
+
+    Leading blocks are kept verbatim; if the text does not fit, the overflow
+    is replaced with an extractive summary (or dropped when summarize is False).
+    JSON is never cut: it is returned whole or, if it does not fit, dropped.
+
+    Args:
+        text: MyST Markdown or plain text
+        token_budget: Maximum tokens for the result
+        summarize: Summarize the overflow instead of dropping it
+
+    Returns:
+        Text that fits in the budget
+    """
+    if not text or token_budget <= 0:
+        return ""
+    if estimate_tokens(text) <= token_budget:
+        return text
+    if _is_json(text):
+        return ""
+
+    blocks = split_myst_blocks(text)
+    marker_tokens = estimate_tokens(SUMMARY_MARKER) + 2
+    summary_reserve = token_budget // 4 if summarize else 0
+    lead_budget = token_budget - summary_reserve
+
+    kept: List[str] = []
+    used = 0
+    for block in blocks:
+        tokens = estimate_tokens(block) + 1
+        if used + tokens > lead_budget:
+            break
+        kept.append(block)
+        used += tokens
+
+    overflow = blocks[len(kept):]
+    if not kept and overflow:
+        truncated = _truncate_block(overflow[0], lead_budget)
+        overflow = overflow[1:]
+        if truncated:
+            kept.append(truncated)
+            used = estimate_tokens(truncated) + 1
+
+    if summarize and overflow:
+        summary = summarize_blocks(overflow, token_budget - used - marker_tokens)
+        if summary:
+            kept.append(f"{SUMMARY_MARKER} {summary}")
+
+    return "\n\n".join(kept)
+
+
+def remaining_budget(token_budget: int, *fixed_texts: str) -> int:
+    """Tokens left for context once the fixed prompt text is accounted for"""
+    return max(0, token_budget - sum(estimate_tokens(text or "") for text in fixed_texts))
+
+
+def pack_sections(sections: List[ContextSection], token_budget: int) -> Dict[str, str]:
+    """
+    Pack sections into a shared token budget by priority
+
+    Sections are visited from highest to lowest priority; each one takes as
+    much of the remaining budget as it needs (up to its max_tokens), and is
+    cut and summarized with fit_text when it does not fit.
+
+    Returns:
+        Dict of section name to packed text, in the original section order.
+        Sections that got no room map to an empty string.
+    """
+    packed: Dict[str, str] = {section.name: "" for section in sections}
+    remaining = token_budget
+
+    for section in sorted(sections, key=lambda s: s.priority, reverse=True):
+        if not section.text:
+            continue
+        room = remaining if section.max_tokens is None else min(remaining, section.max_tokens)
+        if room < MIN_SECTION_TOKENS:
+            continue
+        text = fit_text(section.text, room, summarize=section.summarize)
+        packed[section.name] = text
+        remaining -= estimate_tokens(text)
+
+    return packed
@@ -0,0 +1,204 @@
+"""
+Deploy Queue for LiquidBooks
+
+Runs deploys as a background stage after the build, so the build request
+returns as soon as the book is built instead of waiting on GitHub. Each
+deploy gets an id whose progress, attempts and final URL can be polled.
+
+Deploys run in worker threads (the deploy functions block on git and HTTP),
+at most DEPLOY_CONCURRENCY at once, and deploys to the same target run one
+after the other so their pushes do not race. A deploy that fails with a
+transient error (network trouble, GitHub 5xx, a push that lost a race) is
+retried with exponential backoff, up to DEPLOY_MAX_ATTEMPTS attempts.
+
+A deploy names the build directory it reads; while it is queued or running,
+in_use reports that directory so workspace sweeps and build cache eviction
+keep it.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set
+
+
+# Finished deploys kept for status polling
+MAX_FINISHED_DEPLOYS = 100
+
+# Progress messages kept per deploy
+MAX_PROGRESS_MESSAGES = 50
+
+
+@dataclass
+class DeployJob:
+    """State of one deploy (credentials stay in the queued callable, never here)"""
+    deploy_id: str
+    artifact_id: str  # Build key of the deployed build
+    target: str  # e.g. "owner/repo", deploys to one target are serialized
+    artifact_dir: Optional[str] = None  # Build directory the deploy reads (resolved)
+    status: str = "queued"  # queued, running, retrying, succeeded, failed
+    attempts: int = 0
+    url: Optional[str] = None
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    progress: List[Dict[str, Any]] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def report(self, message: str):
+        """Record a progress message (callable from the deploy thread)"""
+        self.progress.append({"t": round(time.time() - self.created_at, 2), "message": message})
+        del self.progress[:-MAX_PROGRESS_MESSAGES]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "deploy_id": self.deploy_id,
+            "artifact_id": self.artifact_id,
+            "target": self.target,
+            "status": self.status,
+            "attempts": self.attempts,
+            "url": self.url,
+            "error": self.error,
+            "result": self.result,
+            "progress": list(self.progress),
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class DeployQueue:
+    """Background deploys with per-target ordering and retries"""
+
+    def __init__(self, max_concurrent: int = 2, max_attempts: int = 3, retry_delay: float = 5.0):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._target_locks: Dict[str, asyncio.Lock] = {}
+        self._jobs: "OrderedDict[str, DeployJob]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def submit(
+        self,
+        artifact_id: str,
+        target: str,
+        deploy: Callable[[DeployJob], Dict[str, Any]],
+        artifact_dir: Optional[Path] = None,
+    ) -> DeployJob:
+        """
+        Queue a deploy and return immediately
+
+        Args:
+            artifact_id: Build key of the build being deployed
+            target: Deploy target; deploys to one target never overlap
+            deploy: Blocking function run in a worker thread with the job (for
+                progress reports). Returns a dict with 'success', 'url' or
+                'error', and 'retryable' for failures worth another attempt.
+            artifact_dir: Build directory the deploy reads, kept until it finishes
+
+        Returns:
+            The queued job
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        job = DeployJob(
+            deploy_id=uuid.uuid4().hex,
+            artifact_id=artifact_id,
+            target=target,
+            artifact_dir=str(Path(artifact_dir).resolve()) if artifact_dir else None,
+        )
+        job.report("Queued")
+        self._jobs[job.deploy_id] = job
+
+        task = asyncio.create_task(self._run(job, deploy))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, deploy_id: str) -> Optional[DeployJob]:
+        return self._jobs.get(deploy_id)
+
+    def in_use(self, path: Path) -> bool:
+        """Whether a queued or running deploy reads a build directory (callable from any thread)"""
+        path = str(Path(path).resolve())
+        return any(job.artifact_dir == path for job in list(self._jobs.values()) if not job.finished)
+
+    async def _run(self, job: DeployJob, deploy: Callable[[DeployJob], Dict[str, Any]]):
+        lock = self._target_locks.setdefault(job.target, asyncio.Lock())
+        try:
+            async with lock, self._semaphore:
+                while True:
+                    job.attempts += 1
+                    job.status = "running"
+                    job.report(f"Attempt {job.attempts} of {self.max_attempts}")
+                    try:
+                        result = await asyncio.to_thread(deploy, job)
+                    except Exception as e:
+                        result = {"success": False, "error": str(e), "retryable": False}
+
+                    if result.get("success"):
+                        job.status = "succeeded"
+                        job.url = result.get("url")
+                        job.result = {k: v for k, v in result.items() if k not in ("success", "url")}
+                        job.report(result.get("message") or "Deployed")
+                        break
+
+                    job.error = result.get("error") or "Deploy failed"
+                    if not result.get("retryable") or job.attempts >= self.max_attempts:
+                        job.status = "failed"
+                        job.report(f"Failed: {job.error}")
+                        break
+
+                    delay = self.retry_delay * 2 ** (job.attempts - 1)
+                    job.status = "retrying"
+                    job.report(f"Transient failure, retrying in {delay:g}s: {job.error}")
+                    print(f"[Deploy Queue] {job.deploy_id[:8]} to {job.target} failed, retrying in {delay:g}s")
+                    await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            job.status = "failed"
+            job.error = "Deploy cancelled"
+            raise
+        finally:
+            job.finished_at = time.time()
+            print(f"[Deploy Queue] {job.deploy_id[:8]} to {job.target} {job.status} after {job.attempts} attempt(s)")
+            self._retire()
+
+    def _retire(self):
+        finished = [deploy_id for deploy_id, job in self._jobs.items() if job.finished]
+        for deploy_id in finished[:max(0, len(finished) - MAX_FINISHED_DEPLOYS)]:
+            del self._jobs[deploy_id]
+
+    def status(self) -> Dict[str, Any]:
+        jobs = list(self._jobs.values())
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_attempts": self.max_attempts,
+            "active": [job.to_dict() for job in jobs if not job.finished],
+            "finished": len([job for job in jobs if job.finished]),
+        }
+
+
+# Global instance (lazy initialization)
+_deploy_queue_instance = None
+
+
+def get_deploy_queue() -> DeployQueue:
+    """Get the global deploy queue (DEPLOY_CONCURRENCY, DEPLOY_MAX_ATTEMPTS, DEPLOY_RETRY_DELAY)"""
+    global _deploy_queue_instance
+    if _deploy_queue_instance is None:
+        _deploy_queue_instance = DeployQueue(
+            max_concurrent=int(os.getenv("DEPLOY_CONCURRENCY", "2")),
+            max_attempts=int(os.getenv("DEPLOY_MAX_ATTEMPTS", "3")),
+            retry_delay=float(os.getenv("DEPLOY_RETRY_DELAY", "5")),
+        )
+    return _deploy_queue_instance
@@ -0,0 +1,292 @@
+"""
+GitHub Data API Deploy for LiquidBooks
+
+Publishes a built site to gh-pages through GitHub's Git Data API instead of
+a local clone: no git binary and no temporary checkout are needed, and only
+file contents GitHub does not already have are sent.
+
+A deploy reads the current gh-pages tree (one recursive tree request),
+computes the git blob id of every site file locally and uploads just the
+blobs whose id the remote tree lacks. Small text files are sent inline in
+the tree request (one request for all of them); other blobs are uploaded in
+parallel. Then one tree, one commit and one ref update publish the site. If
+the new tree equals the deployed one, nothing is created.
+
+The API base URL and the httpx transport can be replaced, so an HTTP fake
+can stand in for GitHub.
+"""
+
+import asyncio
+import base64
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from book_export import site_files
+from pages_deploy import PAGES_BRANCH, PagesDeployError, git_blob_id
+
+
+GITHUB_API_URL = "https://api.github.com"
+
+# Parallel blob uploads
+UPLOAD_CONCURRENCY = int(os.getenv("PAGES_UPLOAD_CONCURRENCY", "8"))
+
+# Text files up to this size are sent inline in the tree request...
+INLINE_MAX_FILE_BYTES = 32 * 1024
+# ...as long as the inlined content stays under this total
+INLINE_MAX_TOTAL_BYTES = 4 * 1024 * 1024
+
+FILE_MODE = "100644"
+EXECUTABLE_MODE = "100755"
+
+
+class _SiteFile:
+    """One file to publish, with its git blob id"""
+
+    def __init__(self, path: str, mode: str, sha: str, size: int, source: Optional[Path], data: Optional[bytes]):
+        self.path = path
+        self.mode = mode
+        self.sha = sha
+        self.size = size
+        self.source = source
+        self.data = data
+
+    def read(self) -> bytes:
+        return self.data if self.data is not None else self.source.read_bytes()
+
+
+def _scan_site(site_dir: Path, extra_files: Optional[Dict[str, bytes]]) -> Dict[str, _SiteFile]:
+    files = {}
+    for source, relpath in site_files(site_dir):
+        data = source.read_bytes()
+        mode = EXECUTABLE_MODE if source.stat().st_mode & 0o111 else FILE_MODE
+        files[relpath] = _SiteFile(relpath, mode, git_blob_id(data), len(data), source, None)
+    for relpath, data in (extra_files or {}).items():
+        files[relpath] = _SiteFile(relpath, FILE_MODE, git_blob_id(data), len(data), None, data)
+    return files
+
+
+def _inline_text(data: bytes) -> Optional[str]:
+    if len(data) > INLINE_MAX_FILE_BYTES or b"\0" in data:
+        return None
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+class GitHubDataDeployer:
+    """Publishes a directory to a branch of one GitHub repository"""
+
+    def __init__(
+        self,
+        owner: str,
+        repo: str,
+        token: str,
+        api_url: str = GITHUB_API_URL,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        concurrency: int = UPLOAD_CONCURRENCY,
+    ):
+        self.repo_path = f"/repos/{owner}/{repo}"
+        self.concurrency = max(1, concurrency)
+        self._client_args = {
+            "base_url": api_url,
+            "headers": {
+                "Authorization": f"Bearer {token}",
+                "Accept": "application/vnd.github+json",
+                "X-GitHub-Api-Version": "2022-11-28",
+            },
+            "timeout": httpx.Timeout(60.0),
+            "transport": transport,
+        }
+
+    async def _request(self, client: httpx.AsyncClient, method: str, path: str, **kwargs) -> Optional[Dict[str, Any]]:
+        try:
+            response = await client.request(method, self.repo_path + path, **kwargs)
+        except httpx.TransportError as e:
+            raise PagesDeployError(f"GitHub API {method} {path} failed: {str(e) or type(e).__name__}", transient=True)
+        if response.status_code == 404 and method == "GET":
+            return None
+        if response.status_code >= 400:
+            try:
+                detail = response.json().get("message", response.text)
+            except ValueError:
+                detail = response.text
+            # Server errors, rate limits, and a ref that moved since it was read
+            transient = (
+                response.status_code >= 500
+                or response.status_code == 429
+                or (response.status_code == 403 and "rate limit" in str(detail).lower())
+                or (method == "PATCH" and response.status_code == 422)
+            )
+            raise PagesDeployError(
+                f"GitHub API {method} {path} failed ({response.status_code}): {detail}",
+                transient=transient,
+            )
+        return response.json()
+
+    async def _remote_tree(self, client: httpx.AsyncClient, branch: str) -> Tuple[Optional[str], Dict[str, Tuple[str, str]], bool]:
+        """(tip commit, {path: (mode, blob sha)}, complete) of the branch"""
+        ref = await self._request(client, "GET", f"/git/ref/heads/{branch}")
+        if ref is None:
+            return None, {}, True
+        commit_sha = ref["object"]["sha"]
+        commit = await self._request(client, "GET", f"/git/commits/{commit_sha}")
+        tree = await self._request(client, "GET", f"/git/trees/{commit['tree']['sha']}", params={"recursive": "1"})
+        blobs = {
+            entry["path"]: (entry["mode"], entry["sha"])
+            for entry in (tree or {}).get("tree", [])
+            if entry.get("type") == "blob"
+        }
+        # A truncated listing only means some blobs may be uploaded again
+        return commit_sha, blobs, not (tree or {}).get("truncated", False)
+
+    async def deploy(
+        self,
+        site_dir: Path,
+        extra_files: Optional[Dict[str, bytes]] = None,
+        message: str = "Deploy Jupyter Book to GitHub Pages",
+        branch: str = PAGES_BRANCH,
+    ) -> Dict[str, Any]:
+        """
+        Publish a built site to a branch
+
+        Args:
+            site_dir: Built site directory
+            extra_files: Generated files to publish next to the site (path -> content)
+            message: Commit message
+            branch: Branch to publish to
+
+        Returns:
+            Dict with 'changed', 'commit', 'files' (added/updated/removed/
+            unchanged counts), 'uploaded_blobs', 'uploaded_bytes',
+            'skipped_blobs' and 'skipped_bytes'
+
+        Raises:
+            PagesDeployError: If a GitHub API request fails
+        """
+        files = await asyncio.to_thread(_scan_site, Path(site_dir), extra_files)
+
+        async with httpx.AsyncClient(**self._client_args) as client:
+            parent, remote, complete = await self._remote_tree(client, branch)
+            remote_shas = {sha for _, sha in remote.values()}
+
+            counts = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+            for relpath, site_file in files.items():
+                if relpath not in remote:
+                    counts["added"] += 1
+                elif remote[relpath] != (site_file.mode, site_file.sha):
+                    counts["updated"] += 1
+                else:
+                    counts["unchanged"] += 1
+            counts["removed"] = sum(1 for relpath in remote if relpath not in files)
+
+            report = {
+                "changed": False,
+                "commit": parent,
+                "files": counts,
+                "uploaded_blobs": 0,
+                "uploaded_bytes": 0,
+                "skipped_blobs": 0,
+                "skipped_bytes": 0,
+            }
+            if parent is not None and complete and not (counts["added"] or counts["updated"] or counts["removed"]):
+                report["skipped_blobs"] = len(files)
+                report["skipped_bytes"] = sum(f.size for f in files.values())
+                print(f"[Pages API Deploy] Site unchanged, nothing to publish")
+                return report
+
+            # Each missing blob is sent once, however many paths share it
+            missing: Dict[str, _SiteFile] = {}
+            for site_file in files.values():
+                if site_file.sha in remote_shas:
+                    report["skipped_blobs"] += 1
+                    report["skipped_bytes"] += site_file.size
+                elif site_file.sha not in missing:
+                    missing[site_file.sha] = site_file
+
+            inline: Dict[str, str] = {}
+            inline_total = 0
+            uploads: List[_SiteFile] = []
+            for sha, site_file in missing.items():
+                text = _inline_text(site_file.read()) if site_file.size <= INLINE_MAX_FILE_BYTES else None
+                if text is not None and inline_total + site_file.size <= INLINE_MAX_TOTAL_BYTES:
+                    inline[sha] = text
+                    inline_total += site_file.size
+                else:
+                    uploads.append(site_file)
+
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def upload(site_file: _SiteFile):
+                async with semaphore:
+                    data = await asyncio.to_thread(site_file.read)
+                    blob = await self._request(client, "POST", "/git/blobs", json={
+                        "content": base64.b64encode(data).decode("ascii"),
+                        "encoding": "base64",
+                    })
+                    if blob["sha"] != site_file.sha:
+                        raise PagesDeployError(f"GitHub stored {site_file.path} as {blob['sha']}, expected {site_file.sha}")
+
+            await asyncio.gather(*(upload(site_file) for site_file in uploads))
+            report["uploaded_blobs"] = len(missing)
+            report["uploaded_bytes"] = sum(site_file.size for site_file in missing.values())
+            print(
+                f"[Pages API Deploy] Uploaded {len(uploads)} blobs in parallel and {len(inline)} inline "
+                f"({report['uploaded_bytes']} bytes), reused {report['skipped_blobs']} ({report['skipped_bytes']} bytes)"
+            )
+
+            entries = []
+            for relpath, site_file in sorted(files.items()):
+                entry = {"path": relpath, "mode": site_file.mode, "type": "blob"}
+                if site_file.sha in inline:
+                    entry["content"] = inline[site_file.sha]
+                else:
+                    entry["sha"] = site_file.sha
+                entries.append(entry)
+            tree = await self._request(client, "POST", "/git/trees", json={"tree": entries})
+
+            commit = await self._request(client, "POST", "/git/commits", json={
+                "message": message,
+                "tree": tree["sha"],
+                "parents": [parent] if parent else [],
+            })
+            if parent is None:
+                await self._request(client, "POST", "/git/refs", json={"ref": f"refs/heads/{branch}", "sha": commit["sha"]})
+            else:
+                await self._request(client, "PATCH", f"/git/refs/heads/{branch}", json={"sha": commit["sha"], "force": False})
+            print(f"[Pages API Deploy] Published {commit['sha'][:7]} to {branch}")
+
+            report["changed"] = True
+            report["commit"] = commit["sha"]
+            return report
+
+
+async def deploy_pages_api(
+    site_dir: Path,
+    owner: str,
+    repo: str,
+    token: str,
+    extra_files: Optional[Dict[str, bytes]] = None,
+    api_url: str = GITHUB_API_URL,
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+) -> Dict[str, Any]:
+    """
+    Publish a built site to a repository's gh-pages branch via the Git Data API
+
+    Args:
+        site_dir: Built site directory
+        owner: Repository owner
+        repo: Repository name
+        token: GitHub token with contents write access
+        extra_files: Generated files to publish next to the site
+        api_url: GitHub API base URL
+        transport: httpx transport (a fake GitHub in tests)
+
+    Returns:
+        Report from GitHubDataDeployer.deploy
+    """
+    deployer = GitHubDataDeployer(owner, repo, token, api_url=api_url, transport=transport)
+    return await deployer.deploy(site_dir, extra_files=extra_files)
@@ -1,16 +1,22 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import Callable, List, Optional, Dict, Any, Tuple
 import subprocess
-import tempfile
 import shutil
 from pathlib import Path
 import os
+import re
+import hashlib
 import traceback
 import json
-from github import Github
+import sys
+import time
+import uuid
+import asyncio
+import requests
+from github import Github, GithubException
 from dotenv import load_dotenv
 from openai import OpenAI
 from book_types import get_book_type, get_all_book_types
@@ -22,6 +28,25 @@ from prompt_builder import (
     estimate_tokens,
     calculate_cost
 )
+from context_packing import (
+    ContextSection,
+    fit_text,
+    pack_sections,
+    remaining_budget
+)
+from context_encoder import ENCODING_STYLES, ContextEncoder
+from context_index import (
+    build_chapter_index,
+    get_book_index,
+    query_for_chapter,
+    format_passages
+)
+from workspace_store import (
+    VersionConflictError,
+    WorkspaceNotFoundError,
+    get_data_dir,
+    get_workspace_store
+)
 
 load_dotenv()
 
@@ -30,6 +55,67 @@ openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 # Import AI provider wrapper
 from ai_provider import get_ai_provider
+from book_emitter import BookEmitter
+from book_features import myst_extensions, sphinx_extensions
+from chapter_preview import render_preview
+from myst_lint import lint_book
+from book_export import DEFAULT_EXPORT_PROFILE, EXPORT_PROFILES, archive_key, export_files, get_archive_cache, stream_archive
+from asset_optimizer import OPTIMIZE_MANIFEST, optimize_site
+from output_formats import (
+    MEDIA_TYPES,
+    OUTPUT_FORMATS,
+    builders_for,
+    doctree_dir,
+    find_artifact,
+    get_format_cache,
+    pdf_available,
+    sync_doctrees,
+)
+from asset_store import get_asset_store
+from build_workspaces import get_workspace_manager
+from build_cache import compute_build_key, get_build_cache
+from build_pool import BuildQueueFull, get_build_pool
+from build_log import BuildLog, format_sse, get_build_log, start_build_log
+from book_builder import choose_jobs, execution_mode, record_serial_fallback, resolve_jobs
+from build_worker import get_build_worker
+from pages_deploy import PagesDeployError, deploy_pages
+from github_data_deploy import deploy_pages_api
+from deploy_queue import DeployJob, get_deploy_queue
+from publishers import PublishError, create_publisher
+
+# Token budget for passages retrieved from other chapters
+RELATED_CONTEXT_TOKENS = int(os.getenv("RELATED_CONTEXT_TOKENS", "600"))
+
+# Per-call prompt token budgets (prompt only; completion tokens are separate)
+ARTIFACT_PROMPT_TOKENS = int(os.getenv("ARTIFACT_PROMPT_TOKENS", "2000"))
+ENHANCE_PROMPT_TOKENS = int(os.getenv("ENHANCE_PROMPT_TOKENS", "6000"))
+MARKETING_PROMPT_TOKENS = int(os.getenv("MARKETING_PROMPT_TOKENS", "12000"))
+
+# Sphinx parallel build workers ('auto' = one per CPU), used for books with
+# at least PARALLEL_BUILD_MIN_CHAPTERS chapters (smaller books build serially)
+SPHINX_JOBS = os.getenv("SPHINX_JOBS", "auto")
+PARALLEL_BUILD_MIN_CHAPTERS = int(os.getenv("PARALLEL_BUILD_MIN_CHAPTERS", "12"))
+
+# Minify, fingerprint and precompress built sites unless a build request says otherwise
+OPTIMIZE_ASSETS = os.getenv("OPTIMIZE_ASSETS", "0") == "1"
+
+# Characters of build output returned as the error of a failed warm worker build
+BUILD_ERROR_CHARS = 4000
+
+BOOK_BUILDER_SCRIPT = Path(__file__).parent / "book_builder.py"
+
+# How code cells run during builds ('cache' reuses outputs of unchanged
+# notebooks from the book workspace's jupyter-cache; also auto, force, off)
+NOTEBOOK_EXECUTION = execution_mode(os.getenv("NOTEBOOK_EXECUTION", "cache"))
+NOTEBOOK_TIMEOUT = int(os.getenv("NOTEBOOK_TIMEOUT", "100"))
+
+# How gh-pages deploys reach GitHub: 'git' (shallow clone and push) or 'api'
+# (Git Data API, no git binary or local checkout)
+PAGES_DEPLOY_BACKENDS = ("git", "api")
+PAGES_DEPLOY_BACKEND = os.getenv("PAGES_DEPLOY_BACKEND", "git").strip().lower()
+if PAGES_DEPLOY_BACKEND not in PAGES_DEPLOY_BACKENDS:
+    # A typo must not silently deploy through the other backend
+    raise ValueError(f"Unsupported PAGES_DEPLOY_BACKEND: {PAGES_DEPLOY_BACKEND!r} (use 'git' or 'api')")
 
 app = FastAPI(title="LiquidBooks API")
 
@@ -73,11 +159,18 @@ class Book(BaseModel):
 
 
 class BuildRequest(BaseModel):
-    book: Book
+    book: Optional[Book] = None  # May be omitted when workspace_id is given
     features: Optional[List[str]] = None
     github_username: Optional[str] = None
     github_token: Optional[str] = None
     repo_name: Optional[str] = None
+    workspace_id: Optional[str] = None  # Load the book from a stored workspace
+    full_rebuild: bool = False  # Pass --all to re-read every chapter
+    build_id: Optional[str] = None  # Client-chosen id for polling /api/build/queue
+    reexecute_chapters: Optional[List[str]] = None  # Chapter titles whose code cells must run again
+    skip_lint: bool = False  # Build even if the MyST pre-flight check finds errors
+    optimize_assets: Optional[bool] = None  # Minify, fingerprint and precompress the site (default: OPTIMIZE_ASSETS)
+    formats: Optional[List[str]] = None  # Output formats besides HTML: latex, pdf, epub
 
 
 class BuildResponse(BaseModel):
@@ -85,6 +178,30 @@ class BuildResponse(BaseModel):
     message: str
     url: Optional[str] = None
     build_dir: Optional[str] = None
+    changes: Optional[Dict[str, List[str]]] = None  # Source files written/unchanged/removed
+    cached: bool = False  # True if the HTML came from the build cache
+    build_key: Optional[str] = None  # Content hash identifying this build
+    build_id: Optional[str] = None
+    build_stats: Optional[Dict[str, Any]] = None  # Chapters, jobs, seconds and seconds per chapter
+    deploy_id: Optional[str] = None  # Queued GitHub Pages deploy, polled at /api/deploy/{deploy_id}
+    asset_optimization: Optional[Dict[str, Any]] = None  # Bytes saved by the asset optimizer, when it ran
+    formats: Optional[Dict[str, Dict[str, Any]]] = None  # Per requested format: success, cached, url or error
+
+
+class PublishRequest(BaseModel):
+    build_key: Optional[str] = None  # Build to publish, from the build cache...
+    build_dir: Optional[str] = None  # ...or a build directory from a /api/build response
+    target: Dict[str, Any]  # {"type": "local", "path": ...} or {"type": "s3", "bucket": ..., "prefix": ...}
+
+
+class DeployRequest(BaseModel):
+    build_key: Optional[str] = None  # Build to deploy, from the build cache...
+    build_dir: Optional[str] = None  # ...or a build directory from a /api/build response
+    github_username: str
+    github_token: str
+    repo_name: str
+    book: Optional[Book] = None  # For the repository README
+    workspace_id: Optional[str] = None  # Load the book from a stored workspace
 
 
 class AIBookRequest(BaseModel):
@@ -158,6 +275,50 @@ class DiaryGenerationRequest(BaseModel):
     diary_type: str  # 'before', 'during', 'after'
     book_context: Optional[Dict[str, Any]] = None  # Context about the book
     system_prompt: Optional[str] = None  # User can override default prompt
+    context_encoding: Optional[str] = None  # 'yaml' (terse) or 'json' (minified)
+    prune_fields: Optional[List[str]] = None  # Avatar fields to leave out of the prompt
+
+
+class WorkspaceCreateRequest(BaseModel):
+    """Create a workspace, optionally seeding it with a book and research context"""
+    name: Optional[str] = None
+    book: Optional[Dict[str, Any]] = None
+    context: Optional[Dict[str, Any]] = None  # Request-style fields, e.g. brand_identity
+
+
+class TextOp(BaseModel):
+    """Replace `delete` characters at `offset` (in the base text) with `insert`"""
+    offset: int
+    delete: int = 0
+    insert: str = ""
+
+
+class LintRequest(BaseModel):
+    """Check a book's chapters for MyST problems without building it"""
+    book: Optional[Book] = None  # May be omitted when workspace_id is given
+    features: Optional[List[str]] = None
+    workspace_id: Optional[str] = None
+
+
+class ChapterPreviewRequest(BaseModel):
+    """Render one chapter without building the book"""
+    content: Optional[str] = None  # Chapter markdown (or load it from a workspace)
+    features: Optional[List[str]] = None
+    workspace_id: Optional[str] = None
+    chapter_key: Optional[str] = None
+
+
+class ChapterPatchRequest(BaseModel):
+    """Apply an edit to a stored chapter"""
+    base_version: int  # Version the ops were computed against
+    ops: List[TextOp] = []
+    title: Optional[str] = None
+
+
+class WorkspaceItemRequest(BaseModel):
+    """Store one workspace item"""
+    value: Any
+    expected_version: Optional[int] = None  # Reject the write if the stored version differs
 
 
 def sanitize_filename(title: str) -> str:
@@ -165,7 +326,26 @@ def sanitize_filename(title: str) -> str:
     return title.lower().replace(" ", "-").replace("/", "-").replace("'", "")
 
 
-def generate_config_yml(book: Book, book_dir: Path, features: Optional[List[str]] = None):
+def get_book_build_dir(book_id: str) -> Path:
+    """
+    Persistent build workspace for a book
+
+    The directory is reused across builds so Sphinx keeps `_build/.doctrees`
+    and its environment pickle, and only re-reads chapters that changed.
+    """
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "-", book_id).strip("-")[:40] or "book"
+    digest = hashlib.sha256(book_id.encode("utf-8")).hexdigest()[:8]
+    book_dir = get_data_dir() / "builds" / f"{slug}-{digest}"
+    book_dir.mkdir(parents=True, exist_ok=True)
+    return book_dir
+
+
+def generate_config_yml(
+    book: Book,
+    book_dir: Path,
+    features: Optional[List[str]] = None,
+    emitter: Optional[BookEmitter] = None,
+):
     """
     Generate Jupyter Book _config.yml with dynamic extensions based on features
 
@@ -173,139 +353,25 @@ def generate_config_yml(book: Book, book_dir: Path, features: Optional[List[str]
         book: Book object with metadata
         book_dir: Path to book directory
         features: List of feature IDs to enable
+        emitter: Emitter recording the change set (a fresh one if omitted)
+
+    Returns:
+        The generated config text
     """
     if features is None:
         features = []
 
-    # Map features to required Sphinx extensions
-    # Features with empty lists are built into MyST/Sphinx/Jupyter Book
-    feature_extensions_map = {
-        # Basic Content Features
-        'admonitions': [],  # Built into MyST
-        'dropdowns': ['sphinx_togglebutton'],
-        'admonition_dropdowns': ['sphinx_togglebutton'],
-        'definition_lists': [],  # MyST extension: deflist
-        'blockquotes': [],  # Built into MyST
-        'epigraphs': [],  # Built into Sphinx
-        'glossary': [],  # Built into Sphinx
-        'footnotes': [],  # Built into MyST
-        'sidebar': [],  # Built into Sphinx
-        'margin_notes': [],  # Built into Sphinx
-
-        # Code Features
-        'code_blocks': ['sphinx_copybutton'],
-        'code_execution': [],  # Built into Jupyter Book
-        'code_cell_tags': [],  # Built into MyST-NB
-        'output_gluing': [],  # Built into MyST-NB
-        'thebe': ['sphinx_thebe'],
-        'binder_buttons': [],  # Config-based
-        'scroll_output': [],  # CSS-based
-        'line_numbers': [],  # Built into Sphinx
-
-        # Math Features
-        'math_equations': [],  # MyST extension: dollarmath
-        'amsmath': [],  # MyST extension: amsmath
-        'math_labels': [],  # Built into MyST
-        'theorems': ['sphinx_proof'],
-        'proofs': ['sphinx_proof'],
-        'algorithms': ['sphinx_proof'],
-        'lemmas': ['sphinx_proof'],
-        'corollaries': ['sphinx_proof'],
-        'definitions': ['sphinx_proof'],
-
-        # Sphinx Design Components
-        'grids': ['sphinx_design'],
-        'cards': ['sphinx_design'],
-        'tabs': ['sphinx_design'],
-        'badges': ['sphinx_design'],
-        'buttons': ['sphinx_design'],
-        'icons': ['sphinx_design'],
-        'grid_cards': ['sphinx_design'],
-        'custom_divs': [],  # Built into MyST
-
-        # Visual & Diagrams
-        'figures': [],  # Built into MyST
-        'images': [],  # Built into MyST
-        'html_images': [],  # MyST extension: html_image
-        'mermaid_diagrams': ['sphinxcontrib.mermaid'],
-        'tables': [],  # Built into MyST
-
-        # Interactive Features
-        'quizzes': ['jupyterquiz'],
-        'exercise': ['sphinx_exercise'],
-        'interactive_plots': [],  # Via code execution
-        'widgets': [],  # Via Jupyter
-
-        # MyST Extensions (handled separately in myst_enable_extensions)
-        'colon_fence': [],  # MyST extension
-        'substitutions': [],  # MyST extension: substitution
-        'smartquotes': [],  # MyST extension
-        'linkify': [],  # MyST extension
-        'replacements': [],  # MyST extension
-        'tasklists': [],  # MyST extension: tasklist
-        'html_admonition': [],  # MyST extension
-        'attrs_inline': [],  # MyST extension
-        'attrs_block': [],  # MyST extension
-
-        # References & Citations
-        'cross_references': [],  # Built into Sphinx
-        'target_headers': [],  # Built into MyST
-        'citations': ['sphinxcontrib.bibtex'],
-        'numbered_references': [],  # Built into Sphinx
-
-        # Advanced Features
-        'line_comments': [],  # Built into MyST
-        'block_breaks': [],  # Built into MyST
-        'html_blocks': [],  # Built into MyST
-        'reference_style_links': [],  # Built into MyST
-        'thematic_breaks': [],  # Built into MyST
-    }
-
-    # Map MyST feature IDs to MyST extension names
-    myst_feature_map = {
-        'math_equations': 'dollarmath',
-        'amsmath': 'amsmath',
-        'colon_fence': 'colon_fence',
-        'definition_lists': 'deflist',
-        'html_images': 'html_image',
-        'linkify': 'linkify',
-        'replacements': 'replacements',
-        'smartquotes': 'smartquotes',
-        'substitutions': 'substitution',
-        'tasklists': 'tasklist',
-        'html_admonition': 'html_admonition',
-        'attrs_inline': 'attrs_inline',
-        'attrs_block': 'attrs_block',
-    }
-
-    # Collect unique Sphinx extensions based on enabled features
-    extensions = set()
-    for feature in features:
-        if feature in feature_extensions_map:
-            extensions.update(feature_extensions_map[feature])
-
-    # Always include these core extensions
-    extensions.add('sphinx_copybutton')  # Copy button for code blocks
-    extensions.add('sphinx_togglebutton')  # Toggle buttons for content
-
-    # Remove empty strings (from features with no Sphinx extension)
-    extensions.discard('')
-
     # Build extensions list string
+    extensions = sphinx_extensions(features)
     extensions_yaml = ""
     if extensions:
-        extensions_yaml = "\n    - " + "\n    - ".join(sorted(extensions))
-
-    # Collect MyST extensions based on enabled features
-    myst_extensions = set()
-    for feature in features:
-        if feature in myst_feature_map:
-            myst_extensions.add(myst_feature_map[feature])
+        extensions_yaml = "\n    - " + "\n    - ".join(extensions)
 
     # Build MyST extensions YAML
+    myst_extension_names = myst_extensions(features)
     myst_yaml = ""
-    if myst_extensions:
-        myst_yaml = "\n      - " + "\n      - ".join(sorted(myst_extensions))
+    if myst_extension_names:
+        myst_yaml = "\n      - " + "\n      - ".join(myst_extension_names)
 
     # Get copyright year from publishing info or use current year
     from datetime import datetime
@@ -326,10 +392,10 @@ author: "{author_display}"
 copyright: "{copyright_year}"
 logo: ""
 
-# Force re-execution of notebooks on each build
+# Execute code cells; in cache mode only notebooks whose code changed run again
 execute:
-  execute_notebooks: auto
-  timeout: 100
+  execute_notebooks: {NOTEBOOK_EXECUTION}
+  timeout: {NOTEBOOK_TIMEOUT}
 
 # Define the name of the latex output file for PDF builds
 latex:
@@ -386,7 +452,8 @@ sphinx:
     mathjax_path: https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js
 """
 
-    (book_dir / "_config.yml").write_text(config_content)
+    (emitter or BookEmitter(book_dir)).write("_config.yml", config_content)
+    return config_content
 
 
 def generate_copyright_page(book: Book) -> str:
@@ -521,7 +588,7 @@ def generate_back_matter_pages(book: Book) -> dict:
     return pages
 
 
-def generate_toc_yml(book: Book, book_dir: Path):
+def generate_toc_yml(book: Book, book_dir: Path, emitter: Optional[BookEmitter] = None):
     """Generate Jupyter Book _toc.yml with front matter, chapters, and back matter"""
     sorted_chapters = sorted(book.chapters, key=lambda x: x.order)
 
@@ -562,44 +629,104 @@ def generate_toc_yml(book: Book, book_dir: Path):
     if publishing_info.get('alsoByTheAuthor'):
         toc_content += "  - file: also_by_the_author\n"
 
-    (book_dir / "_toc.yml").write_text(toc_content)
+    (emitter or BookEmitter(book_dir)).write("_toc.yml", toc_content)
 
 
-def write_chapters(book: Book, book_dir: Path):
-    """Write chapter markdown files"""
+def chapter_files(book: Book) -> List[Tuple[Chapter, str]]:
+    """Chapters in book order with the markdown file each is written to"""
     sorted_chapters = sorted(book.chapters, key=lambda x: x.order)
+    # First chapter is intro
+    return [
+        (chapter, "intro.md" if i == 0 else f"{sanitize_filename(chapter.title)}.md")
+        for i, chapter in enumerate(sorted_chapters)
+    ]
 
-    for i, chapter in enumerate(sorted_chapters):
-        if i == 0:
-            # First chapter is intro
-            filepath = book_dir / "intro.md"
-        else:
-            filename = sanitize_filename(chapter.title)
-            filepath = book_dir / f"{filename}.md"
 
-        filepath.write_text(chapter.content)
+def lint_chapters(book: Book, features: Optional[List[str]]) -> Dict[str, Any]:
+    """Run the MyST pre-flight check over a book's chapters"""
+    return lint_book(
+        [{"title": chapter.title, "file": filename, "content": chapter.content} for chapter, filename in chapter_files(book)],
+        features,
+    )
 
 
-def build_jupyter_book(book_dir: Path) -> dict:
-    """Run jupyter-book build command"""
-    try:
-        result = subprocess.run(
-            ["jupyter-book", "build", str(book_dir), "--all"],
-            capture_output=True,
-            text=True,
-            timeout=300,
-        )
+def write_chapters(book: Book, book_dir: Path, emitter: Optional[BookEmitter] = None):
+    """Write chapter markdown files (only those whose content changed)"""
+    emitter = emitter or BookEmitter(book_dir)
+    for chapter, filename in chapter_files(book):
+        emitter.write(filename, chapter.content)
 
-        return {
-            "success": result.returncode == 0,
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-        }
-    except subprocess.TimeoutExpired:
-        return {
-            "success": False,
-            "error": "Build timeout after 5 minutes",
-        }
+
+def build_error(result: Dict[str, Any]) -> str:
+    """
+    Error text of a failed build result
+
+    Warm worker builds merge stderr into stdout, so without stderr the end
+    of stdout (where Sphinx reports the error) is used.
+    """
+    text = result.get("stderr") or result.get("error") or result.get("stdout", "")[-BUILD_ERROR_CHARS:]
+    return text.strip() or f"exit code {result.get('returncode')}"
+
+
+async def build_jupyter_book(
+    book_dir: Path,
+    full_rebuild: bool = False,
+    build_log: Optional[BuildLog] = None,
+    jobs: int = 1,
+    reexecute: Optional[List[str]] = None,
+    builder: str = "html",
+    doctree_dir: Optional[Path] = None,
+) -> dict:
+    """
+    Run a jupyter-book build
+
+    Builds are incremental by default: Sphinx reuses the doctrees in
+    `_build/.doctrees` and only re-reads sources that changed. full_rebuild
+    passes --all to re-read everything. The build runs as an asyncio
+    subprocess, so other requests are served while it runs; its output is
+    streamed into build_log line by line if given. Cached notebook outputs
+    of the chapter files in reexecute are discarded so their code runs again.
+    builder and doctree_dir select another Sphinx builder and doctree
+    directory (see output_formats.py).
+
+    The build goes through book_builder.py (jupyter-book's Python API), since
+    the jupyter-book CLI cannot pass Sphinx's -j option. It runs in a child
+    of the warm build worker, which has Sphinx and jupyter-book already
+    imported; if the worker is disabled or cannot start, it runs as a fresh
+    process instead.
+    """
+    build_pool = get_build_pool()
+    log_builder = None if builder == "html" else builder
+    on_line = (lambda stream, line: build_log.line(line, stream, builder=log_builder)) if build_log else None
+    try:
+        build_worker = get_build_worker()
+        if build_worker is not None and await build_worker.ensure_started():
+            try:
+                result = await build_worker.run(
+                    {
+                        "book_dir": str(book_dir.absolute()),
+                        "builder": builder,
+                        "full_rebuild": full_rebuild,
+                        "jobs": jobs,
+                        "reexecute": reexecute or [],
+                        "doctrees": str(doctree_dir.absolute()) if doctree_dir else None,
+                    },
+                    timeout=build_pool.timeout,
+                    on_line=on_line,
+                )
+                result["warm_worker"] = True
+                return result
+            except OSError as e:
+                print(f"[Build Worker] Unavailable ({str(e)}), building in a new process")
+
+        command = [sys.executable, str(BOOK_BUILDER_SCRIPT), str(book_dir), "--jobs", str(jobs), "--builder", builder]
+        if doctree_dir:
+            command.extend(["--doctrees", str(doctree_dir)])
+        if full_rebuild:
+            command.append("--all")
+        for filename in reexecute or []:
+            command.extend(["--reexecute", filename])
+        return await build_pool.run(command, on_line=on_line)
     except Exception as e:
         return {
             "success": False,
@@ -607,6 +734,87 @@ def build_jupyter_book(book_dir: Path) -> dict:
         }
 
 
+async def build_output_formats(
+    book_dir: Path,
+    formats: List[str],
+    build_id: str,
+    build_log: BuildLog,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Build the LaTeX, PDF and EPUB formats of a freshly built book workspace
+
+    The LaTeX and EPUB builders run concurrently, each in its own build slot
+    and on its own copy of the doctrees the HTML build just wrote, so the
+    book is not read or executed again. The PDF is then compiled from the
+    LaTeX output with latexmk.
+
+    Args:
+        book_dir: Book build workspace, built as HTML from the current sources
+        formats: Formats to build (any of latex, pdf, epub)
+        build_id: Build id; the format builds hold slots '<build_id>-<builder>'
+        build_log: Log the builders' output goes to, tagged with the builder
+
+    Returns:
+        Dict of format -> {'success', 'path'} or {'success', 'error'}
+    """
+    build_pool = get_build_pool()
+
+    async def run_builder(builder: str) -> Dict[str, Any]:
+        copied = await asyncio.to_thread(sync_doctrees, book_dir, builder)
+        started = time.monotonic()
+        try:
+            async with build_pool.slot(f"{build_id}-{builder}"):
+                result = await build_jupyter_book(
+                    book_dir,
+                    full_rebuild=True,  # write every page; nothing is re-read
+                    build_log=build_log,
+                    builder=builder,
+                    doctree_dir=doctree_dir(book_dir, builder),
+                )
+        except BuildQueueFull as e:
+            result = {"success": False, "error": f"Build queue is full, retry in {e.retry_after}s"}
+        status = "built" if result["success"] else "failed"
+        build_log.info(f"{builder} {status} in {time.monotonic() - started:.2f}s ({copied} doctree file(s) synced)")
+        return result
+
+    builders = builders_for(formats)
+    builder_results = dict(zip(builders, await asyncio.gather(*(run_builder(builder) for builder in builders))))
+
+    def failure(result: Dict[str, Any]) -> str:
+        output = result.get("error") or result.get("stderr") or result.get("stdout") or ""
+        return output.strip()[-2000:] or f"exit code {result.get('returncode')}"
+
+    results = {}
+    for name in formats:
+        result = builder_results[OUTPUT_FORMATS[name][0]]
+        if not result["success"]:
+            results[name] = {"success": False, "error": failure(result)}
+        elif name == "pdf":
+            if not pdf_available():
+                results[name] = {
+                    "success": False,
+                    "error": "PDF needs latexmk and a LaTeX distribution (XeLaTeX); the LaTeX sources were built",
+                }
+                continue
+            latex_dir = book_dir / "_build" / "latex"
+            started = time.monotonic()
+            try:
+                async with build_pool.slot(f"{build_id}-pdf"):
+                    result = await build_pool.run(
+                        ["make", "-C", str(latex_dir), "all-pdf", "LATEXOPTS=-interaction=nonstopmode -halt-on-error"],
+                        on_line=lambda stream, line: build_log.line(line, stream, builder="pdf"),
+                    )
+            except BuildQueueFull as e:
+                result = {"success": False, "error": f"Build queue is full, retry in {e.retry_after}s"}
+            build_log.info(f"pdf {'compiled' if result['success'] else 'failed'} in {time.monotonic() - started:.2f}s")
+            path = find_artifact(book_dir, name) if result["success"] else None
+            results[name] = {"success": True, "path": path} if path else {"success": False, "error": failure(result)}
+        else:
+            path = await asyncio.to_thread(find_artifact, book_dir, name)
+            results[name] = {"success": True, "path": path} if path else {"success": False, "error": f"{name} builder wrote no output"}
+    return results
+
+
 def generate_readme(book: Book, username: str, repo_name: str) -> str:
     """Generate README.md content for the deployed book"""
     gh_pages_url = f"https://{username}.github.io/{repo_name}"
@@ -645,19 +853,30 @@ def generate_readme(book: Book, username: str, repo_name: str) -> str:
     return content
 
 
+def github_pages_url(username: str, repo_name: str) -> str:
+    return f"https://{username}.github.io/{repo_name}/"
+
+
 def deploy_to_github(
     book_dir: Path,
     username: str,
     token: str,
     repo_name: str,
     book: Book = None,
+    progress: Optional[Callable[[str], None]] = None,
 ) -> dict:
-    """Deploy built book to GitHub Pages"""
-    import subprocess
-    import tempfile
+    """
+    Deploy built book to GitHub Pages
+
+    Blocking (git and GitHub API calls); runs in a deploy queue worker thread.
+    progress is called with a short message at each step. Failures return
+    'retryable' when another attempt may succeed.
+    """
+    progress = progress or (lambda message: None)
 
     try:
         print(f"[GitHub Deploy] Starting deployment for {username}/{repo_name}")
+        progress("Connecting to GitHub")
         g = Github(token)
         user = g.get_user()
         print(f"[GitHub Deploy] Authenticated as {user.login}")
@@ -687,170 +906,104 @@ def deploy_to_github(
 
         print(f"[GitHub Deploy] Found build output at {html_dir}")
 
-        # Use git commands to push files to gh-pages branch
-        with tempfile.TemporaryDirectory() as temp_git_dir:
-            temp_git_path = Path(temp_git_dir) / "repo"
-
-            # Clone the repository
-            print(f"[GitHub Deploy] Cloning repository to {temp_git_path}")
-            repo_url = f"https://{token}@github.com/{username}/{repo_name}.git"
-
-            # Wait a moment for newly created repo to be ready
-            import time
-            if repo.created_at.timestamp() > (time.time() - 10):
-                print(f"[GitHub Deploy] Repository just created, waiting 2 seconds...")
-                time.sleep(2)
-
-            result = subprocess.run(
-                ["git", "clone", repo_url, str(temp_git_path)],
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            print(f"[GitHub Deploy] Clone completed")
+        repo_url = f"https://{token}@github.com/{username}/{repo_name}.git"
 
-            # Create or checkout gh-pages branch
-            try:
-                print(f"[GitHub Deploy] Checking out gh-pages branch")
-                subprocess.run(
-                    ["git", "checkout", "gh-pages"],
-                    cwd=temp_git_path,
-                    check=True,
-                    capture_output=True,
-                    text=True
-                )
-                print(f"[GitHub Deploy] Checked out existing gh-pages branch")
-            except subprocess.CalledProcessError:
-                # Create orphan gh-pages branch if it doesn't exist
-                print(f"[GitHub Deploy] Creating new orphan gh-pages branch")
-                subprocess.run(
-                    ["git", "checkout", "--orphan", "gh-pages"],
-                    cwd=temp_git_path,
-                    check=True,
-                    capture_output=True,
-                    text=True
-                )
-                # Remove all files from the new orphan branch
-                subprocess.run(
-                    ["git", "rm", "-rf", "."],
-                    cwd=temp_git_path,
-                    capture_output=True,
-                    text=True
-                )
-                print(f"[GitHub Deploy] Orphan branch created")
-
-            # Remove all existing files in the repo (except .git)
-            print(f"[GitHub Deploy] Clearing existing files")
-            for item in temp_git_path.iterdir():
-                if item.name != ".git":
-                    if item.is_dir():
-                        shutil.rmtree(item)
-                    else:
-                        item.unlink()
-
-            # Copy all files from html_dir to temp_git_path
-            print(f"[GitHub Deploy] Copying build files to repository")
-            file_count = 0
-            for item in html_dir.iterdir():
-                if item.is_dir():
-                    shutil.copytree(item, temp_git_path / item.name)
-                    file_count += sum(1 for _ in (temp_git_path / item.name).rglob('*'))
-                else:
-                    shutil.copy2(item, temp_git_path / item.name)
-                    file_count += 1
-            print(f"[GitHub Deploy] Copied {file_count} files")
-
-            # Add .nojekyll file to prevent Jekyll processing
-            (temp_git_path / ".nojekyll").touch()
-            print(f"[GitHub Deploy] Added .nojekyll file")
-
-            # Generate and add README.md if book object is provided
-            if book:
-                readme_content = generate_readme(book, username, repo_name)
-                (temp_git_path / "README.md").write_text(readme_content)
-                print(f"[GitHub Deploy] Added README.md with book information")
-
-            # Configure git
-            subprocess.run(
-                ["git", "config", "user.email", "liquidbooks@example.com"],
-                cwd=temp_git_path,
-                check=True
-            )
-            subprocess.run(
-                ["git", "config", "user.name", "LiquidBooks"],
-                cwd=temp_git_path,
-                check=True
-            )
+        # Wait a moment for newly created repo to be ready
+        import time
+        if repo.created_at.timestamp() > (time.time() - 10):
+            print(f"[GitHub Deploy] Repository just created, waiting 2 seconds...")
+            time.sleep(2)
 
-            # Add all files
-            print(f"[GitHub Deploy] Staging files for commit")
-            subprocess.run(
-                ["git", "add", "."],
-                cwd=temp_git_path,
-                check=True
-            )
+        # .nojekyll prevents Jekyll processing of _static and friends
+        extra_files = {".nojekyll": b""}
+        if book:
+            extra_files["README.md"] = generate_readme(book, username, repo_name).encode("utf-8")
 
-            # Commit
-            print(f"[GitHub Deploy] Creating commit")
-            result = subprocess.run(
-                ["git", "commit", "-m", "Deploy Jupyter Book to GitHub Pages"],
-                cwd=temp_git_path,
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            print(f"[GitHub Deploy] Commit created")
-
-            # Push to gh-pages branch
-            print(f"[GitHub Deploy] Pushing to GitHub")
-            result = subprocess.run(
-                ["git", "push", "-f", "origin", "gh-pages"],
-                cwd=temp_git_path,
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            print(f"[GitHub Deploy] Push completed successfully")
+        # Push only the files that changed since the last deploy
+        progress(f"Publishing to {repo.full_name} gh-pages")
+        if PAGES_DEPLOY_BACKEND == "api":
+            print(f"[GitHub Deploy] Publishing build output to gh-pages via the Git Data API")
+            deploy = asyncio.run(deploy_pages_api(html_dir, repo.owner.login, repo.name, token, extra_files=extra_files))
+        else:
+            print(f"[GitHub Deploy] Syncing build output to gh-pages")
+            deploy = deploy_pages(html_dir, repo_url, extra_files=extra_files)
 
         # Enable GitHub Pages on gh-pages branch
         print(f"[GitHub Deploy] Enabling GitHub Pages")
+        progress("Enabling GitHub Pages")
         try:
             repo.enable_pages(branch="gh-pages")
             print(f"[GitHub Deploy] GitHub Pages enabled")
         except Exception as e:
             print(f"[GitHub Deploy] Pages already enabled or error: {e}")
 
-        pages_url = f"https://{username}.github.io/{repo_name}/"
+        pages_url = github_pages_url(username, repo_name)
         print(f"[GitHub Deploy] Deployment complete! URL: {pages_url}")
 
         return {
             "success": True,
             "url": pages_url,
-            "message": "Book deployed to GitHub Pages",
+            "message": "Book deployed to GitHub Pages" if deploy["changed"] else "GitHub Pages already up to date",
+            "changed": deploy["changed"],
+            "files": deploy["files"],
+            "uploaded_bytes": deploy.get("uploaded_bytes"),
+            "skipped_bytes": deploy.get("skipped_bytes"),
         }
 
-    except subprocess.CalledProcessError as e:
-        error_msg = f"Git command failed: {e.cmd}"
-        if e.stdout:
-            error_msg += f"\nStdout: {e.stdout}"
-        if e.stderr:
-            error_msg += f"\nStderr: {e.stderr}"
+    except PagesDeployError as e:
+        error_msg = f"Deploy failed: {str(e)}"
         print(f"[GitHub Deploy] ERROR: {error_msg}")
         return {
             "success": False,
             "error": error_msg,
+            "retryable": e.transient,
         }
     except Exception as e:
         error_msg = f"{str(e)}"
         print(f"[GitHub Deploy] ERROR: {error_msg}")
         import traceback
         traceback.print_exc()
+        # GitHub server errors and network trouble may pass on a retry
+        retryable = (
+            (isinstance(e, GithubException) and e.status >= 500)
+            or isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+        )
         return {
             "success": False,
             "error": error_msg,
+            "retryable": retryable,
         }
 
 
+def build_in_use(path: Path) -> bool:
+    """Whether a workspace or build cache entry is being built or read by a queued deploy"""
+    return get_build_pool().is_building(str(path)) or get_deploy_queue().in_use(path)
+
+
+def touch_build(build_dir: Path):
+    """Mark a build workspace or build cache entry as used, so it is evicted last"""
+    if not get_workspace_manager().touch(build_dir):
+        get_build_cache().touch(build_dir)
+
+
+def queue_github_deploy(
+    build_dir: Path,
+    build_key: str,
+    username: str,
+    token: str,
+    repo_name: str,
+    book: Optional[Book] = None,
+) -> DeployJob:
+    """Queue a GitHub Pages deploy of a finished build and return at once"""
+    touch_build(build_dir)
+
+    def run(job: DeployJob) -> dict:
+        touch_build(build_dir)
+        return deploy_to_github(build_dir, username, token, repo_name, book, progress=job.report)
+
+    return get_deploy_queue().submit(build_key, f"{username}/{repo_name}", run, artifact_dir=build_dir)
+
+
 @app.get("/")
 def read_root():
     return {"status": "LiquidBooks API is running"}
@@ -1175,6 +1328,18 @@ async def generate_chapter_content(request: Dict[str, Any]):
 
         additional_instructions = request.get('additional_instructions')
 
+        # Earlier chapters of this book are indexed as they are generated
+        # (only for books with an id: titles are shared between users)
+        if request.get('workspace_id'):
+            book_index = get_book_index(f"workspace:{request['workspace_id']}")
+        else:
+            book_index = get_book_index(f"book:{request['book_id']}" if request.get('book_id') else None)
+        related_passages = book_index.retrieve(
+            query_for_chapter(chapter_title, extra=f"{chapter_description} {' '.join(learning_objectives)}"),
+            token_budget=RELATED_CONTEXT_TOKENS,
+            exclude_chapters={chapter_number}
+        ) if book_index else []
+
         # Build comprehensive system prompt
         book_type_obj = get_book_type(book_type)
         base_system_prompt = book_type_obj.system_prompt if book_type_obj else ""
@@ -1207,6 +1372,12 @@ This is a strict requirement - do not significantly exceed or fall short of this
         objectives_text = "\n".join([f"- {obj}" for obj in learning_objectives])
         components_text = ", ".join(suggested_components)
         additional_text = f"\n\nADDITIONAL REQUIREMENTS:\n{additional_instructions}" if additional_instructions else ""
+        related_text = ""
+        if related_passages:
+            related_text = f"""
+
+RELATED MATERIAL FROM OTHER CHAPTERS (refer back to it where it helps, e.g. "as we saw in Chapter N"):
+{format_passages(related_passages)}"""
 
         user_prompt = f"""Write the complete content for this chapter:
 
@@ -1223,7 +1394,7 @@ SUGGESTED COMPONENTS TO INCLUDE:
 
 Follow the {chapter_template} template structure.
 Use MyST Markdown syntax with appropriate Jupyter Book features.
-Make it engaging, clear, and valuable for the target audience.{additional_text}
+Make it engaging, clear, and valuable for the target audience.{related_text}{additional_text}
 
 IMPORTANT: Start the chapter with the heading formatted as:
 # Chapter {chapter_number}: {chapter_title}
@@ -1242,14 +1413,32 @@ Return ONLY the chapter content in MyST Markdown format."""
         )
 
         content = result["content"]
+        if book_index:
+            book_index.add_chapter(chapter_number, chapter_title, content)
 
-        return {
+        response = {
             "success": True,
             "content": content,
             "estimated_tokens": result.get("tokens_used"),
             "chapter_number": chapter_number
         }
 
+        # Keep the stored chapter in sync so later edits can be sent as patches
+        if request.get('workspace_id'):
+            store = get_workspace_store()
+            key = str(request.get('chapter_id') or chapter_number)
+            stored = await asyncio.to_thread(store.get_item, request['workspace_id'], "chapter", key)
+            chapter = {
+                **(stored["value"] if stored else {"id": key, "order": chapter_number - 1}),
+                "title": chapter_title,
+                "content": content,
+            }
+            response["workspace_item"] = await asyncio.to_thread(
+                store.put_item, request['workspace_id'], "chapter", key, chapter
+            )
+
+        return response
+
     except Exception as e:
         error_msg = str(e)
         print(f"Chapter generation error: {error_msg}")
@@ -1271,6 +1460,8 @@ async def generate_artifacts(request: Dict[str, Any]):
     if not os.getenv("OPENAI_API_KEY"):
         raise HTTPException(status_code=500, detail="OpenAI API key not configured")
 
+    request = await merge_workspace_context(request, ['book_title', 'book_description', 'chapters'])
+
     try:
         # Import artifact types
         from artifact_types import (
@@ -1292,11 +1483,15 @@ async def generate_artifacts(request: Dict[str, Any]):
         if not chapters:
             raise HTTPException(status_code=400, detail="No chapters provided for artifact generation")
 
+        # Index chapter content so each prompt gets the passages relevant to its artifact
+        book_index = build_chapter_index(chapters)
+
         # Analyze each chapter for artifact opportunities
         all_artifacts = []
 
-        for chapter in chapters:
-            chapter_number = chapter.get('chapter_number', 1)
+        for i, chapter in enumerate(chapters):
+            # Numbered like build_chapter_index, so only_chapters finds this chapter's passages
+            chapter_number = chapter.get('chapter_number', i + 1)
             chapter_title = chapter.get('title', '')
             chapter_description = chapter.get('description', '')
             chapter_content = chapter.get('content', '')
@@ -1305,7 +1500,7 @@ async def generate_artifacts(request: Dict[str, Any]):
             # Get suggested artifact types for this chapter
             suggested_artifact_ids = suggest_artifacts_for_content(
                 content_type=book_type,
-                chapter_description=chapter_description + " " + chapter_content[:500],
+                chapter_description=chapter_description + " " + fit_text(chapter_content, 125, summarize=False),
                 learning_objectives=learning_objectives
             )
 
@@ -1328,6 +1523,31 @@ The prompt you create should be:
 
 Return ONLY the generated prompt text, nothing else."""
 
+                # Whole chapter if it fits; otherwise the most relevant passages plus a summary
+                content_budget = remaining_budget(
+                    ARTIFACT_PROMPT_TOKENS,
+                    system_prompt,
+                    artifact_type.prompt_template,
+                    chapter_title,
+                    chapter_description,
+                    ' '.join(learning_objectives),
+                    book_title
+                )
+                if estimate_tokens(chapter_content) <= content_budget:
+                    content_preview = chapter_content
+                else:
+                    content_passages = book_index.retrieve(
+                        f"{artifact_type.name} {artifact_type.description} {chapter_description} {' '.join(learning_objectives)}",
+                        token_budget=content_budget // 2,
+                        k=3,
+                        only_chapters={chapter_number}
+                    )
+                    packed = pack_sections([
+                        ContextSection("passages", "\n\n".join(p.text for p in content_passages), priority=2, summarize=False),
+                        ContextSection("chapter", chapter_content, priority=1)
+                    ], content_budget)
+                    content_preview = "\n\n".join(text for text in packed.values() if text)
+
                 user_prompt = f"""Create a detailed prompt for generating a {artifact_type.name} for this chapter:
 
 Chapter {chapter_number}: {chapter_title}
@@ -1335,7 +1555,7 @@ Description: {chapter_description}
 Learning Objectives: {', '.join(learning_objectives)}
 
 Content Preview:
-{chapter_content[:1000]}
+{content_preview}
 
 Book Context:
 - Title: {book_title}
@@ -1422,6 +1642,8 @@ async def enhance_book(request: Dict[str, Any]):
     if not os.getenv("OPENAI_API_KEY"):
         raise HTTPException(status_code=500, detail="OpenAI API key not configured")
 
+    request = await merge_workspace_context(request, ['book_title', 'book_description', 'chapters'])
+
     try:
         # Extract book context
         book_title = request.get('book_title', '')
@@ -1432,6 +1654,7 @@ async def enhance_book(request: Dict[str, Any]):
             raise HTTPException(status_code=400, detail="No chapters provided for enhancement")
 
         enhancements = []
+        book_index = build_chapter_index(chapters)
 
         # Enhance each chapter
         for i, chapter in enumerate(chapters):
@@ -1455,34 +1678,52 @@ Your task is to review a chapter and suggest enhancements that will improve:
 
 Return your suggestions as a structured JSON object."""
 
+            format_spec = """{
+  "cross_references": [
+    {"reference_to": "Chapter X", "location": "Section name", "reason": "Why this reference helps"}
+  ],
+  "chapter_transition": "Suggested opening paragraph that transitions from previous chapter",
+  "forward_hook": "Suggested closing paragraph that creates anticipation for next chapter",
+  "glossary_terms": [
+    {"term": "Term name", "definition": "Clear definition"}
+  ],
+  "callouts": [
+    {"type": "tip|warning|note", "location": "Where to place", "content": "Callout content"}
+  ],
+  "code_enhancements": [
+    {"location": "Code block identifier", "suggestion": "How to improve"}
+  ]
+}"""
+
+            # The chapter itself gets priority; related passages fill the room that is left
+            content_budget = remaining_budget(ENHANCE_PROMPT_TOKENS, system_prompt, format_spec, book_description)
+            chapter_text = fit_text(chapter_content, content_budget - min(RELATED_CONTEXT_TOKENS, content_budget // 3))
+
+            # Passages from other chapters that this one could cross-reference
+            related_passages = book_index.retrieve(
+                query_for_chapter(chapter_title, chapter_content),
+                token_budget=content_budget - estimate_tokens(chapter_text),
+                exclude_chapters={chapter_number}
+            )
+            related_text = format_passages(related_passages) if related_passages else "None found"
+
             user_prompt = f"""Review and enhance this chapter from the book "{book_title}":
 
 **Chapter {chapter_number}: {chapter_title}**
 
-{chapter_content[:2000]}
+{chapter_text}
 
 **Context:**
 - Previous Chapter: {prev_chapter['title'] if prev_chapter else 'N/A'}
 - Next Chapter: {next_chapter['title'] if next_chapter else 'N/A'}
 - Book Description: {book_description}
 
+**Related passages from other chapters (candidates for cross-references):**
+
+{related_text}
+
 Provide enhancement suggestions in this JSON format:
-{{
-  "cross_references": [
-    {{"reference_to": "Chapter X", "location": "Section name", "reason": "Why this reference helps"}}
-  ],
-  "chapter_transition": "Suggested opening paragraph that transitions from previous chapter",
-  "forward_hook": "Suggested closing paragraph that creates anticipation for next chapter",
-  "glossary_terms": [
-    {{"term": "Term name", "definition": "Clear definition"}}
-  ],
-  "callouts": [
-    {{"type": "tip|warning|note", "location": "Where to place", "content": "Callout content"}}
-  ],
-  "code_enhancements": [
-    {{"location": "Code block identifier", "suggestion": "How to improve"}}
-  ]
-}}"""
+{format_spec}"""
 
             # Call AI for enhancements
             ai = get_ai_provider()
@@ -1527,114 +1768,822 @@ async def build_book(request: BuildRequest):
     print(f"[Build API] GitHub token provided: {'Yes' if request.github_token else 'No'}")
     print(f"[Build API] Repo name: {request.repo_name}")
 
-    # Create temporary directory for book
-    temp_dir = Path(tempfile.mkdtemp(prefix="liquidbook_"))
+    if request.workspace_id:
+        try:
+            stored_book = await asyncio.to_thread(get_workspace_store().load_book, request.workspace_id)
+        except WorkspaceNotFoundError:
+            raise HTTPException(status_code=404, detail=f"Workspace not found: {request.workspace_id}")
+        if request.book is None:
+            if stored_book is None:
+                raise HTTPException(status_code=400, detail="Workspace has no book")
+            request.book = Book(**stored_book)
+            print(f"[Build API] Loaded book from workspace {request.workspace_id}")
+    if request.book is None:
+        raise HTTPException(status_code=400, detail="Either book or workspace_id is required")
+    formats = [name for name in dict.fromkeys(request.formats or []) if name != "html"]
+    unknown_formats = [name for name in formats if name not in OUTPUT_FORMATS]
+    if unknown_formats:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown output format(s): {', '.join(unknown_formats)} (available: {', '.join(OUTPUT_FORMATS)})",
+        )
+
+    # Reuse the book's persistent build workspace so unchanged chapters are not rebuilt
+    book_dir = get_book_build_dir(request.book.id)
+    workspaces = get_workspace_manager()
+    workspaces.touch(book_dir)
+    print(f"[Build API] Build workspace: {book_dir} ({'full' if request.full_rebuild else 'incremental'} build)")
+
+    emitter = BookEmitter(book_dir)
+    build_pool = get_build_pool()
+    build_id = request.build_id or uuid.uuid4().hex
+    build_log = start_build_log(build_id)
+
+    # Reject chapters that would build broken before any work starts
+    if not request.skip_lint:
+        lint = lint_chapters(request.book, request.features)
+        if not lint["valid"]:
+            build_log.info(f"MyST check found {lint['errors']} error(s) in {lint['lint_ms']}ms", lint=lint)
+            build_log.finish(False, "MyST check failed")
+            raise HTTPException(
+                status_code=422,
+                detail={"error": f"MyST check found {lint['errors']} error(s); fix them or pass skip_lint", "lint": lint},
+            )
+
+    # One build at a time per book workspace; waiting for it counts as queued
+    book_key = str(book_dir)
+    holds_book = False
+    if build_pool.is_building(book_key):
+        build_log.info("Waiting for another build of this book to finish")
 
     try:
-        # Generate Jupyter Book files
-        generate_config_yml(request.book, temp_dir, request.features)
-        generate_toc_yml(request.book, temp_dir)
-        write_chapters(request.book, temp_dir)
+        await build_pool.acquire_book(book_key, build_id)
+        holds_book = True
+        build_log.start_phase("config")
+        # Generate Jupyter Book files (unchanged files keep their mtime)
+        config_text = generate_config_yml(request.book, book_dir, request.features, emitter=emitter)
+        generate_toc_yml(request.book, book_dir, emitter=emitter)
+        write_chapters(request.book, book_dir, emitter=emitter)
 
         # Generate and write copyright page
         copyright_content = generate_copyright_page(request.book)
-        (temp_dir / "copyright.md").write_text(copyright_content)
+        emitter.write("copyright.md", copyright_content)
 
         # Generate and write front matter pages
         front_matter = generate_front_matter_pages(request.book)
         for filename, content in front_matter.items():
-            (temp_dir / f"{filename}.md").write_text(content)
+            emitter.write(f"{filename}.md", content)
 
         # Generate and write back matter pages
         back_matter = generate_back_matter_pages(request.book)
         for filename, content in back_matter.items():
-            (temp_dir / f"{filename}.md").write_text(content)
+            emitter.write(f"{filename}.md", content)
 
         # Create references.bib (empty for now)
-        (temp_dir / "references.bib").write_text("")
+        emitter.write("references.bib", "")
+
+        # Drop pages of chapters that were renamed or deleted
+        emitter.remove_orphans()
+        changes = emitter.changes
+        build_log.info(
+            f"Sources: {len(changes.written)} written, "
+            f"{len(changes.unchanged)} unchanged, {len(changes.removed)} removed",
+            changes=changes.to_dict(),
+        )
 
-        # Build the book
-        build_result = build_jupyter_book(temp_dir)
+        build_cache = get_build_cache()
+        publishing_info = getattr(request.book, 'publishingInfo', None)
+        optimize_assets = OPTIMIZE_ASSETS if request.optimize_assets is None else request.optimize_assets
+        key_sources = (
+            [chapter.model_dump() for chapter in request.book.chapters],
+            publishing_info if isinstance(publishing_info, dict) else None,
+            request.features,
+            config_text,
+        )
+        build_key = compute_build_key(*key_sources, options={"optimize_assets": True} if optimize_assets else None)
+        # Recorded with the build, so a workspace is only reused for the same options
+        build_options = "optimize_assets" if optimize_assets else ""
+
+        # Other formats are cached by the sources alone (asset optimization only changes HTML)
+        format_cache = get_format_cache()
+        format_key = compute_build_key(*key_sources)
+        missing_formats = [name for name in formats if format_cache.get(format_key, name) is None]
+
+        # Build the book, unless these exact sources were already built here or elsewhere
+        output_dir = book_dir
+        cached = False
+        build_stats = None
+        asset_report = None
+        reexecute = [
+            filename for chapter, filename in chapter_files(request.book)
+            if chapter.title in (request.reexecute_chapters or [])
+        ]
+        reuse_build = not request.full_rebuild and not reexecute
+        # An unoptimized build is optimized in place below; an optimized one is never reused unoptimized
+        if reuse_build and (emitter.up_to_date(build_options) or (optimize_assets and emitter.up_to_date())):
+            build_log.info("No source changes, reusing existing build")
+        # Format builders need this workspace's doctrees, so missing formats mean building here
+        elif reuse_build and not missing_formats and (cache_entry := build_cache.get(build_key)):
+            build_log.info(f"Build cache hit {build_key[:12]}")
+            output_dir = cache_entry
+            cached = True
+        else:
+            chapter_count = len(request.book.chapters)
+            requested_jobs = resolve_jobs(SPHINX_JOBS) if chapter_count >= PARALLEL_BUILD_MIN_CHAPTERS else 1
+            jobs, serial_reason = choose_jobs(book_dir, requested_jobs)
+            if serial_reason:
+                build_log.info(f"Building serially: {serial_reason}")
+
+            # Pages Sphinx does not rewrite would keep their minified, fingerprinted assets
+            site_dir = book_dir / "_build" / "html"
+            if not optimize_assets and (site_dir / OPTIMIZE_MANIFEST).exists():
+                build_log.info("Removing the optimized site to build it without asset optimization")
+                await asyncio.to_thread(shutil.rmtree, site_dir)
+
+            # Linked assets are shared with other builds; Sphinx must not write into them
+            await asyncio.to_thread(get_asset_store().unshare, site_dir)
+
+            build_log.start_phase("queued")
+            async with build_pool.slot(build_id):
+                build_log.start_phase("config")
+                started = time.monotonic()
+                build_result = await build_jupyter_book(
+                    book_dir,
+                    full_rebuild=request.full_rebuild,
+                    build_log=build_log,
+                    jobs=jobs,
+                    reexecute=reexecute,
+                )
+                seconds = time.monotonic() - started
 
-        if not build_result["success"]:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Build failed: {build_result.get('stderr', build_result.get('error'))}",
+            serial_fallback = {"read": [], "write": []}
+            if jobs > 1:
+                serial_fallback = record_serial_fallback(
+                    book_dir, build_result.get("stdout", "") + build_result.get("stderr", "")
+                )
+                for phase, names in serial_fallback.items():
+                    if names:
+                        build_log.info(f"Sphinx {phase} phase ran serially because of: {', '.join(names)}")
+
+            build_stats = {
+                "chapters": chapter_count,
+                "jobs": jobs,
+                "seconds": round(seconds, 2),
+                "seconds_per_chapter": round(seconds / max(chapter_count, 1), 3),
+                "full_rebuild": request.full_rebuild,
+                "sources_changed": len(changes.written) + len(changes.removed),
+                "parallel_read": jobs > 1 and not serial_fallback["read"],
+                "parallel_write": jobs > 1 and not serial_fallback["write"],
+                "warm_worker": build_result.get("warm_worker", False),
+            }
+            build_pool.record_stats(build_stats)
+            build_log.info(
+                f"{chapter_count} chapters in {build_stats['seconds']}s with {jobs} job(s) "
+                f"({build_stats['seconds_per_chapter']}s/chapter)",
+                stats=build_stats,
             )
 
-        # If GitHub credentials provided, deploy
+            if not build_result["success"]:
+                emitter.mark_failed()
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Build failed: {build_error(build_result)}",
+                )
+            emitter.mark_built()
+
+        # Optimize before caching; rerunning over an optimized site is cheap and changes nothing
+        if optimize_assets and not cached:
+            build_log.start_phase("optimize")
+            asset_report = await asyncio.to_thread(optimize_site, book_dir / "_build" / "html")
+            build_log.info(
+                f"Assets optimized: {asset_report['minified_bytes_saved']} bytes saved by minifying, "
+                f"{asset_report['precompressed_bytes']} -> {asset_report['gzip_bytes']} bytes gzipped",
+                asset_optimization=asset_report,
+            )
+            emitter.mark_built(build_options)
+        if build_stats is not None or asset_report is not None:
+            shared = await asyncio.to_thread(get_asset_store().share, book_dir / "_build" / "html")
+            if shared["linked"]:
+                build_log.info(f"Asset store: {shared['linked']} of {shared['files']} assets already stored, {shared['bytes_saved']} bytes shared")
+        # Cache fresh builds, and existing builds optimized for the first time
+        if build_stats is not None or (asset_report is not None and build_cache.get(build_key) is None):
+            await asyncio.to_thread(build_cache.put, build_key, book_dir, build_in_use)
+
+        # LaTeX/PDF/EPUB from the doctrees just written, cached per format by source key
+        format_results = {}
+        built_formats = {}
+        if missing_formats:
+            build_log.start_phase("formats")
+            built_formats = await build_output_formats(book_dir, missing_formats, build_id, build_log)
+            for name, result in built_formats.items():
+                if result["success"]:
+                    await asyncio.to_thread(format_cache.put, format_key, name, result["path"])
+        for name in formats:
+            cached_format = name not in missing_formats
+            if not cached_format and not built_formats[name]["success"]:
+                format_results[name] = {"success": False, "cached": False, "error": built_formats[name]["error"]}
+                continue
+            # A cached file can be evicted by another build's put; a fresh one is still in the workspace
+            path = format_cache.path(format_key, name) if cached_format else built_formats[name]["path"]
+            try:
+                size = path.stat().st_size
+            except FileNotFoundError:
+                format_results[name] = {"success": False, "cached": False, "error": "Evicted from the format cache, build again"}
+                continue
+            format_results[name] = {
+                "success": True,
+                "cached": cached_format,
+                "file": OUTPUT_FORMATS[name][1],
+                "size": size,
+                # Without the format cache the file is only in the workspace
+                "url": f"/api/build/{format_key}/formats/{name}" if format_cache.enabled else None,
+            }
+
+        # Measure this workspace, then drop expired and least-recently-used ones
+        await asyncio.to_thread(workspaces.record, book_dir)
+        await asyncio.to_thread(workspaces.sweep, build_in_use)
+
+        # If GitHub credentials provided, queue the deploy; its progress is at /api/deploy/{deploy_id}
         deploy_url = None
+        deploy_id = None
         if request.github_username and request.github_token and request.repo_name:
-            deploy_result = deploy_to_github(
-                temp_dir,
+            # Deploy the immutable build cache entry when there is one: the
+            # workspace may be rebuilt while the deploy waits
+            artifact_dir = build_cache.get(build_key) or output_dir
+            deploy_job = queue_github_deploy(
+                artifact_dir,
+                build_key,
                 request.github_username,
                 request.github_token,
                 request.repo_name,
                 request.book,
             )
-
-            if deploy_result["success"]:
-                deploy_url = deploy_result["url"]
+            deploy_id = deploy_job.deploy_id
+            deploy_url = github_pages_url(request.github_username, request.repo_name)
+            build_log.info(f"Deploy {deploy_id} queued", deploy_id=deploy_id)
 
         # For local testing, provide path to built HTML
-        html_path = str(temp_dir / "_build" / "html" / "index.html")
+        html_path = str(output_dir / "_build" / "html" / "index.html")
+        message = "Book served from build cache" if cached else "Book built successfully!"
+        failed_formats = [name for name, result in format_results.items() if not result["success"]]
+        if failed_formats:
+            message += f" Failed formats: {', '.join(failed_formats)}."
+        if deploy_id:
+            message += " Deploy to GitHub Pages queued."
+        build_log.finish(True, message)
 
         return BuildResponse(
             success=True,
-            message="Book built successfully!",
+            message=message,
             url=deploy_url or f"file://{html_path}",
-            build_dir=str(temp_dir),
+            build_dir=str(output_dir),
+            changes=changes.to_dict(),
+            cached=cached,
+            build_key=build_key,
+            build_id=build_id,
+            build_stats=build_stats,
+            deploy_id=deploy_id,
+            asset_optimization=asset_report,
+            formats=format_results or None,
+        )
+
+    except BuildQueueFull as e:
+        print(f"[Build API] Queue full, rejecting build {build_id}")
+        build_log.finish(False, f"Build queue is full, retry in {e.retry_after}s")
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many builds in progress, retry in {e.retry_after}s",
+            headers={"Retry-After": str(e.retry_after)},
         )
 
     except Exception as e:
-        # Clean up on error
+        # Keep the workspace on error: its doctrees are still valid for the next build
         error_trace = traceback.format_exc()
         print(f"Error building book: {str(e)}")
         print(f"Traceback: {error_trace}")
-        shutil.rmtree(temp_dir, ignore_errors=True)
+        build_log.finish(False, str(e))
         raise HTTPException(status_code=500, detail=f"{str(e)}\n\nTraceback: {error_trace}")
 
+    finally:
+        build_log.finish(False, "Build cancelled")
+        if holds_book:
+            build_pool.release_book(book_key)
+
+
+@app.get("/api/build/{build_id}/events")
+async def stream_build_events(build_id: str, since: int = 0, last_event_id: Optional[str] = Header(None)):
+    """
+    Stream a build's log over Server-Sent Events
+
+    Events are JSON objects with a 'type': 'phase' / 'phase_end' (with
+    'seconds') as the build moves through config, queued, reading, executing,
+    writing, optimize (when assets are optimized) and formats (when LaTeX,
+    PDF or EPUB are built); 'log' for each line of jupyter-book output (with
+    'builder' for the format builders); 'info' for API status messages; and
+    a final 'done' with per-phase timings.
+    Clients may subscribe before posting to /api/build with the same build_id;
+    if no build starts within BUILD_EVENTS_WAIT seconds the stream ends with
+    an unsuccessful 'done'.
+    Reconnecting clients resume after Last-Event-ID.
+    """
+    build_log = get_build_log(build_id)
+    start = int(last_event_id) + 1 if last_event_id and last_event_id.isdigit() else since
+
+    async def event_generator():
+        async for index, event in build_log.follow(start):
+            yield format_sse(event, index)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/build/{build_key}/formats/{output_format}")
+async def download_build_format(build_key: str, output_format: str):
+    """
+    Download a built LaTeX (zip), PDF or EPUB by the key in its /api/build response
+
+    Formats are built by passing 'formats' to /api/build.
+    """
+    if output_format not in MEDIA_TYPES:
+        raise HTTPException(status_code=404, detail=f"Unknown output format: {output_format}")
+    path = get_format_cache().get(build_key, output_format)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"No {output_format} built for {build_key}")
+    return FileResponse(path, media_type=MEDIA_TYPES[output_format], filename=OUTPUT_FORMATS[output_format][1])
+
+
+@app.get("/api/build/queue")
+async def get_build_queue(build_id: Optional[str] = None):
+    """
+    Build pool status
+
+    With build_id, also reports that build's position: 0 while running,
+    1.. while queued, null once it has finished (or was never queued).
+    """
+    build_pool = get_build_pool()
+    status = build_pool.status()
+    if build_id:
+        status["build_id"] = build_id
+        status["position"] = build_pool.position(build_id)
+    return status
+
+
+def resolve_build_dir(build_dir: str) -> Path:
+    """
+    A build directory named in a request: only book build workspaces and
+    build cache entries under the data directory are accepted
+
+    Raises:
+        HTTPException: 404 for any other path
+    """
+    path = Path(build_dir).resolve()
+    for root in (get_workspace_manager().root, get_build_cache().root):
+        if path.parent == root.resolve() and not path.name.startswith(".") and path.is_dir():
+            return path
+    raise HTTPException(status_code=404, detail="Build directory not found")
+
+
+def resolve_build_artifact(build_key: Optional[str], build_dir: Optional[str]) -> Tuple[Path, str]:
+    """Build directory and artifact id of a finished build, by build key or directory"""
+    if build_key:
+        cache_entry = get_build_cache().get(build_key)
+        if cache_entry is None:
+            raise HTTPException(status_code=404, detail=f"Build not found in the build cache: {build_key}")
+        return cache_entry, build_key
+    if build_dir:
+        path = resolve_build_dir(build_dir)
+        if not (path / "_build" / "html").exists():
+            raise HTTPException(status_code=404, detail="Build output not found")
+        return path, path.name
+    raise HTTPException(status_code=400, detail="Either build_key or build_dir is required")
+
+
+@app.post("/api/deploy")
+async def deploy_book(request: DeployRequest):
+    """
+    Queue a GitHub Pages deploy of an existing build
+
+    Returns at once with a deploy_id; poll /api/deploy/{deploy_id} for its
+    progress and final URL. Transient failures are retried.
+    """
+    build_dir, build_key = resolve_build_artifact(request.build_key, request.build_dir)
+
+    book = request.book
+    if book is None and request.workspace_id:
+        try:
+            stored_book = await asyncio.to_thread(get_workspace_store().load_book, request.workspace_id)
+        except WorkspaceNotFoundError:
+            raise HTTPException(status_code=404, detail=f"Workspace not found: {request.workspace_id}")
+        book = Book(**stored_book) if stored_book else None
+
+    job = queue_github_deploy(build_dir, build_key, request.github_username, request.github_token, request.repo_name, book)
+    return {
+        "success": True,
+        "deploy_id": job.deploy_id,
+        "status": job.status,
+        "url": github_pages_url(request.github_username, request.repo_name),
+    }
+
+
+@app.post("/api/publish")
+async def publish_book(request: PublishRequest):
+    """
+    Queue publishing an existing build to a local directory or S3 target
+
+    Only changed files are transferred. Returns at once with a deploy_id;
+    progress, the final URL and the transfer report ('result') are at
+    /api/deploy/{deploy_id}.
+    """
+    build_dir, build_key = resolve_build_artifact(request.build_key, request.build_dir)
+    try:
+        publisher = create_publisher(request.target)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    site_dir = build_dir / "_build" / "html"
+    touch_build(build_dir)
+
+    def run(job: DeployJob) -> dict:
+        touch_build(build_dir)
+        try:
+            report = asyncio.run(publisher.publish(site_dir, progress=job.report))
+        except PublishError as e:
+            return {"success": False, "error": str(e), "retryable": e.transient}
+        message = "Site published" if report["changed"] else "Site already up to date"
+        return {"success": True, "message": message, **report}
+
+    job = get_deploy_queue().submit(build_key, publisher.describe(), run, artifact_dir=build_dir)
+    return {"success": True, "deploy_id": job.deploy_id, "status": job.status, "target": publisher.describe()}
+
+
+@app.get("/api/build/workspaces")
+async def get_build_workspaces():
+    """
+    Disk usage of build workspaces, the build cache, download archives,
+    built formats and the asset store
+
+    Workspaces are listed most recently used first, with their size and
+    seconds since their last build, download or deploy.
+    """
+    workspaces, build_cache, archives, formats, assets = await asyncio.gather(
+        asyncio.to_thread(get_workspace_manager().stats),
+        asyncio.to_thread(get_build_cache().stats),
+        asyncio.to_thread(get_archive_cache().stats),
+        asyncio.to_thread(get_format_cache().stats),
+        asyncio.to_thread(get_asset_store().stats),
+    )
+    return {
+        "workspaces": workspaces,
+        "build_cache": build_cache,
+        "archive_cache": archives,
+        "format_cache": formats,
+        "asset_store": assets,
+    }
+
+
+@app.post("/api/build/workspaces/sweep")
+async def sweep_build_workspaces():
+    """Remove expired build workspaces and enforce the workspace disk quota now"""
+    return await asyncio.to_thread(get_workspace_manager().sweep, build_in_use)
+
+
+@app.get("/api/deploy/queue")
+async def get_deploy_queue_status():
+    """Deploys in progress and queue settings"""
+    return get_deploy_queue().status()
+
+
+@app.get("/api/deploy/{deploy_id}")
+async def get_deploy_status(deploy_id: str):
+    """
+    Status of a queued deploy
+
+    'status' is queued, running, retrying, succeeded or failed; 'progress'
+    lists the steps so far, 'url' is set once the site is published and
+    'error' after a failed attempt.
+    """
+    job = get_deploy_queue().get(deploy_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Deploy not found: {deploy_id}")
+    return job.to_dict()
+
+
+@app.post("/api/lint")
+async def lint_book_chapters(request: LintRequest):
+    """
+    Check every chapter for MyST problems in milliseconds
+
+    The same check runs before each build (422 on errors): unclosed fences,
+    directives and roles the book's features do not provide, invalid quiz
+    JSON. Issues carry the chapter, file and line.
+    """
+    book = request.book
+    if book is None and request.workspace_id:
+        try:
+            stored_book = await asyncio.to_thread(get_workspace_store().load_book, request.workspace_id)
+        except WorkspaceNotFoundError:
+            raise HTTPException(status_code=404, detail=f"Workspace not found: {request.workspace_id}")
+        if stored_book is None:
+            raise HTTPException(status_code=400, detail="Workspace has no book")
+        book = Book(**stored_book)
+    if book is None:
+        raise HTTPException(status_code=400, detail="Either book or workspace_id is required")
+
+    return {"success": True, **lint_chapters(book, request.features)}
+
+
+@app.post("/api/preview")
+async def preview_chapter(request: ChapterPreviewRequest):
+    """
+    Render one chapter's MyST markdown to HTML in milliseconds
+
+    Uses the MyST extensions the book build would enable for the same
+    features, but no Sphinx build: Sphinx-only directives and roles (tabs,
+    cards, proofs, references, ...) are rendered approximately and listed in
+    'fallbacks'.
+    """
+    content = request.content
+    if content is None:
+        if not (request.workspace_id and request.chapter_key):
+            raise HTTPException(status_code=400, detail="Provide content, or workspace_id and chapter_key")
+        try:
+            item = await asyncio.to_thread(
+                get_workspace_store().get_item, request.workspace_id, "chapter", request.chapter_key
+            )
+        except WorkspaceNotFoundError:
+            raise HTTPException(status_code=404, detail=f"Workspace not found: {request.workspace_id}")
+        if item is None:
+            raise HTTPException(status_code=404, detail=f"Chapter not found: {request.chapter_key}")
+        content = item["value"].get("content", "")
+
+    return {"success": True, **render_preview(content, request.features)}
+
+
+async def book_archive_response(build_dir: Optional[str], profile: str, build_key: Optional[str] = None):
+    """Zip download of a build (cached archive, or streamed while it is compressed)"""
+    if build_key:
+        build_path = get_build_cache().get(build_key)
+        if build_path is None:
+            raise HTTPException(status_code=404, detail=f"Build not found in the build cache: {build_key}")
+    elif build_dir:
+        build_path = resolve_build_dir(build_dir)
+    else:
+        raise HTTPException(status_code=400, detail="Either build_key or build_dir is required")
+    touch_build(build_path)
+    if profile not in EXPORT_PROFILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown profile '{profile}', expected one of: {', '.join(EXPORT_PROFILES)}",
+        )
+
+    files = await asyncio.to_thread(export_files, build_path, profile)
+    if not files:
+        raise HTTPException(status_code=404, detail=f"Build has no files for the '{profile}' profile")
+    key = await asyncio.to_thread(archive_key, files, profile)
+
+    filename = "book.zip" if profile == "full" else f"book-{profile}.zip"
+    headers = {"X-Archive-Key": key, "X-Export-Profile": profile}
+    cached = get_archive_cache().get(key)
+    if cached is not None:
+        # Served from disk with Content-Length and Range support
+        return FileResponse(cached, media_type="application/zip", filename=filename, headers=headers)
+
+    return StreamingResponse(
+        stream_archive(files, key),
+        media_type="application/zip",
+        headers={**headers, "Content-Disposition": f"attachment; filename={filename}"},
+    )
+
 
 @app.post("/api/ai/download-book")
 async def download_book(request: Dict[str, Any]):
-    """Create a zip file of the built book for download"""
-    import zipfile
-    import io
+    """
+    Download a zip file of the built book
+
+    The build is given by 'build_key' (from the build cache) or 'build_dir'
+    (a build workspace from a /api/build response). 'profile' selects what
+    goes in: 'html-only' (the built site), 'sources-only' (the Jupyter Book
+    sources) or 'full' (the whole build workspace, the default). The first download of a build is compressed in a
+    worker thread and streamed chunk by chunk; the finished archive is cached,
+    so later downloads of the same build are served from disk.
+    """
+    return await book_archive_response(
+        request.get('build_dir'), request.get('profile') or DEFAULT_EXPORT_PROFILE, build_key=request.get('build_key')
+    )
 
-    build_dir = request.get('build_dir')
-    if not build_dir:
-        raise HTTPException(status_code=400, detail="build_dir is required")
 
-    build_path = Path(build_dir)
-    if not build_path.exists():
-        raise HTTPException(status_code=404, detail="Build directory not found")
+@app.get("/api/ai/download-book")
+async def download_book_get(
+    build_dir: Optional[str] = None,
+    profile: str = DEFAULT_EXPORT_PROFILE,
+    build_key: Optional[str] = None,
+):
+    """
+    Download a zip file of the built book from a plain link
 
-    try:
-        # Create zip file in memory
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            # Walk through the build directory
-            for file_path in build_path.rglob('*'):
-                if file_path.is_file():
-                    # Get relative path for the zip archive
-                    arcname = file_path.relative_to(build_path)
-                    zip_file.write(file_path, arcname)
-
-        # Seek to beginning of buffer
-        zip_buffer.seek(0)
-
-        # Return as streaming response
-        return StreamingResponse(
-            iter([zip_buffer.getvalue()]),
-            media_type="application/zip",
-            headers={
-                "Content-Disposition": f"attachment; filename=book.zip"
-            }
+    Same as the POST endpoint. Cached archives honour Range requests, so
+    browsers and download managers can resume interrupted downloads.
+    """
+    return await book_archive_response(build_dir, profile, build_key=build_key)
+
+
+def context_encoder_for(style: Optional[str], prune_fields: Optional[List[str]]) -> ContextEncoder:
+    """
+    Context encoder for one prompt of a request
+
+    Raises:
+        HTTPException: 400 if the request asks for an unsupported context_encoding
+    """
+    if style and style.lower() not in ENCODING_STYLES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported context_encoding: {style} (use {' or '.join(ENCODING_STYLES)})",
         )
+    return ContextEncoder(style=style, prune_fields=prune_fields)
+
+
+async def merge_workspace_context(request: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    """
+    Fill missing request fields from the request's workspace
+
+    Fields sent in the request always win over stored ones, so clients can
+    reference a workspace and still override individual items.
+
+    Args:
+        request: Endpoint request dict, optionally with 'workspace_id'
+        fields: Request fields the endpoint can resolve from the workspace
+
+    Returns:
+        Merged request dict (the original if no workspace_id was given)
+    """
+    workspace_id = request.get('workspace_id')
+    if not workspace_id:
+        return request
+
+    try:
+        stored = await asyncio.to_thread(get_workspace_store().load_context, workspace_id, fields)
+    except WorkspaceNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Workspace not found: {workspace_id}")
+
+    # Stored Book chapters carry 'order'; AI endpoints expect 'chapter_number'
+    if 'chapters' in stored:
+        stored['chapters'] = [
+            {**chapter, 'chapter_number': chapter.get('chapter_number', chapter.get('order', i) + 1)}
+            for i, chapter in enumerate(stored['chapters'])
+        ]
+
+    provided = {key: value for key, value in request.items() if value not in (None, "", [], {})}
+    print(f"[Workspace] {workspace_id}: resolved {sorted(set(stored) - set(provided))} from store")
+    return {**stored, **provided}
+
+
+async def save_workspace_context(request: Dict[str, Any], fields: Dict[str, Any]):
+    """Store generated research (brand identity, landing page spec, ...) back in the request's workspace"""
+    workspace_id = request.get('workspace_id')
+    if not workspace_id:
+        return
+    try:
+        await asyncio.to_thread(get_workspace_store().put_context, workspace_id, fields)
     except Exception as e:
-        print(f"Error creating zip: {str(e)}")
-        print(traceback.format_exc())
-        raise HTTPException(status_code=500, detail=f"Failed to create download: {str(e)}")
+        print(f"[Workspace] Failed to save {list(fields)} to {workspace_id}: {str(e)}")
+
+
+@app.post("/api/workspaces")
+async def create_workspace(request: WorkspaceCreateRequest):
+    """Create a workspace, optionally seeded with a book and research context"""
+    store = get_workspace_store()
+
+    def create():
+        workspace_id = store.create_workspace(request.name)
+        if request.book:
+            store.put_book(workspace_id, request.book)
+        if request.context:
+            store.put_context(workspace_id, request.context)
+        return workspace_id, store.get_manifest(workspace_id)
+
+    workspace_id, manifest = await asyncio.to_thread(create)
+    return {
+        "success": True,
+        "workspace_id": workspace_id,
+        "manifest": manifest,
+    }
+
+
+@app.get("/api/workspaces/{workspace_id}")
+async def get_workspace(workspace_id: str):
+    """Workspace manifest: every stored item with its content hash and version"""
+    try:
+        return await asyncio.to_thread(get_workspace_store().get_manifest, workspace_id)
+    except WorkspaceNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Workspace not found: {workspace_id}")
+
+
+@app.delete("/api/workspaces/{workspace_id}")
+async def delete_workspace(workspace_id: str):
+    """Delete a workspace and release its unreferenced blobs"""
+    store = get_workspace_store()
+    try:
+        await asyncio.to_thread(store.delete_workspace, workspace_id)
+    except WorkspaceNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Workspace not found: {workspace_id}")
+    return {"success": True, "blobs_removed": await asyncio.to_thread(store.gc_blobs)}
+
+
+@app.put("/api/workspaces/{workspace_id}/book")
+async def put_workspace_book(workspace_id: str, book: Dict[str, Any]):
+    """
+    Store a full book in a workspace
+
+    Chapters are stored individually by content hash, so re-sending a book
+    only bumps the versions of chapters that actually changed.
+    """
+    try:
+        result = await asyncio.to_thread(get_workspace_store().put_book, workspace_id, book)
+    except WorkspaceNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Workspace not found: {workspace_id}")
+    return {"success": True, **result}
+
+
+@app.get("/api/workspaces/{workspace_id}/items/{kind}/{key}")
+async def get_workspace_item(workspace_id: str, kind: str, key: str):
+    """Fetch one stored item with its hash and version"""
+    try:
+        item = await asyncio.to_thread(get_workspace_store().get_item, workspace_id, kind, key)
+    except WorkspaceNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Workspace not found: {workspace_id}")
+    if item is None:
+        raise HTTPException(status_code=404, detail=f"Item not found: {kind}/{key}")
+    return item
+
+
+@app.put("/api/workspaces/{workspace_id}/items/{kind}/{key}")
+async def put_workspace_item(workspace_id: str, kind: str, key: str, request: WorkspaceItemRequest):
+    """Store or replace one item (a chapter, avatar, brand identity, ...)"""
+    try:
+        result = await asyncio.to_thread(
+            get_workspace_store().put_item,
+            workspace_id, kind, key, request.value, expected_version=request.expected_version,
+        )
+    except WorkspaceNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Workspace not found: {workspace_id}")
+    except VersionConflictError as e:
+        raise HTTPException(
+            status_code=409,
+            detail={"error": str(e), "version": e.current_version, "hash": e.current_hash},
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, **result}
+
+
+@app.patch("/api/workspaces/{workspace_id}/chapters/{chapter_key}")
+async def patch_workspace_chapter(workspace_id: str, chapter_key: str, request: ChapterPatchRequest):
+    """
+    Apply text edits to a stored chapter
+
+    The request carries only the changed spans, so its size tracks the edit
+    rather than the chapter. Returns 409 with the current version and hash if
+    the chapter changed since base_version; the client should then re-fetch
+    and recompute its ops.
+    """
+    updates = {"title": request.title} if request.title is not None else None
+    try:
+        result = await asyncio.to_thread(
+            get_workspace_store().patch_text,
+            workspace_id,
+            "chapter",
+            chapter_key,
+            [op.model_dump() for op in request.ops],
+            base_version=request.base_version,
+            updates=updates,
+        )
+    except WorkspaceNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Workspace not found: {workspace_id}")
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Chapter not found: {chapter_key}")
+    except VersionConflictError as e:
+        raise HTTPException(
+            status_code=409,
+            detail={"error": str(e), "version": e.current_version, "hash": e.current_hash},
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, **result}
+
+
+@app.delete("/api/workspaces/{workspace_id}/items/{kind}/{key}")
+async def delete_workspace_item(workspace_id: str, kind: str, key: str):
+    """Remove one item from a workspace"""
+    try:
+        removed = await asyncio.to_thread(get_workspace_store().delete_item, workspace_id, kind, key)
+    except WorkspaceNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Workspace not found: {workspace_id}")
+    if not removed:
+        raise HTTPException(status_code=404, detail=f"Item not found: {kind}/{key}")
+    return {"success": True}
 
 
 @app.post("/api/ai/generate-book", response_model=AIResponse)
@@ -2313,6 +3262,8 @@ async def generate_avatar_diary(request: DiaryGenerationRequest):
     if not os.getenv("OPENAI_API_KEY"):
         raise HTTPException(status_code=500, detail="OpenAI API key not configured")
 
+    encoder = context_encoder_for(request.context_encoding, request.prune_fields)
+
     try:
         # Build default system prompts for each diary type
         diary_prompts = {
@@ -2405,10 +3356,11 @@ Write a DIARY ENTRY from the perspective of the customer avatar AFTER their succ
         system_prompt = request.system_prompt or default_system_prompt
 
         # Build user prompt with avatar context
-        avatar_text = json.dumps(request.avatar_profile, indent=2)
+        avatar_text = encoder.encode("AVATAR PROFILE", request.avatar_profile)
         book_context_text = ""
         if request.book_context:
-            book_context_text = f"\n\nBOOK/PRODUCT CONTEXT:\n{json.dumps(request.book_context, indent=2)}"
+            book_context_text = f"\n\nBOOK/PRODUCT CONTEXT:\n{encoder.encode('BOOK/PRODUCT CONTEXT', request.book_context)}"
+        encoder.log_stats("generate_avatar_diary")
 
         user_prompt = f"""Write a diary entry for this avatar:
 
@@ -2437,7 +3389,8 @@ Write the diary entry as specified. Make it deeply personal and emotionally reso
             "diary_entry": diary_content,
             "diary_type": request.diary_type,
             "avatar_name": request.avatar_profile.get("name", "Unknown"),
-            "tokens_used": result.get("tokens_used")
+            "tokens_used": result.get("tokens_used"),
+            "context_tokens": encoder.stats()
         }
 
     except Exception as e:
@@ -2459,6 +3412,10 @@ async def generate_brand_identity(request: Dict[str, Any]):
     if not os.getenv("OPENAI_API_KEY"):
         raise HTTPException(status_code=500, detail="OpenAI API key not configured")
 
+    request = await merge_workspace_context(request, ['avatar_profile'])
+
+    encoder = context_encoder_for(request.get('context_encoding'), request.get('prune_fields'))
+
     try:
         avatar_profile = request.get('avatar_profile', {})
 
@@ -2662,7 +3619,8 @@ Support both modes with DaisyUI themes, automatic system detection, and user tog
 
 **IMPORTANT**: Ensure the entire output is a single, clean markdown document. Do not include any conversational text. The document should be comprehensive (2000+ words), professionally formatted, and immediately actionable for designers and developers."""
 
-        avatar_text = json.dumps(avatar_profile, indent=2)
+        avatar_text = encoder.encode("AVATAR PROFILE", avatar_profile)
+        encoder.log_stats("generate_brand_identity")
 
         user_prompt = f"""Based on this Problem Aware customer avatar, create a complete brand identity:
 
@@ -2690,11 +3648,13 @@ Return the complete brand identity as specified."""
         )
 
         brand_identity_markdown = result["content"]
+        await save_workspace_context(request, {'brand_identity': brand_identity_markdown})
 
         return {
             "success": True,
             "brand_identity": brand_identity_markdown,  # Now returns markdown string
-            "tokens_used": result.get("tokens_used")
+            "tokens_used": result.get("tokens_used"),
+            "context_tokens": encoder.stats()
         }
 
     except Exception as e:
@@ -2716,6 +3676,10 @@ async def generate_landing_page_spec(request: Dict[str, Any]):
     if not os.getenv("OPENAI_API_KEY"):
         raise HTTPException(status_code=500, detail="OpenAI API key not configured")
 
+    request = await merge_workspace_context(request, ['problem_aware_avatar', 'brand_identity', 'diary_entries', 'offer_context'])
+
+    encoder = context_encoder_for(request.get('context_encoding'), request.get('prune_fields'))
+
     try:
         problem_aware_avatar = request.get('problem_aware_avatar', {})
         brand_identity = request.get('brand_identity', {})
@@ -2963,10 +3927,11 @@ Provide 3-5 headline options tailored to this specific offering based on the ava
 **IMPORTANT**: Make this PRD immediately actionable for Cursor/Windsurf AI tools and human developers. Include exact measurements, behaviors, and specifications. The output should be 3000-5000 words with comprehensive detail in every section."""
 
         # Build context
-        avatar_text = json.dumps(problem_aware_avatar, indent=2)
-        brand_text = json.dumps(brand_identity, indent=2)
-        diary_text = json.dumps(diary_entries, indent=2)
-        offer_text = json.dumps(offer_context, indent=2)
+        avatar_text = encoder.encode("PROBLEM AWARE AVATAR", problem_aware_avatar)
+        brand_text = encoder.encode("BRAND IDENTITY", brand_identity)
+        diary_text = encoder.encode("CUSTOMER JOURNEY DIARY", diary_entries)
+        offer_text = encoder.encode("OFFER CONTEXT", offer_context)
+        encoder.log_stats("generate_landing_page_spec")
 
         user_prompt = f"""Create a complete landing page specification (PRD) based on:
 
@@ -2996,11 +3961,13 @@ Generate the complete 17-section landing page specification. Make it specific, a
         )
 
         landing_page_spec = result["content"]
+        await save_workspace_context(request, {'landing_page_spec': landing_page_spec})
 
         return {
             "success": True,
             "landing_page_spec": landing_page_spec,
-            "tokens_used": result.get("tokens_used")
+            "tokens_used": result.get("tokens_used"),
+            "context_tokens": encoder.stats()
         }
 
     except Exception as e:
@@ -3022,6 +3989,10 @@ async def generate_marketing_assets(request: Dict[str, Any]):
     if not os.getenv("OPENAI_API_KEY"):
         raise HTTPException(status_code=500, detail="OpenAI API key not configured")
 
+    request = await merge_workspace_context(request, ['problem_aware_avatar', 'brand_identity', 'diary_entries', 'offer_context', 'landing_page_spec'])
+
+    encoder = context_encoder_for(request.get('context_encoding'), request.get('prune_fields'))
+
     try:
         problem_aware_avatar = request.get('problem_aware_avatar', {})
         brand_identity = request.get('brand_identity', {})
@@ -3074,11 +4045,19 @@ Return a comprehensive JSON object with the following structure:
 
 Make every asset ready-to-use and conversion-focused."""
 
-        # Build context
-        avatar_text = json.dumps(problem_aware_avatar, indent=2)
-        brand_text = json.dumps(brand_identity, indent=2)
-        diary_text = json.dumps(diary_entries, indent=2)
-        offer_text = json.dumps(offer_context, indent=2)
+        # Build context, encoded compactly and packed by priority into the prompt budget
+        context = pack_sections([
+            ContextSection("avatar", encoder.encode("PROBLEM AWARE AVATAR", problem_aware_avatar), priority=4, summarize=False),
+            ContextSection("offer", encoder.encode("OFFER CONTEXT", offer_context), priority=4, summarize=False),
+            ContextSection("brand", encoder.encode("BRAND IDENTITY", brand_identity), priority=3, summarize=False),
+            ContextSection("diary", encoder.encode("CUSTOMER JOURNEY DIARY", diary_entries), priority=2, summarize=False),
+            ContextSection("landing_page", landing_page_spec, priority=1)
+        ], remaining_budget(MARKETING_PROMPT_TOKENS, system_prompt))
+        encoder.log_stats("generate_marketing_assets")
+        avatar_text = context["avatar"]
+        brand_text = context["brand"]
+        diary_text = context["diary"]
+        offer_text = context["offer"]
 
         user_prompt = f"""Create the complete marketing assets kit (100+ items) based on:
 
@@ -3095,7 +4074,7 @@ OFFER CONTEXT:
 {offer_text}
 
 LANDING PAGE SPEC (optional context):
-{landing_page_spec[:500] if landing_page_spec else 'Not provided'}
+{context["landing_page"] or 'Not provided'}
 
 Generate all marketing assets as specified. Make them specific, actionable, and ready to use."""
 
@@ -3116,7 +4095,8 @@ Generate all marketing assets as specified. Make them specific, actionable, and
         return {
             "success": True,
             "marketing_assets": marketing_assets,
-            "tokens_used": result.get("tokens_used")
+            "tokens_used": result.get("tokens_used"),
+            "context_tokens": encoder.stats()
         }
 
     except Exception as e:
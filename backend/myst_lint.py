@@ -0,0 +1,301 @@
+"""
+MyST Linter for LiquidBooks
+
+Fast pre-build checks of chapter markdown, so books that would build broken
+are rejected before a Sphinx build starts. Chapters are tokenized with the
+same markdown-it parser MyST uses (a few milliseconds per chapter), and
+directive bodies are checked recursively. Reported problems:
+
+- fences (``` / ~~~ / :::) that are never closed, including the common case of
+  a directive nested in another one with the same number of backticks
+- directives and roles that no loaded extension provides, e.g. {prf:theorem}
+  without the feature that enables sphinx_proof (directive content would be
+  dropped, so these are errors; unknown roles only leave raw text and are
+  warnings)
+- JSON blocks (such as jupyterquiz questions) that do not parse, or quiz
+  questions missing required fields
+- colon fences written while the colon_fence extension is off, and chapters
+  without a title heading
+
+Each issue carries the chapter, its file and a 1-based line number.
+"""
+
+import difflib
+import json
+import re
+import time
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional, Set
+
+from docutils.parsers.rst.directives import _directive_registry
+from docutils.parsers.rst.languages import en as docutils_en
+from docutils.parsers.rst.roles import _role_registry
+from markdown_it.renderer import RendererHTML
+from myst_parser.config.main import MdParserConfig
+from myst_parser.parsers.mdit import create_md_parser
+
+from book_features import (
+    EXTENSION_DIRECTIVES,
+    EXTENSION_ROLES,
+    SPHINX_DIRECTIVES,
+    SPHINX_DOMAINS,
+    SPHINX_ROLES,
+    book_extensions,
+    features_providing,
+    myst_extensions,
+)
+
+
+# Directives/roles the MyST parser handles itself
+MYST_DIRECTIVES = ["eval-rst", "figure-md", "code-block", "sourcecode", "include"]
+MYST_ROLES = ["sub-ref", "sub"]
+
+# Directive bodies that are code or data, not nested markdown
+LITERAL_DIRECTIVES = {
+    "code", "code-block", "sourcecode", "code-cell", "raw-cell", "literalinclude", "math",
+    "raw", "eval-rst", "mermaid", "csv-table", "parsed-literal", "highlight", "glue:math",
+}
+
+# jupyterquiz question types
+QUIZ_TYPES = {"multiple_choice", "many_choice", "numeric", "string"}
+
+COLON_FENCE_LINE = re.compile(r"^\s{0,3}:{3,}\s*\{")
+NOTEBOOK_FRONT_MATTER = re.compile(r"^(kernelspec|jupytext)\s*:", re.MULTILINE)
+
+# Deeply nested directives are not worth following further
+MAX_DEPTH = 8
+
+
+def _issue(severity: str, code: str, line: int, message: str) -> Dict[str, Any]:
+    return {"severity": severity, "code": code, "line": line, "message": message}
+
+
+@lru_cache(maxsize=64)
+def _parser(extensions: FrozenSet[str]):
+    """markdown-it parser configured like MyST for one set of extensions"""
+    return create_md_parser(MdParserConfig(enable_extensions=set(extensions)), RendererHTML)
+
+
+@lru_cache(maxsize=64)
+def _known_names(extensions: FrozenSet[str]) -> Dict[str, Set[str]]:
+    """Directive and role names available with a set of Sphinx extensions"""
+    directives = set(_directive_registry) | set(docutils_en.directives) | set(SPHINX_DIRECTIVES) | set(MYST_DIRECTIVES)
+    roles = set(_role_registry) | set(docutils_en.roles) | set(SPHINX_ROLES) | set(MYST_ROLES)
+    for extension in extensions:
+        directives.update(EXTENSION_DIRECTIVES.get(extension, []))
+        roles.update(EXTENSION_ROLES.get(extension, []))
+    return {"directives": directives, "roles": roles}
+
+
+def _providing_extension(name: str, table: Dict[str, List[str]]) -> Optional[str]:
+    for extension, names in table.items():
+        if name in names:
+            return extension
+    return None
+
+
+class _ChapterLinter:
+    """Lints one chapter against a fixed set of extensions"""
+
+    def __init__(self, features: List[str]):
+        self.myst_extensions = frozenset(myst_extensions(features))
+        self.sphinx_extensions = frozenset(book_extensions(features))
+        self.known = _known_names(self.sphinx_extensions)
+        self.md = _parser(self.myst_extensions)
+        self.issues: List[Dict[str, Any]] = []
+
+    def lint(self, content: str) -> List[Dict[str, Any]]:
+        self.issues = []
+        tokens = self.md.parse(content)
+
+        if not any(token.type == "heading_open" and token.markup == "#" for token in tokens):
+            self.issues.append(_issue(
+                "warning", "missing-title", 1,
+                "Chapter has no '# ' title heading; the page will be listed without a title",
+            ))
+
+        has_code_cells = any(t.type in ("fence", "colon_fence") and self._directive_name(t.info) == "code-cell" for t in tokens)
+        front_matter = next((t for t in tokens if t.type == "front_matter"), None)
+        if has_code_cells and (front_matter is None or not NOTEBOOK_FRONT_MATTER.search(front_matter.content)):
+            self.issues.append(_issue(
+                "warning", "code-cell-not-notebook", 1,
+                "{code-cell} is used but the chapter has no kernelspec front matter, so its code will not run",
+            ))
+
+        self._lint_tokens(content, tokens, line_offset=0, parent=None, depth=0)
+        return sorted(self.issues, key=lambda issue: issue["line"])
+
+    @staticmethod
+    def _directive_name(info: str) -> Optional[str]:
+        info = info.strip()
+        if info.startswith("{") and "}" in info:
+            return info[1:info.index("}")].strip()
+        return None
+
+    def _lint_tokens(self, text: str, tokens, line_offset: int, parent, depth: int):
+        lines = text.split("\n")
+
+        # Checked once on the whole chapter (nested bodies are part of it)
+        if "colon_fence" not in self.myst_extensions and depth == 0:
+            for i, line in enumerate(lines):
+                if COLON_FENCE_LINE.match(line):
+                    self.issues.append(_issue(
+                        "error", "colon-fence-disabled", line_offset + i + 1,
+                        "':::' directive used but the colon_fence feature is not enabled; it will render as plain text",
+                    ))
+
+        for token in tokens:
+            if token.type in ("fence", "colon_fence"):
+                self._lint_fence(token, lines, line_offset, parent, depth)
+            elif token.type == "inline" and token.map:
+                self._lint_roles(token, line_offset)
+
+    def _lint_fence(self, token, lines: List[str], line_offset: int, parent, depth: int):
+        start, end = token.map
+        line = line_offset + start + 1
+        name = self._directive_name(token.info)
+        label = f"{token.markup}{token.info.strip()}"
+
+        # An unclosed fence runs to the end of its container
+        closing = lines[end - 1].strip() if end - 1 > start and end - 1 < len(lines) else ""
+        closed = (
+            end - 1 > start
+            and closing
+            and set(closing) == {token.markup[0]}
+            and len(closing) >= len(token.markup)
+        )
+        if not closed:
+            message = f"Fence {label} is never closed"
+            if parent is not None and parent.markup[0] == token.markup[0] and len(token.markup) >= len(parent.markup):
+                message += (
+                    f"; it is nested in {parent.markup}{parent.info.strip()}, which must use more "
+                    f"'{parent.markup[0]}' characters than the fences inside it"
+                )
+            self.issues.append(_issue("error", "unclosed-fence", line, message))
+
+        if name is not None:
+            self._lint_directive(name, line)
+        language = (token.info.strip().split() or [""])[0].lower() if name is None else ""
+        directive_args = token.info.strip()[len(name) + 2:].strip().lower() if name else ""
+
+        if language == "json" or (name in ("code", "code-block", "sourcecode") and directive_args == "json"):
+            self._lint_json(token.content, line + 1)
+        elif name is not None and name not in LITERAL_DIRECTIVES and depth < MAX_DEPTH and token.content.strip():
+            body_tokens = self.md.parse(token.content)
+            self._lint_tokens(token.content, body_tokens, line_offset + start + 1, token, depth + 1)
+
+    def _lint_directive(self, name: str, line: int):
+        if name in self.known["directives"] or (":" in name and name.split(":")[0] in SPHINX_DOMAINS):
+            return
+        extension = _providing_extension(name, EXTENSION_DIRECTIVES)
+        if extension is not None:
+            features = features_providing(extension)
+            hint = f"enable the {' or '.join(repr(f) for f in features)} feature" if features else f"it needs {extension}"
+            self.issues.append(_issue(
+                "error", "directive-not-enabled", line,
+                f"Directive {{{name}}} needs the {extension} extension, which this book does not load ({hint})",
+            ))
+            return
+        message = f"Unknown directive {{{name}}}"
+        suggestions = difflib.get_close_matches(name, self.known["directives"], n=1)
+        if suggestions:
+            message += f" (did you mean {{{suggestions[0]}}}?)"
+        self.issues.append(_issue("error", "unknown-directive", line, message))
+
+    def _lint_roles(self, token, line_offset: int):
+        for child in token.children or []:
+            if child.type != "myst_role":
+                continue
+            name = child.meta.get("name", "")
+            if name in self.known["roles"] or (":" in name and name.split(":")[0] in SPHINX_DOMAINS):
+                continue
+            position = token.content.find("{" + name + "}")
+            line = line_offset + token.map[0] + 1 + (token.content.count("\n", 0, position) if position >= 0 else 0)
+
+            extension = _providing_extension(name, EXTENSION_ROLES)
+            if extension is not None:
+                features = features_providing(extension)
+                hint = f"enable the {' or '.join(repr(f) for f in features)} feature" if features else f"it needs {extension}"
+                self.issues.append(_issue(
+                    "warning", "role-not-enabled", line,
+                    f"Role {{{name}}} needs the {extension} extension, which this book does not load ({hint})",
+                ))
+                continue
+            message = f"Unknown role {{{name}}}"
+            suggestions = difflib.get_close_matches(name, self.known["roles"], n=1)
+            if suggestions:
+                message += f" (did you mean {{{suggestions[0]}}}?)"
+            self.issues.append(_issue("warning", "unknown-role", line, message))
+
+    def _lint_json(self, content: str, first_line: int):
+        try:
+            data = json.loads(content)
+        except ValueError as e:
+            self.issues.append(_issue(
+                "error", "invalid-json", first_line + getattr(e, "lineno", 1) - 1,
+                f"Invalid JSON: {getattr(e, 'msg', str(e))}",
+            ))
+            return
+
+        questions = data if isinstance(data, list) else [data]
+        if not all(isinstance(q, dict) and "question" in q for q in questions):
+            return  # Not a quiz
+        for i, question in enumerate(questions, 1):
+            problems = []
+            if question.get("type") not in QUIZ_TYPES:
+                problems.append(f"type must be one of {', '.join(sorted(QUIZ_TYPES))}")
+            answers = question.get("answers")
+            if not isinstance(answers, list) or not answers:
+                problems.append("answers must be a non-empty list")
+            elif not all(isinstance(a, dict) and "answer" in a and "correct" in a for a in answers):
+                problems.append("each answer needs 'answer' and 'correct'")
+            elif question.get("type") in ("multiple_choice", "many_choice") and not any(a.get("correct") is True for a in answers):
+                problems.append("no answer is marked correct")
+            if problems:
+                self.issues.append(_issue(
+                    "error", "invalid-quiz", first_line,
+                    f"Quiz question {i}: {'; '.join(problems)}",
+                ))
+
+
+def lint_chapter(content: str, features: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Lint one chapter's markdown
+
+    Args:
+        content: Chapter markdown
+        features: Enabled feature ids (as for the book build)
+
+    Returns:
+        Issues with 'severity' ('error' or 'warning'), 'code', 'line' and 'message'
+    """
+    return _ChapterLinter(features or []).lint(content)
+
+
+def lint_book(chapters: List[Dict[str, str]], features: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Lint every chapter of a book
+
+    Args:
+        chapters: Dicts with 'title', 'file' and 'content'
+        features: Enabled feature ids
+
+    Returns:
+        Dict with 'valid' (no errors), 'errors', 'warnings', 'issues' (each
+        with its chapter and file) and 'lint_ms'
+    """
+    started = time.perf_counter()
+    linter = _ChapterLinter(features or [])
+    issues = []
+    for chapter in chapters:
+        for issue in linter.lint(chapter.get("content", "")):
+            issues.append({"chapter": chapter.get("title", ""), "file": chapter.get("file", ""), **issue})
+
+    errors = sum(1 for issue in issues if issue["severity"] == "error")
+    return {
+        "valid": errors == 0,
+        "errors": errors,
+        "warnings": len(issues) - errors,
+        "issues": issues,
+        "lint_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
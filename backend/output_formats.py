@@ -0,0 +1,224 @@
+"""
+Output Formats for LiquidBooks
+
+Besides the HTML site, a build can produce LaTeX sources, a PDF and an EPUB.
+They come from the same parsed book: the HTML build reads (and executes) the
+chapters into the workspace's doctrees as usual, then the LaTeX and EPUB
+builders run side by side, each on its own copy of those doctrees. Sphinx
+finds nothing to re-read and only writes its format, and the copies keep the
+two builds from writing the same environment pickle at once. The PDF is
+compiled from the LaTeX output with latexmk (`make all-pdf`, like
+`jupyter-book build --builder pdflatex`) when a LaTeX distribution is
+installed.
+
+Finished files are kept in a format cache keyed by the book's build key
+(the hash of its sources), so asking for the same format of the same book
+again costs nothing. The cache is evicted least-recently-used first once it
+exceeds FORMAT_CACHE_MAX_MB.
+"""
+
+import os
+import shutil
+import threading
+import time
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from workspace_store import get_data_dir
+from zip_stream import compress_type, list_files
+
+
+# Format -> (Sphinx builder, download file name)
+OUTPUT_FORMATS = {
+    "html": ("html", "book.zip"),
+    "latex": ("latex", "book-latex.zip"),
+    "pdf": ("latex", "book.pdf"),
+    "epub": ("epub", "book.epub"),
+}
+
+MEDIA_TYPES = {
+    "latex": "application/zip",
+    "pdf": "application/pdf",
+    "epub": "application/epub+zip",
+}
+
+# latexmk by-products left out of the LaTeX sources download
+LATEX_RUN_SUFFIXES = {".pdf", ".aux", ".log", ".fls", ".fdb_latexmk", ".idx", ".ilg", ".ind", ".toc", ".out"}
+
+
+def builders_for(formats: List[str]) -> List[str]:
+    """Sphinx builders needed for formats other than HTML, in a stable order"""
+    builders = []
+    for name in formats:
+        builder = OUTPUT_FORMATS[name][0]
+        if name != "html" and builder not in builders:
+            builders.append(builder)
+    return builders
+
+
+def pdf_available() -> bool:
+    """Whether PDFs can be compiled (latexmk from a LaTeX distribution, and make)"""
+    return shutil.which("latexmk") is not None and shutil.which("make") is not None
+
+
+def doctree_dir(book_dir: Path, builder: str) -> Path:
+    """Private doctree copy of one format builder"""
+    return Path(book_dir) / "_build" / f".doctrees-{builder}"
+
+
+def sync_doctrees(book_dir: Path, builder: str) -> int:
+    """
+    Bring a builder's doctree copy up to date with the workspace doctrees
+
+    Only files whose size or mtime differ are copied (mtimes are kept, so
+    Sphinx sees the same state), and files gone from the source are removed.
+
+    Returns:
+        Number of files copied
+    """
+    source = Path(book_dir) / "_build" / ".doctrees"
+    target = doctree_dir(book_dir, builder)
+    wanted = {arcname: path for path, arcname in list_files(source)}
+    copied = 0
+    for arcname, path in wanted.items():
+        destination = target / arcname
+        stat = path.stat()
+        try:
+            current = destination.stat()
+            if current.st_size == stat.st_size and current.st_mtime_ns == stat.st_mtime_ns:
+                continue
+        except FileNotFoundError:
+            destination.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(path, destination)
+        copied += 1
+    if target.exists():
+        for path, arcname in list_files(target):
+            if arcname not in wanted:
+                path.unlink()
+    return copied
+
+
+def find_artifact(book_dir: Path, name: str) -> Optional[Path]:
+    """
+    The finished file of a format in a workspace (LaTeX output is zipped first)
+
+    Returns:
+        Path of the PDF, EPUB or LaTeX zip, or None if the builder made none
+    """
+    build_dir = Path(book_dir) / "_build"
+    if name == "pdf":
+        pdfs = sorted((build_dir / "latex").glob("*.pdf"))
+        return pdfs[0] if pdfs else None
+    if name == "epub":
+        epubs = sorted((build_dir / "epub").glob("*.epub"))
+        return epubs[0] if epubs else None
+    if name == "latex":
+        latex_dir = build_dir / "latex"
+        if not any(latex_dir.glob("*.tex")):
+            return None
+        archive = build_dir / "latex.zip"
+        with zipfile.ZipFile(archive, "w") as zf:
+            for path, arcname in list_files(latex_dir):
+                if path.suffix.lower() not in LATEX_RUN_SUFFIXES:
+                    zf.write(path, arcname, compress_type=compress_type(path))
+        return archive
+    return None
+
+
+class FormatCache:
+    """LRU-capped file cache of built formats, keyed by build key and format"""
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def path(self, key: str, name: str) -> Path:
+        return self.root / f"{key}-{OUTPUT_FORMATS[name][1]}"
+
+    def get(self, key: str, name: str) -> Optional[Path]:
+        """
+        Look up a built format
+
+        Returns:
+            File path, or None on a miss
+        """
+        path = self.path(key, name)
+        if not self.enabled or not path.exists():
+            self.misses += 1
+            return None
+        # atime is the LRU timestamp; mtime stays, as it is part of the ETag
+        os.utime(path, (time.time(), path.stat().st_mtime))
+        self.hits += 1
+        return path
+
+    def put(self, key: str, name: str, source: Path) -> Optional[Path]:
+        """Store a built format; returns its cached path (None if the cache is disabled)"""
+        if not self.enabled:
+            return None
+        path = self.path(key, name)
+        temp_path = path.with_name(f".{path.name}.tmp")
+        shutil.copyfile(source, temp_path)
+        os.replace(temp_path, path)
+        self.evict(keep=path)
+        return path
+
+    def _entries(self) -> List[Tuple[Path, os.stat_result]]:
+        entries = []
+        for path in self.root.iterdir():
+            if path.name.startswith("."):
+                continue
+            try:
+                entries.append((path, path.stat()))
+            except FileNotFoundError:
+                pass
+        return entries
+
+    def evict(self, keep: Optional[Path] = None) -> List[str]:
+        """Remove least-recently-used files until the cache fits max_bytes, sparing keep (a file just stored)"""
+        evicted = []
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[1].st_atime)
+            total = sum(stat.st_size for _, stat in entries)
+            for path, stat in entries:
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                path.unlink(missing_ok=True)
+                total -= stat.st_size
+                evicted.append(path.name)
+        if evicted:
+            print(f"[Format Cache] Evicted {len(evicted)} files")
+        return evicted
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "size_bytes": sum(stat.st_size for _, stat in entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Global instance (lazy initialization)
+_format_cache_instance = None
+
+
+def get_format_cache() -> FormatCache:
+    """Get the global format cache (size cap from FORMAT_CACHE_MAX_MB, 0 disables it)"""
+    global _format_cache_instance
+    if _format_cache_instance is None:
+        max_mb = int(os.getenv("FORMAT_CACHE_MAX_MB", "1024"))
+        _format_cache_instance = FormatCache(get_data_dir() / "formats", max_mb * 1024 * 1024)
+    return _format_cache_instance
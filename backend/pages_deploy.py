@@ -0,0 +1,192 @@
+"""
+GitHub Pages Deploy for LiquidBooks
+
+Publishes a built site to the gh-pages branch of any git remote. Only the tip
+of gh-pages is fetched (a depth-1, single-branch clone), so a deploy costs the
+same however many deploys came before it. The site is synced into the
+checkout by content hash: each file's git blob id is compared with the one
+already in the index, so unchanged files are not rewritten, changed and new
+files are copied, and files that are gone are deleted. If nothing changed, no
+commit is made and nothing is pushed. LiquidBooks' bookkeeping files and
+temporary files in the build output are never published.
+
+The remote is only a URL, so deploys can be tried against a local bare
+repository standing in for GitHub.
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from book_export import site_files
+
+
+PAGES_BRANCH = "gh-pages"
+
+COMMIT_AUTHOR_NAME = "LiquidBooks"
+COMMIT_AUTHOR_EMAIL = "liquidbooks@example.com"
+
+
+# git errors worth retrying: network trouble, server errors, a lost push race
+TRANSIENT_GIT_ERRORS = re.compile(
+    r"could not resolve host|failed to connect|connection (reset|refused|timed out)|timed out"
+    r"|early eof|rpc failed|the remote end hung up|http/?\S* 5\d\d|error: 5\d\d"
+    r"|\[rejected\]|failed to push some refs|cannot lock ref",
+    re.IGNORECASE,
+)
+
+
+class PagesDeployError(Exception):
+    """
+    A deploy step failed (the remote URL is redacted from the message)
+
+    transient is True for failures that may succeed when the deploy is retried.
+    """
+
+    def __init__(self, message: str, transient: bool = False):
+        super().__init__(message)
+        self.transient = transient
+
+
+def _git(args: List[str], cwd: Optional[Path], remote_url: str) -> str:
+    result = subprocess.run(
+        ["git", *args],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "GIT_TERMINAL_PROMPT": "0"},
+    )
+    if result.returncode != 0:
+        command = " ".join(args).replace(remote_url, "<remote>")
+        output = (result.stderr or result.stdout).replace(remote_url, "<remote>").strip()
+        raise PagesDeployError(f"git {command} failed: {output}", transient=bool(TRANSIENT_GIT_ERRORS.search(output)))
+    return result.stdout
+
+
+def git_blob_id(data: bytes) -> str:
+    """Object id git stores a file's content under"""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def _index_blob_ids(repo_dir: Path, remote_url: str) -> Dict[str, str]:
+    """Blob id of every file in the checkout's index, by path"""
+    blobs = {}
+    output = _git(["ls-files", "--stage", "-z"], repo_dir, remote_url)
+    for entry in output.split("\0"):
+        if not entry:
+            continue
+        info, path = entry.split("\t", 1)
+        blobs[path] = info.split()[1]
+    return blobs
+
+
+def sync_tree(
+    site_dir: Path,
+    repo_dir: Path,
+    extra_files: Optional[Dict[str, bytes]] = None,
+    remote_url: str = "",
+) -> Dict[str, List[str]]:
+    """
+    Make a git checkout's files match a site directory
+
+    Args:
+        site_dir: Built site (e.g. _build/html)
+        repo_dir: Checkout of the pages branch
+        extra_files: Generated files added next to the site (path -> content)
+
+    Returns:
+        Dict of 'added', 'updated', 'removed' (paths) and 'unchanged' (count)
+    """
+    blobs = _index_blob_ids(repo_dir, remote_url)
+    wanted = {arcname: path for path, arcname in site_files(site_dir)}
+    for relpath in extra_files or {}:
+        wanted[relpath] = None
+
+    changes = {"added": [], "updated": [], "removed": [], "unchanged": 0}
+    for relpath, source in wanted.items():
+        data = extra_files[relpath] if source is None else source.read_bytes()
+        current = blobs.get(relpath)
+        if current == git_blob_id(data):
+            changes["unchanged"] += 1
+            continue
+        target = repo_dir / relpath
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(data)
+        if source is not None:
+            shutil.copymode(source, target)
+        changes["added" if current is None else "updated"].append(relpath)
+
+    for relpath in blobs:
+        if relpath not in wanted:
+            (repo_dir / relpath).unlink(missing_ok=True)
+            changes["removed"].append(relpath)
+    return changes
+
+
+def deploy_pages(
+    site_dir: Path,
+    remote_url: str,
+    extra_files: Optional[Dict[str, bytes]] = None,
+    message: str = "Deploy Jupyter Book to GitHub Pages",
+    branch: str = PAGES_BRANCH,
+) -> Dict:
+    """
+    Publish a built site to a branch of a git remote
+
+    Args:
+        site_dir: Built site directory
+        remote_url: Git remote (https URL with token, or a local path)
+        extra_files: Generated files to publish next to the site, e.g. .nojekyll
+        message: Commit message
+        branch: Branch to publish to
+
+    Returns:
+        Dict with 'changed' (whether anything was pushed), 'commit' (the
+        branch tip after the deploy) and 'files' (sync_tree counts)
+
+    Raises:
+        PagesDeployError: If a git command fails
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        repo_dir = Path(temp_dir) / "site"
+
+        if _git(["ls-remote", "--heads", remote_url, branch], None, remote_url).strip():
+            print(f"[Pages Deploy] Fetching tip of {branch}")
+            _git(
+                ["clone", "--quiet", "--depth", "1", "--single-branch", "--branch", branch, remote_url, str(repo_dir)],
+                None, remote_url,
+            )
+        else:
+            print(f"[Pages Deploy] Creating {branch} branch")
+            repo_dir.mkdir()
+            _git(["init", "--quiet"], repo_dir, remote_url)
+            _git(["remote", "add", "origin", remote_url], repo_dir, remote_url)
+            _git(["checkout", "--quiet", "--orphan", branch], repo_dir, remote_url)
+
+        changes = sync_tree(site_dir, repo_dir, extra_files, remote_url)
+        files = {name: len(value) if isinstance(value, list) else value for name, value in changes.items()}
+        print(
+            f"[Pages Deploy] {files['added']} added, {files['updated']} updated, "
+            f"{files['removed']} removed, {files['unchanged']} unchanged"
+        )
+
+        _git(["add", "--all"], repo_dir, remote_url)
+        if not _git(["status", "--porcelain"], repo_dir, remote_url).strip():
+            print(f"[Pages Deploy] Site unchanged, nothing to push")
+            commit = _git(["rev-parse", "HEAD"], repo_dir, remote_url).strip()
+            return {"changed": False, "commit": commit, "files": files}
+
+        _git(
+            ["-c", f"user.name={COMMIT_AUTHOR_NAME}", "-c", f"user.email={COMMIT_AUTHOR_EMAIL}",
+             "commit", "--quiet", "-m", message],
+            repo_dir, remote_url,
+        )
+        _git(["push", "--quiet", "origin", f"HEAD:refs/heads/{branch}"], repo_dir, remote_url)
+        commit = _git(["rev-parse", "HEAD"], repo_dir, remote_url).strip()
+        print(f"[Pages Deploy] Pushed {commit[:7]} to {branch}")
+        return {"changed": True, "commit": commit, "files": files}
@@ -0,0 +1,537 @@
+"""
+Publishers for LiquidBooks
+
+Publish targets for built sites, next to the GitHub Pages deploy:
+
+- LocalDirectoryPublisher copies the site into a directory (for a web server
+  that serves it, or a mounted volume)
+- S3Publisher uploads it to an S3-compatible object store (AWS S3, MinIO,
+  R2, ...) with SigV4-signed requests over httpx
+
+Both only transfer files whose content changed since the last publish: the
+local target keeps a manifest of content hashes, and the S3 target compares
+each file's expected ETag (MD5, or the multipart ETag for large files) with
+the object listing. Transfers run in parallel; large files go to S3 as
+multipart uploads whose parts are uploaded in parallel too. Files that are no
+longer part of the site are removed, but only ones an earlier publish wrote
+(both targets keep a manifest of them), and on S3 only under a key prefix
+unless deleting at the bucket root is asked for. HTML and other pages are
+published with headers that make browsers revalidate them, assets with a
+max-age, and the content-hashed copies written by the asset optimizer as
+immutable.
+"""
+
+import asyncio
+import base64
+import datetime
+import hashlib
+import hmac
+import json
+import mimetypes
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import quote
+
+import httpx
+
+from asset_optimizer import COMPRESSIBLE_SUFFIXES, is_hashed_name
+from book_export import site_files
+from workspace_store import get_data_dir
+
+
+# Parallel file transfers (and S3 requests)
+PUBLISH_CONCURRENCY = int(os.getenv("PUBLISH_CONCURRENCY", "16"))
+
+# Seconds browsers may cache assets (CSS, JS, images, fonts) without revalidating
+PUBLISH_ASSET_MAX_AGE = int(os.getenv("PUBLISH_ASSET_MAX_AGE", "86400"))
+
+# Pages, and files whose URL never changes while their content does
+REVALIDATE_SUFFIXES = {".html", ".htm", ".xml", ".txt", ".json", ".ipynb", ".md"}
+REVALIDATE_NAMES = {"searchindex.js", "objects.inv", ".nojekyll"}
+
+HTML_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+
+# Content-hashed assets from the asset optimizer never change under their name
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Precompressed siblings written by the asset optimizer
+CONTENT_ENCODINGS = {".gz": "gzip", ".br": "br"}
+
+CONTENT_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".htm": "text/html; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".js": "text/javascript; charset=utf-8",
+    ".mjs": "text/javascript; charset=utf-8",
+    ".json": "application/json",
+    ".map": "application/json",
+    ".txt": "text/plain; charset=utf-8",
+    ".md": "text/markdown; charset=utf-8",
+    ".xml": "application/xml",
+    ".svg": "image/svg+xml",
+    ".woff": "font/woff",
+    ".woff2": "font/woff2",
+    ".ttf": "font/ttf",
+    ".ipynb": "application/x-ipynb+json",
+    ".inv": "application/octet-stream",
+}
+
+# S3 multipart: files above the threshold are uploaded in parts of this size
+MULTIPART_THRESHOLD = 16 * 1024 * 1024
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+
+S3_NAMESPACE = "{http://s3.amazonaws.com/doc/2006-03-01/}"
+
+# Manifest of what a target was published with: content hashes in a local
+# directory, the published keys under an S3 prefix
+PUBLISH_MANIFEST = ".liquidbooks-publish.json"
+
+
+class PublishError(Exception):
+    """Publishing failed; transient is True when a retry may succeed"""
+
+    def __init__(self, message: str, transient: bool = False):
+        super().__init__(message)
+        self.transient = transient
+
+
+def content_headers(relpath: str) -> Dict[str, str]:
+    """Content-Type and Cache-Control (and Content-Encoding for .gz/.br siblings) for a published file"""
+    name = relpath.rsplit("/", 1)[-1]
+    base, suffix = os.path.splitext(name)
+    if suffix.lower() in CONTENT_ENCODINGS and os.path.splitext(base)[1].lower() in COMPRESSIBLE_SUFFIXES:
+        # A precompressed sibling is served as its original, encoded
+        headers = content_headers(relpath[:-len(suffix)])
+        headers["Content-Encoding"] = CONTENT_ENCODINGS[suffix.lower()]
+        return headers
+    suffix = suffix.lower()
+    content_type = CONTENT_TYPES.get(suffix) or mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if suffix in REVALIDATE_SUFFIXES or name in REVALIDATE_NAMES:
+        cache_control = HTML_CACHE_CONTROL
+    elif is_hashed_name(name):
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        cache_control = f"public, max-age={PUBLISH_ASSET_MAX_AGE}"
+    return {"Content-Type": content_type, "Cache-Control": cache_control}
+
+
+class _SiteFile:
+    """A file to publish, read from disk or given as bytes"""
+
+    def __init__(self, relpath: str, source: Optional[Path] = None, data: Optional[bytes] = None):
+        self.relpath = relpath
+        self.source = source
+        self.data = data
+        self.size = len(data) if data is not None else source.stat().st_size
+
+    def read(self, offset: int = 0, length: Optional[int] = None) -> bytes:
+        if self.data is not None:
+            return self.data[offset:None if length is None else offset + length]
+        with open(self.source, "rb") as f:
+            f.seek(offset)
+            return f.read() if length is None else f.read(length)
+
+
+def _site_files(site_dir: Path, extra_files: Optional[Dict[str, bytes]]) -> List[_SiteFile]:
+    files = {relpath: _SiteFile(relpath, source=source) for source, relpath in site_files(site_dir)}
+    for relpath, data in (extra_files or {}).items():
+        files[relpath] = _SiteFile(relpath, data=data)
+    return [files[relpath] for relpath in sorted(files)]
+
+
+def _new_report() -> Dict[str, Any]:
+    return {
+        "changed": False,
+        "uploaded": 0,
+        "uploaded_bytes": 0,
+        "skipped": 0,
+        "skipped_bytes": 0,
+        "deleted": 0,
+    }
+
+
+class Publisher:
+    """A target built sites are published to"""
+
+    def describe(self) -> str:
+        """Short label of the target, e.g. for the deploy queue"""
+        raise NotImplementedError
+
+    async def publish(
+        self,
+        site_dir: Path,
+        extra_files: Optional[Dict[str, bytes]] = None,
+        progress: Optional[Callable[[str], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Publish a built site, transferring only what changed
+
+        Args:
+            site_dir: Built site directory (e.g. _build/html)
+            extra_files: Generated files to publish next to the site (path -> content)
+            progress: Called with a short message at each step
+
+        Returns:
+            Dict with 'changed', 'uploaded'/'uploaded_bytes',
+            'skipped'/'skipped_bytes', 'deleted' and 'url'
+
+        Raises:
+            PublishError: If the target cannot be written
+        """
+        raise NotImplementedError
+
+
+class LocalDirectoryPublisher(Publisher):
+    """Publishes into a directory on this machine"""
+
+    def __init__(self, target_dir: Path, public_url: Optional[str] = None):
+        self.target_dir = Path(target_dir)
+        self.public_url = public_url
+
+    def describe(self) -> str:
+        return f"local:{self.target_dir}"
+
+    def _copy(self, site_file: _SiteFile):
+        target = self.target_dir / site_file.relpath
+        target.parent.mkdir(parents=True, exist_ok=True)
+        temp = target.with_name(f".{target.name}.tmp")
+        temp.write_bytes(site_file.read())
+        os.replace(temp, target)
+
+    async def publish(self, site_dir, extra_files=None, progress=None) -> Dict[str, Any]:
+        progress = progress or (lambda message: None)
+        report = _new_report()
+        try:
+            self.target_dir.mkdir(parents=True, exist_ok=True)
+            manifest_path = self.target_dir / PUBLISH_MANIFEST
+            try:
+                published = json.loads(manifest_path.read_text())
+            except (OSError, ValueError):
+                published = {}
+
+            files = await asyncio.to_thread(_site_files, Path(site_dir), extra_files)
+            hashes = await asyncio.to_thread(
+                lambda: {f.relpath: hashlib.sha256(f.read()).hexdigest() for f in files}
+            )
+
+            changed = []
+            for site_file in files:
+                target = self.target_dir / site_file.relpath
+                if published.get(site_file.relpath) == hashes[site_file.relpath] and target.exists():
+                    report["skipped"] += 1
+                    report["skipped_bytes"] += site_file.size
+                else:
+                    changed.append(site_file)
+            progress(f"Copying {len(changed)} changed files to {self.target_dir}")
+
+            semaphore = asyncio.Semaphore(PUBLISH_CONCURRENCY)
+
+            async def copy(site_file: _SiteFile):
+                async with semaphore:
+                    await asyncio.to_thread(self._copy, site_file)
+
+            await asyncio.gather(*(copy(site_file) for site_file in changed))
+            report["uploaded"] = len(changed)
+            report["uploaded_bytes"] = sum(f.size for f in changed)
+
+            # Only files this publisher wrote are removed, never foreign ones
+            for relpath in published:
+                if relpath not in hashes:
+                    (self.target_dir / relpath).unlink(missing_ok=True)
+                    report["deleted"] += 1
+
+            manifest_path.write_text(json.dumps(hashes, sort_keys=True))
+        except OSError as e:
+            raise PublishError(f"Could not write to {self.target_dir}: {str(e)}")
+
+        report["changed"] = bool(report["uploaded"] or report["deleted"])
+        report["url"] = self.public_url or (self.target_dir / "index.html").as_uri()
+        return report
+
+
+def _expected_etag(site_file: _SiteFile) -> str:
+    """ETag S3 reports for a file uploaded the way S3Publisher uploads it"""
+    if site_file.size <= MULTIPART_THRESHOLD:
+        return hashlib.md5(site_file.read()).hexdigest()
+    digests = b""
+    parts = 0
+    for offset in range(0, site_file.size, MULTIPART_PART_SIZE):
+        digests += hashlib.md5(site_file.read(offset, MULTIPART_PART_SIZE)).digest()
+        parts += 1
+    return f"{hashlib.md5(digests).hexdigest()}-{parts}"
+
+
+class S3Publisher(Publisher):
+    """
+    Publishes to a bucket (and key prefix) of an S3-compatible object store
+
+    Objects a previous publish wrote (listed in the manifest under the
+    prefix) and that are no longer part of the site are deleted. Without a
+    prefix they are only deleted with delete_at_root, since the bucket may
+    hold other data.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        access_key_id: str,
+        secret_access_key: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region: str = "us-east-1",
+        public_url: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        concurrency: int = PUBLISH_CONCURRENCY,
+        delete_at_root: bool = False,
+    ):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.delete_at_root = delete_at_root
+        self.endpoint_url = (endpoint_url or f"https://s3.{region}.amazonaws.com").rstrip("/")
+        self.region = region
+        self.public_url = public_url
+        self.concurrency = max(1, concurrency)
+        self._access_key_id = access_key_id
+        self._secret_access_key = secret_access_key
+        self._transport = transport
+        self._host = httpx.URL(self.endpoint_url).netloc.decode("ascii")
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def describe(self) -> str:
+        return f"s3:{self.bucket}/{self.prefix}"
+
+    # -- SigV4 -------------------------------------------------------------
+
+    def _sign(self, method: str, path: str, query: Dict[str, str], headers: Dict[str, str], body: bytes) -> Dict[str, str]:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        date = now.strftime("%Y%m%d")
+        payload_hash = hashlib.sha256(body).hexdigest()
+
+        signed = {k.lower(): v.strip() for k, v in headers.items()}
+        signed.update({"host": self._host, "x-amz-date": amz_date, "x-amz-content-sha256": payload_hash})
+        signed_names = ";".join(sorted(signed))
+        canonical_request = "\n".join([
+            method,
+            quote(path, safe="/~"),
+            "&".join(f"{quote(k, safe='~')}={quote(v, safe='~')}" for k, v in sorted(query.items())),
+            "".join(f"{name}:{signed[name]}\n" for name in sorted(signed)),
+            signed_names,
+            payload_hash,
+        ])
+        scope = f"{date}/{self.region}/s3/aws4_request"
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+        ])
+
+        key = f"AWS4{self._secret_access_key}".encode("utf-8")
+        for part in (date, self.region, "s3", "aws4_request"):
+            key = hmac.new(key, part.encode("utf-8"), hashlib.sha256).digest()
+        signature = hmac.new(key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+
+        signed["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self._access_key_id}/{scope}, "
+            f"SignedHeaders={signed_names}, Signature={signature}"
+        )
+        del signed["host"]
+        return signed
+
+    async def _request(
+        self,
+        client: httpx.AsyncClient,
+        method: str,
+        key: str = "",
+        query: Optional[Dict[str, str]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        body: bytes = b"",
+    ) -> Optional[httpx.Response]:
+        # Path-style addressing, which every S3-compatible store supports
+        path = f"/{self.bucket}/{key}" if key else f"/{self.bucket}"
+        query = query or {}
+        signed = self._sign(method, path, query, headers or {}, body)
+        url = self.endpoint_url + quote(path, safe="/~")
+        try:
+            response = await client.request(method, url, params=query, headers=signed, content=body)
+        except httpx.TransportError as e:
+            raise PublishError(f"S3 {method} {path} failed: {str(e) or type(e).__name__}", transient=True)
+        if response.status_code == 404 and method == "GET" and key:
+            return None
+        if response.status_code >= 300:
+            code = re.search(r"<Code>([^<]+)</Code>", response.text)
+            raise PublishError(
+                f"S3 {method} {path} failed ({response.status_code}): {code.group(1) if code else response.text[:200]}",
+                transient=response.status_code >= 500 or response.status_code == 429,
+            )
+        return response
+
+    # -- Operations --------------------------------------------------------
+
+    async def _list_etags(self, client: httpx.AsyncClient) -> Dict[str, str]:
+        """ETag of every object under the prefix, by key"""
+        etags = {}
+        query = {"list-type": "2", "prefix": self.prefix}
+        while True:
+            response = await self._request(client, "GET", query=query)
+            root = ElementTree.fromstring(response.content)
+            for item in root.iter(f"{S3_NAMESPACE}Contents"):
+                etags[item.findtext(f"{S3_NAMESPACE}Key")] = item.findtext(f"{S3_NAMESPACE}ETag", "").strip('"')
+            token = root.findtext(f"{S3_NAMESPACE}NextContinuationToken")
+            if root.findtext(f"{S3_NAMESPACE}IsTruncated") != "true" or not token:
+                return etags
+            query = {**query, "continuation-token": token}
+
+    async def _read_manifest(self, client: httpx.AsyncClient) -> List[str]:
+        """Site paths the last publish wrote under the prefix (none before the first)"""
+        response = await self._request(client, "GET", self.prefix + PUBLISH_MANIFEST)
+        if response is None:
+            return []
+        try:
+            return list(json.loads(response.content))
+        except (ValueError, TypeError):
+            return []
+
+    async def _write_manifest(self, client: httpx.AsyncClient, relpaths: List[str]):
+        headers = {"Content-Type": "application/json", "Cache-Control": HTML_CACHE_CONTROL}
+        body = json.dumps(relpaths).encode("utf-8")
+        await self._request(client, "PUT", self.prefix + PUBLISH_MANIFEST, headers=headers, body=body)
+
+    async def _put(self, client: httpx.AsyncClient, site_file: _SiteFile):
+        key = self.prefix + site_file.relpath
+        headers = content_headers(site_file.relpath)
+        # Reads happen inside the semaphore so at most `concurrency` bodies are in memory
+        if site_file.size <= MULTIPART_THRESHOLD:
+            async with self._semaphore:
+                body = await asyncio.to_thread(site_file.read)
+                await self._request(client, "PUT", key, headers=headers, body=body)
+            return
+
+        response = await self._request(client, "POST", key, query={"uploads": ""}, headers=headers)
+        upload_id = ElementTree.fromstring(response.content).findtext(f"{S3_NAMESPACE}UploadId")
+        try:
+            async def upload_part(number: int, offset: int) -> str:
+                async with self._semaphore:
+                    body = await asyncio.to_thread(site_file.read, offset, MULTIPART_PART_SIZE)
+                    part = await self._request(
+                        client, "PUT", key, query={"partNumber": str(number), "uploadId": upload_id}, body=body,
+                    )
+                return part.headers["ETag"]
+
+            offsets = range(0, site_file.size, MULTIPART_PART_SIZE)
+            etags = await asyncio.gather(*(upload_part(i + 1, offset) for i, offset in enumerate(offsets)))
+            complete = "<CompleteMultipartUpload>" + "".join(
+                f"<Part><PartNumber>{i + 1}</PartNumber><ETag>{etag}</ETag></Part>" for i, etag in enumerate(etags)
+            ) + "</CompleteMultipartUpload>"
+            await self._request(client, "POST", key, query={"uploadId": upload_id}, body=complete.encode("utf-8"))
+        except BaseException:
+            try:
+                await self._request(client, "DELETE", key, query={"uploadId": upload_id})
+            except PublishError:
+                pass
+            raise
+
+    async def _delete(self, client: httpx.AsyncClient, keys: List[str]):
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            body = ("<Delete><Quiet>true</Quiet>" + "".join(
+                f"<Object><Key>{_xml_escape(key)}</Key></Object>" for key in batch
+            ) + "</Delete>").encode("utf-8")
+            content_md5 = base64.b64encode(hashlib.md5(body).digest()).decode("ascii")
+            await self._request(client, "POST", query={"delete": ""}, headers={"Content-MD5": content_md5}, body=body)
+
+    async def publish(self, site_dir, extra_files=None, progress=None) -> Dict[str, Any]:
+        progress = progress or (lambda message: None)
+        report = _new_report()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        files = await asyncio.to_thread(_site_files, Path(site_dir), extra_files)
+        async with httpx.AsyncClient(transport=self._transport, timeout=httpx.Timeout(120.0)) as client:
+            progress(f"Listing {self.describe()}")
+            remote, published, expected = await asyncio.gather(
+                self._list_etags(client),
+                self._read_manifest(client),
+                asyncio.to_thread(lambda: {f.relpath: _expected_etag(f) for f in files}),
+            )
+
+            changed = []
+            for site_file in files:
+                if remote.get(self.prefix + site_file.relpath) == expected[site_file.relpath]:
+                    report["skipped"] += 1
+                    report["skipped_bytes"] += site_file.size
+                else:
+                    changed.append(site_file)
+
+            progress(f"Uploading {len(changed)} changed files")
+            await asyncio.gather(*(self._put(client, site_file) for site_file in changed))
+            report["uploaded"] = len(changed)
+            report["uploaded_bytes"] = sum(f.size for f in changed)
+
+            # Only objects this publisher wrote are removed, never foreign ones
+            stale = sorted(set(published) - set(expected))
+            kept = []
+            if stale and not (self.prefix or self.delete_at_root):
+                progress(f"Keeping {len(stale)} files that are no longer part of the site (no prefix)")
+                kept = stale
+            elif stale:
+                progress(f"Removing {len(stale)} files that are no longer part of the site")
+                await self._delete(client, [self.prefix + relpath for relpath in stale])
+                report["deleted"] = len(stale)
+
+            # Kept files stay listed, for a later publish that may delete them
+            manifest = sorted(set(expected) | set(kept))
+            if manifest != sorted(published):
+                await self._write_manifest(client, manifest)
+
+        report["changed"] = bool(report["uploaded"] or report["deleted"])
+        report["url"] = self.public_url or f"{self.endpoint_url}/{self.bucket}/{self.prefix}index.html"
+        return report
+
+
+def _xml_escape(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def create_publisher(target: Dict[str, Any]) -> Publisher:
+    """
+    Publisher for a target description
+
+    Args:
+        target: {"type": "local", "path": name under PUBLISH_LOCAL_ROOT} or
+            {"type": "s3", "bucket", optional "prefix", "region",
+            "public_url", "delete_at_root"}. The S3 endpoint and credentials come from
+            S3_ENDPOINT_URL, S3_ACCESS_KEY_ID and S3_SECRET_ACCESS_KEY, never
+            from the request
+
+    Raises:
+        ValueError: If the target is incomplete or not allowed
+    """
+    kind = target.get("type")
+    if kind == "local":
+        root = Path(os.getenv("PUBLISH_LOCAL_ROOT") or get_data_dir() / "published").resolve()
+        name = str(target.get("path") or "").strip("/")
+        target_dir = (root / name).resolve()
+        if not name or root not in target_dir.parents:
+            raise ValueError(f"Local publish path must be a directory name under {root}")
+        return LocalDirectoryPublisher(target_dir, public_url=target.get("public_url"))
+
+    if kind == "s3":
+        if not target.get("bucket"):
+            raise ValueError("S3 target needs a bucket")
+        access_key_id = os.getenv("S3_ACCESS_KEY_ID")
+        secret_access_key = os.getenv("S3_SECRET_ACCESS_KEY")
+        if not access_key_id or not secret_access_key:
+            raise ValueError("S3_ACCESS_KEY_ID and S3_SECRET_ACCESS_KEY must be set to publish to S3")
+        return S3Publisher(
+            bucket=target["bucket"],
+            access_key_id=access_key_id,
+            secret_access_key=secret_access_key,
+            prefix=target.get("prefix") or "",
+            endpoint_url=os.getenv("S3_ENDPOINT_URL"),
+            region=target.get("region") or os.getenv("S3_REGION", "us-east-1"),
+            public_url=target.get("public_url"),
+            delete_at_root=bool(target.get("delete_at_root")),
+        )
+
+    raise ValueError(f"Unknown publish target type: {kind!r} (expected 'local' or 's3')")
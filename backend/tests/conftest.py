@@ -0,0 +1,6 @@
+"""Test setup for the LiquidBooks backend: its modules are flat, not a package"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
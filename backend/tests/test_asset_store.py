@@ -0,0 +1,21 @@
+"""Tests for asset_store"""
+
+import os
+
+from asset_store import private_size
+
+
+def test_private_size_leaves_out_linked_files(tmp_path):
+    store = tmp_path / "store"
+    site = tmp_path / "site"
+    store.mkdir()
+    (site / "_static").mkdir(parents=True)
+    (site / "index.html").write_bytes(b"x" * 100)
+    (store / "theme.css").write_bytes(b"y" * 1000)
+    os.link(store / "theme.css", site / "_static" / "theme.css")
+
+    assert private_size(site) == 100
+    assert private_size(store) == 0
+
+    (site / "_static" / "theme.css").unlink()
+    assert private_size(store) == 1000
@@ -0,0 +1,43 @@
+"""Tests for book_export"""
+
+import pytest
+
+from book_export import export_files
+
+
+@pytest.fixture
+def build_dir(tmp_path):
+    html = tmp_path / "_build" / "html"
+    (html / "_static").mkdir(parents=True)
+    (tmp_path / "intro.md").write_text("# Intro")
+    (tmp_path / "_build" / ".liquidbooks-sources").write_text("digest")
+    (tmp_path / ".intro.md.tmp").write_text("# In")
+    (html / "index.html").write_text("<h1>Book</h1>")
+    (html / "_static" / "theme.css").write_text("body {}")
+    (html / ".liquidbooks-optimized.json").write_text("{}")
+    (html / "_static" / ".theme.css.tmp").write_text("body")
+    (html / ".buildinfo").write_text("# Sphinx build info")
+    return tmp_path
+
+
+def arcnames(build_dir, profile):
+    return {arcname for _, arcname in export_files(build_dir, profile)}
+
+
+def test_html_only_leaves_out_internal_files(build_dir):
+    assert arcnames(build_dir, "html-only") == {".buildinfo", "index.html", "_static/theme.css"}
+
+
+def test_sources_only_leaves_out_build_output(build_dir):
+    assert arcnames(build_dir, "sources-only") == {"intro.md"}
+
+
+def test_full_leaves_out_internal_files(build_dir):
+    assert arcnames(build_dir, "full") == {
+        "intro.md", "_build/html/.buildinfo", "_build/html/index.html", "_build/html/_static/theme.css",
+    }
+
+
+def test_unknown_profile(build_dir):
+    with pytest.raises(ValueError):
+        export_files(build_dir, "everything")
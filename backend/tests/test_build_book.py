@@ -0,0 +1,63 @@
+"""Tests for POST /api/build (runs real jupyter-book builds in a temporary data directory)"""
+
+import os
+
+import pytest
+
+pytest.importorskip("jupyter_book")
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    os.environ["LIQUIDBOOKS_DATA_DIR"] = str(tmp_path_factory.mktemp("data"))
+    os.environ.setdefault("OPENAI_API_KEY", "test")
+    import main
+    from fastapi.testclient import TestClient
+
+    with TestClient(main.app) as client:
+        yield client
+
+
+def book(book_id):
+    return {
+        "id": book_id, "title": "Test Book", "author": "Author", "description": "A book",
+        "chapters": [
+            {"id": "c1", "title": "One", "content": "# One\n\nFirst chapter.", "order": 1},
+            {"id": "c2", "title": "Two", "content": "# Two\n\nSecond chapter.", "order": 2},
+        ],
+    }
+
+
+def build(client, book_id, optimize_assets):
+    response = client.post("/api/build", json={
+        "book": book(book_id), "features": ["colon_fence"], "optimize_assets": optimize_assets,
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def site_dir(result):
+    return os.path.join(result["build_dir"], "_build", "html")
+
+
+def test_unoptimized_build_after_optimized_build(client):
+    optimized = build(client, "optimize-toggle", True)
+    assert os.path.exists(os.path.join(site_dir(optimized), ".liquidbooks-optimized.json"))
+
+    plain = build(client, "optimize-toggle", False)
+
+    assert plain["build_key"] != optimized["build_key"]
+    assert not os.path.exists(os.path.join(site_dir(plain), ".liquidbooks-optimized.json"))
+    with open(os.path.join(site_dir(plain), "intro.html")) as f:
+        assert "_static/styles/theme.css" in f.read()
+
+
+def test_optimized_build_after_unoptimized_build(client):
+    plain = build(client, "optimize-upgrade", False)
+
+    optimized = build(client, "optimize-upgrade", True)
+
+    assert optimized["build_key"] != plain["build_key"]
+    assert os.path.exists(os.path.join(site_dir(optimized), ".liquidbooks-optimized.json"))
+    with open(os.path.join(site_dir(optimized), "intro.html")) as f:
+        assert "_static/styles/theme.css" not in f.read()
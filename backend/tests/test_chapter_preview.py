@@ -0,0 +1,37 @@
+"""Tests for chapter_preview"""
+
+import pytest
+
+from chapter_preview import render_preview
+
+
+SECRET = "liquidbooks-preview-secret"
+
+
+@pytest.fixture
+def secret_file(tmp_path):
+    path = tmp_path / "secret.txt"
+    path.write_text(f"{SECRET}\n")
+    return path
+
+
+@pytest.mark.parametrize("template", [
+    "```{{include}} {path}\n```",
+    ":::{{include}} {path}\n:::",
+    "```{{raw}} html\n:file: {path}\n```",
+    "```{{csv-table}}\n:file: {path}\n```",
+])
+def test_preview_does_not_read_server_files(secret_file, template):
+    result = render_preview(template.format(path=secret_file), ["colon_fence"])
+    assert SECRET not in result["html"]
+    assert result["warnings"]
+
+
+def test_preview_does_not_pass_raw_html():
+    result = render_preview("```{raw} html\n<script>alert(1)</script>\n```")
+    assert "<script>" not in result["html"]
+
+
+def test_preview_renders_markdown():
+    result = render_preview("# Title\n\nSome *text*.")
+    assert "<em>text</em>" in result["html"]
@@ -0,0 +1,108 @@
+"""Tests for context_packing"""
+
+import json
+
+from context_packing import SUMMARY_MARKER, ContextSection, fit_text, pack_sections, split_myst_blocks
+from prompt_builder import estimate_tokens
+
+
+def paragraphs(count, words=40, word="gradient"):
+    return "\n\n".join(f"Paragraph {i} talks about {word} descent. " + " ".join([word] * words) + "." for i in range(count))
+
+
+def test_split_keeps_fences_and_directives_whole():
+    content = (
+        "# Title\n\n"
+        "Intro paragraph.\n\n"
+        "```python\nx = 1\n\ny = 2\n```\n\n"
+        ":::{note}\nFirst line.\n\nSecond line.\n:::\n\n"
+        "Closing paragraph."
+    )
+
+    assert split_myst_blocks(content) == [
+        "# Title",
+        "Intro paragraph.",
+        "```python\nx = 1\n\ny = 2\n```",
+        ":::{note}\nFirst line.\n\nSecond line.\n:::",
+        "Closing paragraph.",
+    ]
+
+
+def test_split_keeps_nested_fences_inside_longer_fence():
+    content = "````{tab-set}\n```{tab-item} A\nText\n```\n\nMore\n````\n\nAfter."
+
+    assert split_myst_blocks(content) == [
+        "````{tab-set}\n```{tab-item} A\nText\n```\n\nMore\n````",
+        "After.",
+    ]
+
+
+def test_fit_text_returns_text_that_fits_unchanged():
+    text = paragraphs(2, words=5)
+    assert fit_text(text, 1000) == text
+
+
+def test_fit_text_respects_budget():
+    text = paragraphs(30)
+
+    for budget in (50, 120, 400):
+        result = fit_text(text, budget)
+        assert estimate_tokens(result) <= budget
+        assert result.startswith("Paragraph 0")
+
+
+def test_fit_text_summarizes_overflow():
+    result = fit_text(paragraphs(30), 400)
+    assert SUMMARY_MARKER in result
+    assert SUMMARY_MARKER not in fit_text(paragraphs(30), 400, summarize=False)
+
+
+def test_fit_text_never_cuts_json():
+    data = json.dumps({"chapters": [{"title": f"Chapter {i}", "summary": "word " * 30} for i in range(20)]})
+
+    assert fit_text(data, estimate_tokens(data)) == data
+    assert fit_text(data, estimate_tokens(data) // 2) == ""
+
+
+def test_fit_text_closes_truncated_fence():
+    code = "```python\n" + "\n".join(f"value_{i} = {i}" for i in range(200)) + "\n```"
+
+    result = fit_text(code, 60, summarize=False)
+
+    assert result.startswith("```python\nvalue_0 = 0")
+    assert result.endswith("\n```")
+    assert estimate_tokens(result) <= 60
+
+
+def test_fit_text_drops_fence_that_cannot_be_closed():
+    code = "```{code-cell} python\n" + "x = 'a long line that does not fit in the budget at all' * 3\n" * 20 + "```"
+
+    assert fit_text(code, 8, summarize=False) == ""
+
+
+def test_pack_sections_fills_by_priority():
+    sections = [
+        ContextSection("background", paragraphs(20, word="history"), priority=0),
+        ContextSection("outline", paragraphs(20, word="outline"), priority=2),
+        ContextSection("notes", paragraphs(20, word="notes"), priority=1),
+    ]
+
+    packed = pack_sections(sections, 300)
+
+    assert list(packed) == ["background", "outline", "notes"]
+    # The highest priority section takes what it needs first; lower ones get what is left
+    assert estimate_tokens(packed["outline"]) > estimate_tokens(packed["notes"])
+    assert packed["background"] == ""
+    assert sum(estimate_tokens(text) for text in packed.values()) <= 300
+
+
+def test_pack_sections_respects_max_tokens_and_skips_empty():
+    packed = pack_sections([
+        ContextSection("capped", paragraphs(20), priority=1, max_tokens=60),
+        ContextSection("empty", "", priority=2),
+        ContextSection("rest", paragraphs(3, words=5), priority=0),
+    ], 500)
+
+    assert estimate_tokens(packed["capped"]) <= 60
+    assert packed["empty"] == ""
+    assert packed["rest"] == paragraphs(3, words=5)
@@ -0,0 +1,51 @@
+"""Tests for deploy_queue and the build directories it keeps"""
+
+import asyncio
+import threading
+
+from asset_store import AssetStore
+from build_cache import BuildCache
+from deploy_queue import DeployQueue
+
+
+def test_deploy_keeps_its_build_directory_in_use(tmp_path):
+    build_dir = tmp_path / "build"
+    build_dir.mkdir()
+    release = threading.Event()
+
+    def deploy(job):
+        release.wait(5)
+        return {"success": True, "url": "https://example.com"}
+
+    async def scenario():
+        queue = DeployQueue()
+        job = queue.submit("key", "owner/repo", deploy, artifact_dir=build_dir)
+        assert queue.in_use(build_dir)
+        assert queue.in_use(tmp_path / "." / "build")
+        assert not queue.in_use(tmp_path / "other")
+        await asyncio.sleep(0.05)
+        assert job.status == "running" and queue.in_use(build_dir)
+        release.set()
+        while not job.finished:
+            await asyncio.sleep(0.01)
+        assert job.status == "succeeded"
+        assert not queue.in_use(build_dir)
+
+    asyncio.run(scenario())
+
+
+def test_build_cache_eviction_keeps_entries_in_use(tmp_path, monkeypatch):
+    monkeypatch.setattr("build_cache.get_asset_store", lambda: AssetStore(tmp_path / "store"))
+    cache = BuildCache(tmp_path / "cache", max_bytes=100)
+    for key in ("a" * 64, "b" * 64):
+        book_dir = tmp_path / key[:1]
+        (book_dir / "_build" / "html").mkdir(parents=True)
+        (book_dir / "_build" / "html" / "index.html").write_bytes(b"x" * 80)
+        cache.put(key, book_dir, in_use=lambda path: path.name == "a" * 64)
+
+    # Both entries together exceed the cap, but the older one is being deployed
+    assert cache.get("a" * 64) is not None
+    assert cache.get("b" * 64) is not None
+
+    cache.evict()
+    assert cache.get("a" * 64) is None
@@ -0,0 +1,193 @@
+"""Tests for github_data_deploy, against an in-memory fake of GitHub's Git Data API"""
+
+import asyncio
+import base64
+import hashlib
+import json
+
+import httpx
+import pytest
+
+from github_data_deploy import deploy_pages_api
+from pages_deploy import PAGES_BRANCH, PagesDeployError, git_blob_id
+
+
+REPO_PATH = "/repos/owner/book"
+
+
+def _object_id(value) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class FakeGitHub:
+    """The Git Data API endpoints a deploy uses, backed by dicts"""
+
+    def __init__(self):
+        self.blobs = {}
+        self.trees = {}
+        self.commits = {}
+        self.refs = {}
+        self.requests = []
+        self.fail_ref_updates = 0
+
+    @property
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path[len(REPO_PATH):]
+        self.requests.append((request.method, path))
+        body = json.loads(request.content) if request.content else None
+
+        if request.method == "GET" and path.startswith("/git/ref/heads/"):
+            sha = self.refs.get(path[len("/git/ref/heads/"):])
+            if sha is None:
+                return httpx.Response(404, json={"message": "Not Found"})
+            return httpx.Response(200, json={"object": {"sha": sha}})
+        if request.method == "GET" and path.startswith("/git/commits/"):
+            commit = self.commits[path[len("/git/commits/"):]]
+            return httpx.Response(200, json={"tree": {"sha": commit["tree"]}})
+        if request.method == "GET" and path.startswith("/git/trees/"):
+            sha = path[len("/git/trees/"):]
+            entries = [{**entry, "type": "blob"} for entry in self.trees[sha]]
+            return httpx.Response(200, json={"sha": sha, "tree": entries, "truncated": False})
+        if request.method == "POST" and path == "/git/blobs":
+            data = base64.b64decode(body["content"])
+            sha = git_blob_id(data)
+            self.blobs[sha] = data
+            return httpx.Response(201, json={"sha": sha})
+        if request.method == "POST" and path == "/git/trees":
+            entries = []
+            for entry in body["tree"]:
+                if "content" in entry:
+                    data = entry["content"].encode("utf-8")
+                    sha = git_blob_id(data)
+                    self.blobs[sha] = data
+                else:
+                    sha = entry["sha"]
+                    if sha not in self.blobs:
+                        return httpx.Response(422, json={"message": f"Invalid tree info: {sha}"})
+                entries.append({"path": entry["path"], "mode": entry["mode"], "sha": sha})
+            sha = _object_id(entries)
+            self.trees[sha] = entries
+            return httpx.Response(201, json={"sha": sha})
+        if request.method == "POST" and path == "/git/commits":
+            sha = _object_id(body)
+            self.commits[sha] = body
+            return httpx.Response(201, json={"sha": sha})
+        if request.method == "POST" and path == "/git/refs":
+            self.refs[body["ref"][len("refs/heads/"):]] = body["sha"]
+            return httpx.Response(201, json={"ref": body["ref"]})
+        if request.method == "PATCH" and path.startswith("/git/refs/heads/"):
+            branch = path[len("/git/refs/heads/"):]
+            if self.fail_ref_updates:
+                self.fail_ref_updates -= 1
+                return httpx.Response(422, json={"message": "Update is not a fast forward"})
+            if self.refs[branch] not in self.commits[body["sha"]]["parents"]:
+                return httpx.Response(422, json={"message": "Update is not a fast forward"})
+            self.refs[branch] = body["sha"]
+            return httpx.Response(200, json={"object": {"sha": body["sha"]}})
+        return httpx.Response(404, json={"message": "Not Found"})
+
+    def files(self, branch: str = PAGES_BRANCH):
+        tree = self.trees[self.commits[self.refs[branch]]["tree"]]
+        return {entry["path"]: self.blobs[entry["sha"]] for entry in tree}
+
+    def writes(self):
+        return [request for request in self.requests if request[0] != "GET"]
+
+
+def deploy(site, github, **kwargs):
+    return asyncio.run(deploy_pages_api(site, "owner", "book", "token", transport=github.transport, **kwargs))
+
+
+@pytest.fixture
+def github():
+    return FakeGitHub()
+
+
+@pytest.fixture
+def site(tmp_path):
+    path = tmp_path / "html"
+    (path / "_static").mkdir(parents=True)
+    (path / "index.html").write_text("<h1>Book</h1>")
+    (path / "intro.html").write_text("<h1>Intro</h1>")
+    (path / "_static" / "logo.png").write_bytes(b"\x89PNG\r\n\x1a\n\0\0\0\rIHDR")
+    return path
+
+
+def test_first_deploy_creates_branch(github, site):
+    report = deploy(site, github, extra_files={".nojekyll": b""})
+
+    assert report["changed"]
+    assert report["commit"] == github.refs[PAGES_BRANCH]
+    assert report["files"] == {"added": 4, "updated": 0, "removed": 0, "unchanged": 0}
+    assert report["uploaded_blobs"] == 4
+    assert github.files() == {
+        ".nojekyll": b"",
+        "index.html": b"<h1>Book</h1>",
+        "intro.html": b"<h1>Intro</h1>",
+        "_static/logo.png": (site / "_static" / "logo.png").read_bytes(),
+    }
+    # Text files go inline in the tree; only the binary one is uploaded on its own
+    assert github.writes().count(("POST", "/git/blobs")) == 1
+    assert ("POST", "/git/refs") in github.writes()
+
+
+def test_unchanged_deploy_writes_nothing(github, site):
+    first = deploy(site, github)
+    github.requests.clear()
+
+    second = deploy(site, github)
+
+    assert not second["changed"]
+    assert second["commit"] == first["commit"]
+    assert second["files"] == {"added": 0, "updated": 0, "removed": 0, "unchanged": 3}
+    assert second["uploaded_blobs"] == 0
+    assert github.writes() == []
+
+
+def test_deploy_updates_and_removes_files(github, site):
+    first = deploy(site, github)
+    (site / "index.html").write_text("<h1>Book, second edition</h1>")
+    (site / "intro.html").unlink()
+    (site / "preface.html").write_text("<h1>Preface</h1>")
+    github.requests.clear()
+
+    report = deploy(site, github)
+
+    assert report["changed"]
+    assert report["files"] == {"added": 1, "updated": 1, "removed": 1, "unchanged": 1}
+    assert report["uploaded_blobs"] == 2
+    assert report["skipped_blobs"] == 1
+    assert github.commits[report["commit"]]["parents"] == [first["commit"]]
+    assert set(github.files()) == {"index.html", "preface.html", "_static/logo.png"}
+    assert github.files()["index.html"] == b"<h1>Book, second edition</h1>"
+    assert ("POST", "/git/blobs") not in github.writes()
+    assert ("PATCH", f"/git/refs/heads/{PAGES_BRANCH}") in github.writes()
+
+
+def test_rejected_ref_update_is_retryable(github, site):
+    first = deploy(site, github)
+    (site / "index.html").write_text("<h1>Book, second edition</h1>")
+    github.fail_ref_updates = 1
+
+    with pytest.raises(PagesDeployError) as error:
+        deploy(site, github)
+    assert error.value.transient
+    assert github.refs[PAGES_BRANCH] == first["commit"]
+
+    report = deploy(site, github)
+    assert report["changed"]
+    assert report["files"]["updated"] == 1
+    assert github.refs[PAGES_BRANCH] == report["commit"]
+    assert github.files()["index.html"] == b"<h1>Book, second edition</h1>"
+
+
+def test_internal_files_are_not_published(github, site):
+    (site / ".liquidbooks-optimized.json").write_text("{}")
+    (site / ".index.html.tmp").write_text("<h1>")
+
+    deploy(site, github)
+
+    assert set(github.files()) == {"index.html", "intro.html", "_static/logo.png"}
@@ -0,0 +1,31 @@
+"""Tests for output_formats"""
+
+import os
+
+from output_formats import FormatCache
+
+
+def built_file(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(b"x" * size)
+    return path
+
+
+def test_put_keeps_the_file_just_stored(tmp_path):
+    cache = FormatCache(tmp_path / "formats", max_bytes=100)
+
+    path = cache.put("a" * 64, "pdf", built_file(tmp_path, "book.pdf", 150))
+
+    assert path.stat().st_size == 150
+    assert cache.get("a" * 64, "pdf") == path
+
+
+def test_put_evicts_least_recently_used(tmp_path):
+    cache = FormatCache(tmp_path / "formats", max_bytes=100)
+    old = cache.put("a" * 64, "pdf", built_file(tmp_path, "old.pdf", 60))
+    os.utime(old, (1, old.stat().st_mtime))
+
+    new = cache.put("b" * 64, "pdf", built_file(tmp_path, "new.pdf", 60))
+
+    assert not old.exists()
+    assert new.exists()
@@ -0,0 +1,84 @@
+"""Tests for pages_deploy, against a local bare repository standing in for GitHub"""
+
+import shutil
+import subprocess
+
+import pytest
+
+from pages_deploy import PAGES_BRANCH, deploy_pages
+
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+
+
+def remote_files(remote):
+    output = subprocess.run(
+        ["git", "ls-tree", "-r", "--name-only", PAGES_BRANCH],
+        cwd=remote, capture_output=True, text=True, check=True,
+    ).stdout
+    return set(output.split())
+
+
+def remote_file(remote, path):
+    return subprocess.run(
+        ["git", "show", f"{PAGES_BRANCH}:{path}"],
+        cwd=remote, capture_output=True, text=True, check=True,
+    ).stdout
+
+
+@pytest.fixture
+def remote(tmp_path):
+    path = tmp_path / "remote.git"
+    subprocess.run(["git", "init", "--quiet", "--bare", str(path)], check=True)
+    return path
+
+
+@pytest.fixture
+def site(tmp_path):
+    path = tmp_path / "html"
+    (path / "_static").mkdir(parents=True)
+    (path / "index.html").write_text("<h1>Book</h1>")
+    (path / "intro.html").write_text("<h1>Intro</h1>")
+    (path / "_static" / "style.css").write_text("body {}")
+    return path
+
+
+def test_first_deploy_creates_branch(remote, site):
+    result = deploy_pages(site, str(remote), extra_files={".nojekyll": b""})
+
+    assert result["changed"]
+    assert result["files"] == {"added": 4, "updated": 0, "removed": 0, "unchanged": 0}
+    assert remote_files(remote) == {".nojekyll", "index.html", "intro.html", "_static/style.css"}
+
+
+def test_unchanged_deploy_pushes_nothing(remote, site):
+    first = deploy_pages(site, str(remote))
+    second = deploy_pages(site, str(remote))
+
+    assert not second["changed"]
+    assert second["commit"] == first["commit"]
+    assert second["files"] == {"added": 0, "updated": 0, "removed": 0, "unchanged": 3}
+
+
+def test_deploy_updates_and_removes_files(remote, site):
+    deploy_pages(site, str(remote))
+    (site / "index.html").write_text("<h1>Book, second edition</h1>")
+    (site / "intro.html").unlink()
+    (site / "preface.html").write_text("<h1>Preface</h1>")
+
+    result = deploy_pages(site, str(remote))
+
+    assert result["changed"]
+    assert result["files"] == {"added": 1, "updated": 1, "removed": 1, "unchanged": 1}
+    assert remote_files(remote) == {"index.html", "preface.html", "_static/style.css"}
+    assert remote_file(remote, "index.html") == "<h1>Book, second edition</h1>"
+
+
+def test_internal_and_temporary_files_are_not_published(remote, site):
+    (site / ".liquidbooks-optimized.json").write_text("{}")
+    (site / "_static" / ".style.css.tmp").write_text("body")
+    (site / ".buildinfo").write_text("# Sphinx build info")
+
+    deploy_pages(site, str(remote))
+
+    assert remote_files(remote) == {".buildinfo", "index.html", "intro.html", "_static/style.css"}
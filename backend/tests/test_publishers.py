@@ -0,0 +1,155 @@
+"""Tests for publishers, with an in-memory stand-in for an S3-compatible store"""
+
+import asyncio
+import hashlib
+import xml.etree.ElementTree as ElementTree
+from urllib.parse import unquote
+
+import httpx
+import pytest
+
+from publishers import PUBLISH_MANIFEST, LocalDirectoryPublisher, S3Publisher
+
+
+BUCKET = "books"
+S3_XML = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+class FakeS3:
+    """The bucket operations S3Publisher uses (path-style, single-part uploads), backed by a dict"""
+
+    def __init__(self):
+        self.objects = {}
+        self.requests = []
+
+    @property
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        assert request.headers["authorization"].startswith("AWS4-HMAC-SHA256 ")
+        path = unquote(request.url.path)
+        assert path == f"/{BUCKET}" or path.startswith(f"/{BUCKET}/")
+        key = path[len(BUCKET) + 2:]
+        params = request.url.params
+        self.requests.append((request.method, key))
+
+        if request.method == "GET" and not key:
+            prefix = params.get("prefix", "")
+            contents = "".join(
+                f"<Contents><Key>{name}</Key><ETag>\"{hashlib.md5(data).hexdigest()}\"</ETag></Contents>"
+                for name, data in sorted(self.objects.items()) if name.startswith(prefix)
+            )
+            return httpx.Response(200, text=(
+                f'<ListBucketResult xmlns="{S3_XML}"><IsTruncated>false</IsTruncated>{contents}</ListBucketResult>'
+            ))
+        if request.method == "GET":
+            if key not in self.objects:
+                return httpx.Response(404, text="<Error><Code>NoSuchKey</Code></Error>")
+            return httpx.Response(200, content=self.objects[key])
+        if request.method == "PUT":
+            self.objects[key] = request.content
+            return httpx.Response(200, headers={"ETag": f"\"{hashlib.md5(request.content).hexdigest()}\""})
+        if request.method == "POST" and "delete" in params:
+            for item in ElementTree.fromstring(request.content).iter("Key"):
+                self.objects.pop(item.text, None)
+            return httpx.Response(200, text=f'<DeleteResult xmlns="{S3_XML}"/>')
+        return httpx.Response(501, text="<Error><Code>NotImplemented</Code></Error>")
+
+    def writes(self):
+        return [request for request in self.requests if request[0] != "GET"]
+
+
+def publish(publisher, site):
+    return asyncio.run(publisher.publish(site))
+
+
+def s3_publisher(s3, **kwargs):
+    return S3Publisher(
+        BUCKET, "access", "secret", endpoint_url="http://minio.test:9000", transport=s3.transport, **kwargs,
+    )
+
+
+@pytest.fixture
+def s3():
+    return FakeS3()
+
+
+@pytest.fixture
+def site(tmp_path):
+    path = tmp_path / "html"
+    (path / "_static").mkdir(parents=True)
+    (path / "index.html").write_text("<h1>Book</h1>")
+    (path / "intro.html").write_text("<h1>Intro</h1>")
+    (path / "_static" / "style.css").write_text("body {}")
+    (path / ".liquidbooks-optimized.json").write_text("{}")
+    return path
+
+
+def test_s3_publish_uploads_site_and_manifest(s3, site):
+    report = publish(s3_publisher(s3, prefix="my-book"), site)
+
+    assert report["changed"]
+    assert report["uploaded"] == 3
+    assert set(s3.objects) == {
+        "my-book/index.html", "my-book/intro.html", "my-book/_static/style.css", f"my-book/{PUBLISH_MANIFEST}",
+    }
+
+
+def test_s3_unchanged_publish_writes_nothing(s3, site):
+    publisher = s3_publisher(s3, prefix="my-book")
+    publish(publisher, site)
+    s3.requests.clear()
+
+    report = publish(publisher, site)
+
+    assert not report["changed"]
+    assert report["skipped"] == 3
+    assert s3.writes() == []
+
+
+def test_s3_publish_removes_only_files_it_published(s3, site):
+    s3.objects["my-book/notes.txt"] = b"uploaded by someone else"
+    s3.objects["other-book/index.html"] = b"<h1>Other</h1>"
+    publisher = s3_publisher(s3, prefix="my-book")
+    publish(publisher, site)
+    (site / "intro.html").unlink()
+
+    report = publish(publisher, site)
+
+    assert report["deleted"] == 1
+    assert "my-book/intro.html" not in s3.objects
+    assert s3.objects["my-book/notes.txt"] == b"uploaded by someone else"
+    assert s3.objects["other-book/index.html"] == b"<h1>Other</h1>"
+
+
+def test_s3_publish_without_prefix_deletes_nothing_unless_asked(s3, site):
+    s3.objects["backups/db.sql"] = b"unrelated data"
+    publish(s3_publisher(s3), site)
+    (site / "intro.html").unlink()
+
+    report = publish(s3_publisher(s3), site)
+
+    assert report["deleted"] == 0
+    assert "intro.html" in s3.objects
+
+    report = publish(s3_publisher(s3, delete_at_root=True), site)
+
+    assert report["deleted"] == 1
+    assert set(s3.objects) == {"index.html", "_static/style.css", PUBLISH_MANIFEST, "backups/db.sql"}
+
+
+def test_local_publish_removes_only_files_it_published(tmp_path, site):
+    target = tmp_path / "published"
+    target.mkdir()
+    (target / "notes.txt").write_text("not ours")
+    publisher = LocalDirectoryPublisher(target)
+    publish(publisher, site)
+    (site / "intro.html").unlink()
+
+    report = publish(publisher, site)
+
+    assert report["deleted"] == 1
+    assert not (target / "intro.html").exists()
+    assert (target / "notes.txt").read_text() == "not ours"
+    assert not (target / ".liquidbooks-optimized.json").exists()
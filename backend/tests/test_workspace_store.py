@@ -0,0 +1,111 @@
+"""Tests for workspace_store"""
+
+import pytest
+
+from workspace_store import VersionConflictError, WorkspaceNotFoundError, WorkspaceStore, apply_text_ops
+
+
+@pytest.fixture
+def store(tmp_path):
+    return WorkspaceStore(tmp_path / "workspaces.db")
+
+
+@pytest.fixture
+def workspace(store):
+    return store.create_workspace("Test")
+
+
+def test_unchanged_item_keeps_its_version(store, workspace):
+    first = store.put_item(workspace, "chapter", "c1", {"title": "One", "content": "Text"})
+    second = store.put_item(workspace, "chapter", "c1", {"content": "Text", "title": "One"})
+
+    assert first["version"] == second["version"] == 1
+    assert not second["changed"]
+    assert store.put_item(workspace, "chapter", "c1", {"title": "One", "content": "New"})["version"] == 2
+
+
+def test_expected_version_conflict(store, workspace):
+    store.put_item(workspace, "chapter", "c1", {"content": "Text"})
+
+    with pytest.raises(VersionConflictError) as error:
+        store.put_item(workspace, "chapter", "c1", {"content": "Other"}, expected_version=0)
+    assert error.value.current_version == 1
+    assert store.get_item(workspace, "chapter", "c1")["value"] == {"content": "Text"}
+
+
+def test_put_book_reports_changes_and_prunes_chapters(store, workspace):
+    book = {"title": "Book", "chapters": [{"id": "a", "content": "A"}, {"id": "b", "content": "B"}]}
+    store.put_book(workspace, book)
+
+    result = store.put_book(workspace, {"title": "Book", "chapters": [{"id": "a", "content": "A2"}]})
+
+    assert result == {"changed": ["a"], "unchanged": [], "removed": ["b"]}
+    assert store.load_book(workspace) == {"title": "Book", "chapters": [{"id": "a", "content": "A2"}]}
+
+
+def test_unknown_workspace_and_kind(store, workspace):
+    with pytest.raises(WorkspaceNotFoundError):
+        store.get_item("missing", "chapter", "c1")
+    with pytest.raises(ValueError):
+        store.put_item(workspace, "unknown", "c1", {})
+
+
+def test_apply_text_ops_uses_original_offsets():
+    text = "The quick brown fox"
+    ops = [
+        {"offset": 16, "delete": 3, "insert": "cat"},
+        {"offset": 4, "delete": 6, "insert": ""},
+        {"offset": 0, "delete": 0, "insert": ">> "},
+    ]
+
+    assert apply_text_ops(text, ops) == ">> The brown cat"
+
+
+@pytest.mark.parametrize("ops", [
+    [{"offset": -1, "delete": 0, "insert": "x"}],
+    [{"offset": 2, "delete": -1}],
+    [{"offset": 4, "delete": 2}],
+    [{"offset": 6, "insert": "x"}],
+])
+def test_apply_text_ops_rejects_out_of_range(ops):
+    with pytest.raises(ValueError, match="out of range"):
+        apply_text_ops("Hello", ops)
+
+
+def test_apply_text_ops_rejects_overlap():
+    with pytest.raises(ValueError, match="Overlapping"):
+        apply_text_ops("Hello world", [{"offset": 0, "delete": 5, "insert": "Hi"}, {"offset": 4, "delete": 3}])
+
+
+def test_patch_text(store, workspace):
+    store.put_item(workspace, "chapter", "c1", {"title": "One", "content": "Hello world"})
+
+    result = store.patch_text(
+        workspace, "chapter", "c1", [{"offset": 6, "delete": 5, "insert": "there"}], base_version=1,
+        updates={"title": "Uno"},
+    )
+
+    assert result["version"] == 2
+    assert result["length"] == len("Hello there")
+    assert store.get_item(workspace, "chapter", "c1")["value"] == {"title": "Uno", "content": "Hello there"}
+
+
+def test_patch_text_version_conflict(store, workspace):
+    store.put_item(workspace, "chapter", "c1", {"content": "Hello world"})
+    store.patch_text(workspace, "chapter", "c1", [{"offset": 0, "delete": 5, "insert": "Howdy"}], base_version=1)
+
+    # A second editor patching the same base version loses
+    with pytest.raises(VersionConflictError) as error:
+        store.patch_text(workspace, "chapter", "c1", [{"offset": 0, "delete": 5, "insert": "Hi"}], base_version=1)
+    assert error.value.current_version == 2
+    assert store.get_item(workspace, "chapter", "c1")["value"]["content"] == "Howdy world"
+
+
+def test_patch_text_invalid_ops_change_nothing(store, workspace):
+    store.put_item(workspace, "chapter", "c1", {"content": "Hello"})
+
+    with pytest.raises(ValueError):
+        store.patch_text(workspace, "chapter", "c1", [{"offset": 9, "delete": 1}], base_version=1)
+    with pytest.raises(KeyError):
+        store.patch_text(workspace, "chapter", "missing", [], base_version=1)
+    assert store.get_item(workspace, "chapter", "c1")["version"] == 1
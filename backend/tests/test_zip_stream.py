@@ -0,0 +1,72 @@
+"""Tests for zip_stream"""
+
+import asyncio
+import io
+import os
+import time
+import zipfile
+
+import pytest
+
+from zip_stream import list_files, stream_zip
+
+
+@pytest.fixture
+def site(tmp_path):
+    path = tmp_path / "html"
+    (path / "_static").mkdir(parents=True)
+    (path / "index.html").write_text("<h1>Book</h1>" * 100)
+    (path / "_static" / "logo.png").write_bytes(b"\x89PNG" + os.urandom(2000))
+    (path / "_static" / "data.bin").write_bytes(os.urandom(512 * 1024))
+    return path
+
+
+def collect(files, **kwargs):
+    async def read():
+        return b"".join([chunk async for chunk in stream_zip(files, **kwargs)])
+
+    return asyncio.run(read())
+
+
+def test_list_files_is_sorted_with_posix_names(site):
+    assert [arcname for _, arcname in list_files(site)] == ["index.html", "_static/data.bin", "_static/logo.png"]
+
+
+def test_stream_zip_round_trip(site, tmp_path):
+    saved = tmp_path / "book.zip"
+
+    data = collect(list_files(site), save_to=saved)
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        for path, arcname in list_files(site):
+            assert archive.read(arcname) == path.read_bytes()
+        # Already compressed formats are stored, the rest deflated
+        assert archive.getinfo("_static/logo.png").compress_type == zipfile.ZIP_STORED
+        assert archive.getinfo("index.html").compress_type == zipfile.ZIP_DEFLATED
+    assert saved.read_bytes() == data
+
+
+def test_stream_zip_error_reaches_the_reader(site):
+    files = list_files(site) + [(site / "missing.html", "missing.html")]
+
+    with pytest.raises(FileNotFoundError):
+        collect(files)
+
+
+def test_cancelled_stream_leaves_no_archive(site, tmp_path):
+    saved = tmp_path / "book.zip"
+
+    async def read_one_chunk():
+        stream = stream_zip(list_files(site), save_to=saved)
+        await stream.__anext__()
+        await stream.aclose()
+
+    asyncio.run(read_one_chunk())
+
+    # The compressing thread notices the cancellation and removes its partial file
+    deadline = time.monotonic() + 5
+    while any(tmp_path.glob(".book.zip.*.tmp")) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not saved.exists()
+    assert not any(tmp_path.glob(".book.zip.*.tmp"))
@@ -0,0 +1,514 @@
+"""
+Workspace Store for LiquidBooks
+
+Persistent server-side store for books, chapters, avatars and brand assets.
+Clients upload a book or research context once, then refer to it by
+workspace id and send only the items that changed.
+
+Items live in SQLite and point at content-addressed blobs (sha256 of the
+JSON-encoded value, stored zlib-compressed), so identical chapters or avatars
+are stored once and an unchanged item never bumps its version.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+
+ITEM_KINDS = ("book", "chapter", "avatar", "brand", "diary", "offer", "landing_page", "research")
+
+# Request fields that can be resolved from a workspace: field -> (kind, key).
+# A key of None means "every item of that kind".
+CONTEXT_FIELDS = {
+    "problem_aware_avatar": ("avatar", "problem_aware"),
+    "avatar_profile": ("avatar", "problem_aware"),
+    "brand_identity": ("brand", "identity"),
+    "offer_context": ("offer", "context"),
+    "landing_page_spec": ("landing_page", "spec"),
+    "diary_entries": ("diary", None),
+}
+
+
+class WorkspaceNotFoundError(KeyError):
+    """Raised when a workspace id does not exist"""
+
+
+class VersionConflictError(Exception):
+    """Raised when an optimistic version check fails"""
+
+    def __init__(self, current_version: int, current_hash: Optional[str]):
+        super().__init__(f"Version conflict: current version is {current_version}")
+        self.current_version = current_version
+        self.current_hash = current_hash
+
+
+def get_data_dir() -> Path:
+    """Root directory for LiquidBooks server-side data"""
+    data_dir = Path(os.getenv("LIQUIDBOOKS_DATA_DIR", str(Path.home() / ".liquidbooks")))
+    data_dir.mkdir(parents=True, exist_ok=True)
+    return data_dir
+
+
+def content_hash(data: bytes) -> str:
+    """Content address of a blob"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def encode_value(value: Any) -> bytes:
+    """Canonical JSON encoding used for hashing and storage"""
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def chapter_key(chapter: Dict[str, Any], index: int) -> str:
+    """Stable key for a chapter dict (its id, else its number/position)"""
+    for field in ("id", "chapter_number", "order"):
+        if chapter.get(field) is not None:
+            return str(chapter[field])
+    return str(index)
+
+
+def apply_text_ops(text: str, ops: List[Dict[str, Any]]) -> str:
+    """
+    Apply splice operations to text
+
+    Each op is {'offset': int, 'delete': int, 'insert': str}. Offsets are
+    character positions in the original text, and ops must not overlap, so a
+    client can compute them all from one diff against the base version.
+
+    Raises:
+        ValueError: If an op is out of range or ops overlap
+    """
+    spans = []
+    for op in ops:
+        offset = int(op.get('offset', 0))
+        delete = int(op.get('delete', 0))
+        insert = op.get('insert', '') or ''
+        if offset < 0 or delete < 0 or offset + delete > len(text):
+            raise ValueError(f"Patch op out of range: offset={offset} delete={delete} length={len(text)}")
+        spans.append((offset, delete, insert))
+
+    spans.sort(key=lambda span: span[0])
+    for (offset, delete, _), (next_offset, _, _) in zip(spans, spans[1:]):
+        if offset + delete > next_offset:
+            raise ValueError(f"Overlapping patch ops at offset {next_offset}")
+
+    parts = []
+    position = 0
+    for offset, delete, insert in spans:
+        parts.append(text[position:offset])
+        parts.append(insert)
+        position = offset + delete
+    parts.append(text[position:])
+    return "".join(parts)
+
+
+class WorkspaceStore:
+    """SQLite-backed workspace store with content-addressed blobs"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    hash TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    data BLOB NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS workspaces (
+                    id TEXT PRIMARY KEY,
+                    name TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS items (
+                    workspace_id TEXT NOT NULL REFERENCES workspaces(id) ON DELETE CASCADE,
+                    kind TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    blob_hash TEXT NOT NULL REFERENCES blobs(hash),
+                    version INTEGER NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (workspace_id, kind, key)
+                );
+            """)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Connection for one operation: committed (or rolled back) and closed afterwards"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.row_factory = sqlite3.Row
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # ── Blobs ────────────────────────────────────────────────────────────
+
+    def _put_blob(self, conn: sqlite3.Connection, data: bytes) -> str:
+        blob_hash = content_hash(data)
+        conn.execute(
+            "INSERT OR IGNORE INTO blobs (hash, size, data) VALUES (?, ?, ?)",
+            (blob_hash, len(data), zlib.compress(data)),
+        )
+        return blob_hash
+
+    def get_blob(self, blob_hash: str) -> bytes:
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM blobs WHERE hash = ?", (blob_hash,)).fetchone()
+        if row is None:
+            raise KeyError(blob_hash)
+        return zlib.decompress(row["data"])
+
+    def gc_blobs(self) -> int:
+        """Delete blobs no longer referenced by any item; returns the count removed"""
+        with self._connect() as conn:
+            cursor = conn.execute("DELETE FROM blobs WHERE hash NOT IN (SELECT blob_hash FROM items)")
+            return cursor.rowcount
+
+    # ── Workspaces ───────────────────────────────────────────────────────
+
+    def create_workspace(self, name: Optional[str] = None) -> str:
+        workspace_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO workspaces (id, name, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (workspace_id, name, now, now),
+            )
+        return workspace_id
+
+    def _require_workspace(self, conn: sqlite3.Connection, workspace_id: str):
+        row = conn.execute("SELECT id FROM workspaces WHERE id = ?", (workspace_id,)).fetchone()
+        if row is None:
+            raise WorkspaceNotFoundError(workspace_id)
+
+    def delete_workspace(self, workspace_id: str):
+        with self._connect() as conn:
+            self._require_workspace(conn, workspace_id)
+            conn.execute("DELETE FROM workspaces WHERE id = ?", (workspace_id,))
+
+    def get_manifest(self, workspace_id: str) -> Dict[str, Any]:
+        """Workspace metadata plus the hash and version of every item"""
+        with self._connect() as conn:
+            workspace = conn.execute("SELECT * FROM workspaces WHERE id = ?", (workspace_id,)).fetchone()
+            if workspace is None:
+                raise WorkspaceNotFoundError(workspace_id)
+            rows = conn.execute(
+                """SELECT items.kind, items.key, items.blob_hash, items.version, items.updated_at, blobs.size
+                   FROM items JOIN blobs ON blobs.hash = items.blob_hash
+                   WHERE items.workspace_id = ? ORDER BY items.kind, items.key""",
+                (workspace_id,),
+            ).fetchall()
+
+        return {
+            "id": workspace["id"],
+            "name": workspace["name"],
+            "created_at": workspace["created_at"],
+            "updated_at": workspace["updated_at"],
+            "items": [
+                {
+                    "kind": row["kind"],
+                    "key": row["key"],
+                    "hash": row["blob_hash"],
+                    "version": row["version"],
+                    "size": row["size"],
+                    "updated_at": row["updated_at"],
+                }
+                for row in rows
+            ],
+        }
+
+    # ── Items ────────────────────────────────────────────────────────────
+
+    def put_item(
+        self,
+        workspace_id: str,
+        kind: str,
+        key: str,
+        value: Any,
+        expected_version: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Store an item value
+
+        Args:
+            workspace_id: Workspace id
+            kind: One of ITEM_KINDS
+            key: Item key within the kind (e.g. chapter id)
+            value: JSON-compatible value
+            expected_version: If given, the write only succeeds when the
+                stored version matches (0 means "must not exist yet")
+
+        Returns:
+            Dict with 'hash', 'version' and 'changed'
+
+        Raises:
+            WorkspaceNotFoundError, VersionConflictError, ValueError
+        """
+        if kind not in ITEM_KINDS:
+            raise ValueError(f"Unknown item kind: {kind}")
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._require_workspace(conn, workspace_id)
+            return self._write_item(conn, workspace_id, kind, key, value, expected_version)
+
+    def _current_item(self, conn: sqlite3.Connection, workspace_id: str, kind: str, key: str):
+        return conn.execute(
+            "SELECT blob_hash, version FROM items WHERE workspace_id = ? AND kind = ? AND key = ?",
+            (workspace_id, kind, key),
+        ).fetchone()
+
+    def _write_item(
+        self,
+        conn: sqlite3.Connection,
+        workspace_id: str,
+        kind: str,
+        key: str,
+        value: Any,
+        expected_version: Optional[int],
+    ) -> Dict[str, Any]:
+        """Version-checked write inside an open transaction"""
+        row = self._current_item(conn, workspace_id, kind, key)
+        current_version = row["version"] if row else 0
+        current_hash = row["blob_hash"] if row else None
+
+        if expected_version is not None and expected_version != current_version:
+            raise VersionConflictError(current_version, current_hash)
+
+        data = encode_value(value)
+        blob_hash = content_hash(data)
+        if blob_hash == current_hash:
+            return {"hash": blob_hash, "version": current_version, "changed": False}
+
+        now = time.time()
+        self._put_blob(conn, data)
+        conn.execute(
+            """INSERT INTO items (workspace_id, kind, key, blob_hash, version, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT (workspace_id, kind, key)
+               DO UPDATE SET blob_hash = excluded.blob_hash, version = excluded.version,
+                             updated_at = excluded.updated_at""",
+            (workspace_id, kind, key, blob_hash, current_version + 1, now),
+        )
+        conn.execute("UPDATE workspaces SET updated_at = ? WHERE id = ?", (now, workspace_id))
+        return {"hash": blob_hash, "version": current_version + 1, "changed": True}
+
+    def patch_text(
+        self,
+        workspace_id: str,
+        kind: str,
+        key: str,
+        ops: List[Dict[str, Any]],
+        base_version: int,
+        field: str = "content",
+        updates: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Apply splice operations to a text field of a stored item
+
+        The read, version check and write happen in one transaction, so two
+        editors patching the same base version cannot both succeed.
+
+        Args:
+            workspace_id: Workspace id
+            kind: Item kind (usually 'chapter')
+            key: Item key
+            ops: Splice operations, see apply_text_ops
+            base_version: Version the ops were computed against
+            field: Name of the text field to patch
+            updates: Other fields to replace outright (e.g. a new title)
+
+        Returns:
+            Dict with 'hash', 'version', 'changed', 'content_hash' and 'length'
+
+        Raises:
+            WorkspaceNotFoundError, KeyError (no such item),
+            VersionConflictError, ValueError (invalid ops)
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._require_workspace(conn, workspace_id)
+            row = self._current_item(conn, workspace_id, kind, key)
+            if row is None:
+                raise KeyError(f"{kind}/{key}")
+            if row["version"] != base_version:
+                raise VersionConflictError(row["version"], row["blob_hash"])
+
+            blob = conn.execute("SELECT data FROM blobs WHERE hash = ?", (row["blob_hash"],)).fetchone()
+            value = json.loads(zlib.decompress(blob["data"]))
+            if not isinstance(value, dict):
+                raise ValueError(f"{kind}/{key} is not an object")
+
+            text = apply_text_ops(value.get(field) or "", ops)
+            value = {**value, **(updates or {}), field: text}
+            result = self._write_item(conn, workspace_id, kind, key, value, base_version)
+
+        return {
+            **result,
+            "content_hash": content_hash(text.encode("utf-8")),
+            "length": len(text),
+        }
+
+    def get_item(self, workspace_id: str, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        """Item value with its hash and version, or None if it does not exist"""
+        with self._connect() as conn:
+            self._require_workspace(conn, workspace_id)
+            row = conn.execute(
+                """SELECT items.blob_hash, items.version, blobs.data
+                   FROM items JOIN blobs ON blobs.hash = items.blob_hash
+                   WHERE items.workspace_id = ? AND items.kind = ? AND items.key = ?""",
+                (workspace_id, kind, key),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "value": json.loads(zlib.decompress(row["data"])),
+            "hash": row["blob_hash"],
+            "version": row["version"],
+        }
+
+    def list_items(self, workspace_id: str, kind: str) -> Dict[str, Any]:
+        """All values of one kind, keyed by item key"""
+        with self._connect() as conn:
+            self._require_workspace(conn, workspace_id)
+            rows = conn.execute(
+                """SELECT items.key, blobs.data
+                   FROM items JOIN blobs ON blobs.hash = items.blob_hash
+                   WHERE items.workspace_id = ? AND items.kind = ?""",
+                (workspace_id, kind),
+            ).fetchall()
+        return {row["key"]: json.loads(zlib.decompress(row["data"])) for row in rows}
+
+    def delete_item(self, workspace_id: str, kind: str, key: str) -> bool:
+        with self._connect() as conn:
+            self._require_workspace(conn, workspace_id)
+            cursor = conn.execute(
+                "DELETE FROM items WHERE workspace_id = ? AND kind = ? AND key = ?",
+                (workspace_id, kind, key),
+            )
+            return cursor.rowcount > 0
+
+    # ── Books ────────────────────────────────────────────────────────────
+
+    def put_book(self, workspace_id: str, book: Dict[str, Any], prune_chapters: bool = True) -> Dict[str, Any]:
+        """
+        Store a book as a metadata item plus one item per chapter
+
+        Unchanged chapters keep their version. With prune_chapters, chapters
+        missing from the book are removed from the workspace.
+
+        Returns:
+            Dict of 'changed' and 'unchanged' chapter keys, plus 'removed'
+        """
+        chapters = book.get('chapters') or []
+        meta = {key: value for key, value in book.items() if key != 'chapters'}
+        self.put_item(workspace_id, "book", "meta", meta)
+
+        changed, unchanged = [], []
+        keys = set()
+        for i, chapter in enumerate(chapters):
+            key = chapter_key(chapter, i)
+            keys.add(key)
+            result = self.put_item(workspace_id, "chapter", key, chapter)
+            (changed if result["changed"] else unchanged).append(key)
+
+        removed = []
+        if prune_chapters:
+            for key in self.list_items(workspace_id, "chapter"):
+                if key not in keys:
+                    self.delete_item(workspace_id, "chapter", key)
+                    removed.append(key)
+
+        return {"changed": changed, "unchanged": unchanged, "removed": removed}
+
+    def load_chapters(self, workspace_id: str) -> List[Dict[str, Any]]:
+        """Stored chapters in book order"""
+        chapters = list(self.list_items(workspace_id, "chapter").values())
+        return sorted(chapters, key=lambda c: (c.get('order', c.get('chapter_number', 0)) or 0))
+
+    def load_book(self, workspace_id: str) -> Optional[Dict[str, Any]]:
+        """Reassemble the stored book, or None if no book was stored"""
+        meta = self.get_item(workspace_id, "book", "meta")
+        if meta is None:
+            return None
+        return {**meta["value"], "chapters": self.load_chapters(workspace_id)}
+
+    # ── Request context ──────────────────────────────────────────────────
+
+    def put_context(self, workspace_id: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+        """Store request-style context fields (see CONTEXT_FIELDS)"""
+        results = {}
+        for field, value in fields.items():
+            if field not in CONTEXT_FIELDS or value is None:
+                continue
+            kind, key = CONTEXT_FIELDS[field]
+            if key is None:
+                results[field] = {
+                    item_key: self.put_item(workspace_id, kind, str(item_key), item_value)
+                    for item_key, item_value in value.items()
+                }
+            else:
+                results[field] = self.put_item(workspace_id, kind, key, value)
+        return results
+
+    def load_context(self, workspace_id: str, fields: Iterable[str]) -> Dict[str, Any]:
+        """
+        Resolve request fields from the workspace
+
+        Besides CONTEXT_FIELDS this understands 'chapters', 'book',
+        'book_title' and 'book_description'. Fields with nothing stored are
+        left out.
+        """
+        context: Dict[str, Any] = {}
+        fields = set(fields)
+
+        if fields & {"book", "book_title", "book_description"}:
+            meta = self.get_item(workspace_id, "book", "meta")
+            if meta is not None:
+                if "book_title" in fields:
+                    context["book_title"] = meta["value"].get("title", "")
+                if "book_description" in fields:
+                    context["book_description"] = meta["value"].get("description", "")
+                if "book" in fields:
+                    context["book"] = {**meta["value"], "chapters": self.load_chapters(workspace_id)}
+
+        if "chapters" in fields:
+            chapters = self.load_chapters(workspace_id)
+            if chapters:
+                context["chapters"] = chapters
+
+        for field in fields & set(CONTEXT_FIELDS):
+            kind, key = CONTEXT_FIELDS[field]
+            if key is None:
+                items = self.list_items(workspace_id, kind)
+                if items:
+                    context[field] = items
+            else:
+                item = self.get_item(workspace_id, kind, key)
+                if item is not None:
+                    context[field] = item["value"]
+
+        return context
+
+
+# Global instance (lazy initialization)
+_workspace_store_instance = None
+
+
+def get_workspace_store() -> WorkspaceStore:
+    """Get the global workspace store"""
+    global _workspace_store_instance
+    if _workspace_store_instance is None:
+        _workspace_store_instance = WorkspaceStore(get_data_dir() / "workspaces.db")
+    return _workspace_store_instance
@@ -0,0 +1,181 @@
+"""
+Zip Streaming for LiquidBooks
+
+Streams a directory as a zip archive while it is being compressed. A worker
+thread writes the archive with zipfile into a small bounded queue and the
+response reads chunks from it, so the event loop never compresses anything,
+the first bytes go out as soon as the first file is compressed, and memory
+stays at a few chunks however large the build is. zipfile writes to the
+unseekable queue writer with data descriptors, which every unzip tool reads.
+
+Files whose format is already compressed (images, fonts, media, archives) are
+stored rather than deflated: deflating them costs CPU and saves nothing. The
+archive can also be copied to a file while it streams, so a finished archive
+can be served again from disk.
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import threading
+import zipfile
+from pathlib import Path
+from typing import AsyncIterator, List, Optional, Tuple
+
+
+# Bytes handed to the response at a time
+CHUNK_SIZE = 64 * 1024
+
+# Chunks buffered between the compressing thread and the response
+MAX_PENDING_CHUNKS = 8
+
+# Formats that are already compressed; stored without deflating
+PRECOMPRESSED_SUFFIXES = {
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".avif", ".ico",
+    ".woff", ".woff2",
+    ".mp3", ".mp4", ".m4a", ".ogg", ".webm", ".mov",
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".br", ".zst", ".7z",
+    ".pdf", ".epub", ".docx", ".xlsx", ".pptx",
+}
+
+
+class ZipStreamCancelled(Exception):
+    """The client went away; stops the compressing thread"""
+
+
+class _QueueWriter:
+    """
+    Unseekable file object that hands full chunks to an asyncio queue
+
+    Everything written is also written to `copy` if it is set.
+    """
+
+    def __init__(self, queue: asyncio.Queue, loop: asyncio.AbstractEventLoop, cancelled: threading.Event):
+        self._queue = queue
+        self._loop = loop
+        self._cancelled = cancelled
+        self._buffer = bytearray()
+        self.copy = None
+
+    def write(self, data) -> int:
+        if self.copy is not None:
+            self.copy.write(data)
+        self._buffer += data
+        while len(self._buffer) >= CHUNK_SIZE:
+            self.put(bytes(self._buffer[:CHUNK_SIZE]))
+            del self._buffer[:CHUNK_SIZE]
+        return len(data)
+
+    def flush(self):
+        if self._buffer:
+            self.put(bytes(self._buffer))
+            self._buffer.clear()
+
+    def put(self, item):
+        """Queue an item, blocking while the queue is full (backpressure)"""
+        future = asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop)
+        while True:
+            if self._cancelled.is_set():
+                future.cancel()
+                raise ZipStreamCancelled()
+            try:
+                return future.result(timeout=0.5)
+            except concurrent.futures.TimeoutError:
+                continue
+
+
+def compress_type(path: Path) -> int:
+    """zipfile compression method for a file, by its type"""
+    return zipfile.ZIP_STORED if path.suffix.lower() in PRECOMPRESSED_SUFFIXES else zipfile.ZIP_DEFLATED
+
+
+def list_files(root: Path) -> List[Tuple[Path, str]]:
+    """Files under root in a stable order, as (path, archive name) pairs"""
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            file_path = Path(dirpath) / filename
+            files.append((file_path, file_path.relative_to(root).as_posix()))
+    return files
+
+
+def _write_zip(files: List[Tuple[Path, str]], writer: _QueueWriter, compresslevel: int):
+    with zipfile.ZipFile(writer, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as zip_file:
+        for file_path, arcname in files:
+            zip_file.write(file_path, arcname, compress_type=compress_type(file_path))
+    writer.flush()
+
+
+def _produce(
+    files: List[Tuple[Path, str]],
+    queue: asyncio.Queue,
+    loop: asyncio.AbstractEventLoop,
+    cancelled: threading.Event,
+    compresslevel: int,
+    save_to: Optional[Path],
+):
+    writer = _QueueWriter(queue, loop, cancelled)
+    partial = None
+    try:
+        if save_to is None:
+            _write_zip(files, writer, compresslevel)
+        else:
+            # Written next to the target and renamed once complete, so an
+            # interrupted download never leaves a truncated archive behind
+            partial = save_to.with_name(f".{save_to.name}.{threading.get_ident()}.tmp")
+            with open(partial, "wb") as copy:
+                writer.copy = copy
+                _write_zip(files, writer, compresslevel)
+            os.replace(partial, save_to)
+            partial = None
+        writer.put(None)
+    except ZipStreamCancelled:
+        pass
+    except Exception as e:
+        try:
+            writer.put(e)
+        except ZipStreamCancelled:
+            pass
+    finally:
+        if partial is not None:
+            try:
+                os.unlink(partial)
+            except OSError:
+                pass
+
+
+async def stream_zip(
+    files: List[Tuple[Path, str]],
+    compresslevel: int = 6,
+    save_to: Optional[Path] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Zip a list of files, yielding the archive in chunks as it is written
+
+    Args:
+        files: (path, archive name) pairs, e.g. from list_files
+        compresslevel: Deflate level 0-9
+        save_to: Also write the complete archive to this path (only once the
+            whole archive was written; nothing is left if it is cancelled)
+
+    Yields:
+        Chunks of the zip archive
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_PENDING_CHUNKS)
+    cancelled = threading.Event()
+    producer = loop.run_in_executor(None, _produce, files, queue, loop, cancelled, compresslevel, save_to)
+
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+        await producer
+    finally:
+        # Client disconnected or the archive failed: stop the thread
+        cancelled.set()
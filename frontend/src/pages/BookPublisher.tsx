@@ -189,6 +189,24 @@ export default function BookPublisher() {
       }
 
       if (data.success) {
+        // The deploy runs in the background after the build; wait for it to finish
+        if (data.deploy_id) {
+          console.log(`[GitHub Deploy] Deploy ${data.deploy_id} queued, waiting for it to finish...`);
+          let deploy = null;
+          while (!deploy || !['succeeded', 'failed'].includes(deploy.status)) {
+            await new Promise(resolve => setTimeout(resolve, 2000));
+            const statusResponse = await fetch(`${API_BASE_URL}/api/deploy/${data.deploy_id}`);
+            if (!statusResponse.ok) {
+              throw new Error('Lost track of the GitHub deployment');
+            }
+            deploy = await statusResponse.json();
+          }
+          if (deploy.status === 'failed') {
+            throw new Error(deploy.error || 'GitHub deployment failed');
+          }
+          data.url = deploy.url;
+        }
+
         // Check if URL is a GitHub Pages URL (deployment successful)
         if (data.url && data.url.includes('github.io')) {
           setDeployUrl(data.url);